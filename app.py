@@ -1,377 +1,636 @@
 import os
+import json
+import logging
 import tempfile
 import shutil
-from flask import Flask, render_template, request, send_file, jsonify, after_this_request
+from flask import Flask, render_template, request, send_file, jsonify, after_this_request, redirect
 import yt_dlp
 import threading
 import time
+import copy
+import functools
+import uuid
 import requests
 from bs4 import BeautifulSoup
 import re
+from collections import deque
+from cache import LRUCache, StaleWhileRevalidateCache
+from catalog import BeatCatalog
+from audio import (DEFAULT_FORMATS, OUTPUT_CODECS, add_multi_encode, apply_normalization, is_fragmented,
+                   loudnorm_filter, mime_type, normalization_filter, parse_formats_option, parse_normalize_option,
+                   select_source_format, split_format)
+from ratelimit import ClientQuota, UpstreamThrottled, get_limiter
+from diskquota import InsufficientStorage, StorageAccountant, estimate_job_bytes
+from downloadtuning import get_profile as get_download_profile
+from longinput import PipelineError, download_command, encode_command, run_pipeline, wants_long_input, write_info
+from fingerprint import FingerprintIndex, fingerprint_available, fingerprint_url
+from scheduler import FairScheduler, SchedulerBusy, job_cost
+from cancellation import CancellationRegistry, JobCancelled
+from logconfig import job_context, setup_logging
+from pagescan import (beatstars_page_ready, read_page, spotify_collection_ready, spotify_embed_ready,
+                      spotify_page_ready)
+from journal import JobJournal, claim_folder, release_folder
+from storage import open_artifact_store, open_job_store
+from ranking import GENERIC_PRODUCERS, pick_beat, pick_non_tutorial, pick_track
+from resolvers import (Resolution, ResolveError, Resolver, canonical_beatstars, canonical_soundcloud, canonical_spotify,
+                       canonical_youtube, canonical_youtube_music, find_resolver, get_resolver, host_pattern, register)
+from tagging import download_name, fetch_cover, pick_thumbnail, track_tags, write_tags
 
 app = Flask(__name__)
 
-# Configure upload folder for temporary files
-TEMP_FOLDER = tempfile.mkdtemp()
+# Logging is configured by the entry points (python app.py, asgi.py), not on import
+logger = logging.getLogger(__name__)
+
+# Configure scratch folder for downloads and encodes in progress. It is stable
+# across restarts so interrupted jobs can resume; a second process on the same
+# machine falls back to a private scratch folder, whose jobs are not resumed
+WORK_FOLDER = os.environ.get('WORK_FOLDER') or os.path.join(tempfile.gettempdir(), 'youtubetomp3')
+work_lock = claim_folder(WORK_FOLDER)
+TEMP_FOLDER = WORK_FOLDER if work_lock else tempfile.mkdtemp()
 app.config['TEMP_FOLDER'] = TEMP_FOLDER
 
-def cleanup_file(filepath):
-    """Delete file after a delay"""
+# Write-ahead record of each job's stage, replayed by recover_jobs()
+journal = JobJournal(os.path.join(TEMP_FOLDER, 'journal.jsonl'))
+
+# Job records and finished files, shared by every worker and node (see storage.py).
+# By default they stay in WORK_FOLDER, so every process on this machine shares
+# them whichever scratch folder it got; finished files get a folder of their own
+ARTIFACT_FOLDER = os.path.join(WORK_FOLDER, 'artifacts')
+job_store = open_job_store(os.environ.get('JOB_STORE') or f"sqlite:///{os.path.join(WORK_FOLDER, 'jobs.db')}")
+artifact_store = open_artifact_store(os.environ.get('ARTIFACT_STORE') or ARTIFACT_FOLDER)
+
+# How long a finished file stays downloadable, and how long job status is kept
+ARTIFACT_TTL = 30  # seconds
+JOB_TTL = 3600  # seconds
+
+# Beatstars beats resolved before or imported in bulk (see catalog.py); kept across restarts
+beat_catalog = BeatCatalog(os.environ.get('BEAT_CATALOG') or os.path.join(WORK_FOLDER, 'beats.db'))
+
+# Recognise audio already converted under another URL (needs pyacoustid + libchromaprint)
+FINGERPRINT_DEDUPE = os.environ.get('FINGERPRINT_DEDUPE', '').lower() in ('1', 'true', 'yes') and fingerprint_available()
+fingerprint_index = FingerprintIndex()
+
+# Fingerprint fetches (FFmpeg reading up to 30s of a source each) run at once, and
+# how long a job waits for one before it is converted without the dedupe check
+FINGERPRINT_FETCHES = int(os.environ.get('FINGERPRINT_FETCHES', 2))
+FINGERPRINT_WAIT = 5  # seconds
+fingerprint_slots = threading.BoundedSemaphore(FINGERPRINT_FETCHES)
+
+# MP3 encode run by yt-dlp after the download
+EXTRACT_AUDIO = {
+    'key': 'FFmpegExtractAudio',
+    'preferredcodec': 'mp3',
+    'preferredquality': '192',
+}
+
+# yt-dlp options for metadata-only extraction
+INFO_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extractor_retries': 3,
+    'nocheckcertificate': True,
+}
+
+# Per-client conversion quota, and a looser one for /probe previews
+client_quota = ClientQuota()
+probe_quota = ClientQuota(rate=0.5, burst=10)
+
+# Conversion slots, shared fairly between clients by the cost of their jobs
+scheduler = FairScheduler()
+
+# Spotify albums/playlists: tracks converted per collection, and threads working
+# through one client's queued tracks; a long playlist only holds up its own client
+MAX_PLAYLIST_TRACKS = 100
+PLAYLIST_CLIENT_WORKERS = int(os.environ.get('PLAYLIST_CLIENT_WORKERS', 2))
+playlist_queues = {}  # client ID -> deque of (playlist, job, track, charged)
+playlist_workers = {}  # client ID -> number of threads working through its queue
+playlist_queue_lock = threading.Lock()
+playlist_lock = threading.Lock()
+
+# Running jobs of this process; a cancel requested on any node is flagged in the job store
+cancellations = CancellationRegistry(is_requested=lambda job_id: job_store.get('cancel:' + job_id) is not None)
+
+# Source URL -> Resolution; searches change slowly
+resolution_cache = LRUCache(2000, ttl=3600)
+
+# Download URL -> unprocessed yt-dlp info; stream URLs inside it expire within hours
+info_cache = LRUCache(500, ttl=600)
+
+# (normalized query, count) -> ytsearch entries. Results change slowly: after
+# SEARCH_SOFT_TTL they are still served while a background search refreshes
+# them, and only after SEARCH_HARD_TTL does a request wait for YouTube again
+SEARCH_SOFT_TTL = int(os.environ.get('SEARCH_SOFT_TTL', 6 * 3600))  # seconds
+SEARCH_HARD_TTL = int(os.environ.get('SEARCH_HARD_TTL', 7 * 24 * 3600))  # seconds
+# Searches that found nothing are searched again after this, as YouTube sometimes answers empty
+SEARCH_EMPTY_TTL = int(os.environ.get('SEARCH_EMPTY_TTL', 60))  # seconds
+search_cache = StaleWhileRevalidateCache(int(os.environ.get('SEARCH_CACHE_ENTRIES', 5000)),
+                                         SEARCH_SOFT_TTL, SEARCH_HARD_TTL, SEARCH_EMPTY_TTL, logger=logger)
+
+def result_key(cache_key):
+    return 'result:' + json.dumps(cache_key)
+
+def output_cache_key(job, spec):
+    """Cache key of one output format of a job; each format is cached on its own"""
+    return (*job['cache_key'], spec)
+
+def download_cache_key(job, resolution, spec):
+    """Cache key of one output by the media downloaded, shared by every URL resolving to it"""
+    return ('download', resolution.download_url, job['normalize'], spec)
+
+def remember_result(cache_key, filename, title, name):
+    """Record a finished conversion so repeated requests on any node can reuse it"""
+    entry = {'filename': filename, 'title': title, 'download_name': name}
+    job_store.put(result_key(cache_key), entry, ARTIFACT_TTL)
+    # Browser download name (from the ID3 tags) per artifact
+    job_store.put('artifact:' + filename, entry, ARTIFACT_TTL)
+
+def cached_result(cache_key):
+    """Return a previous conversion with the same source and options if its file still exists"""
+    entry = job_store.get(result_key(cache_key))
+    if entry and not artifact_store.exists(entry['filename']):
+        job_store.delete(result_key(cache_key))
+        entry = None
+    return entry
+
+def update_job(job, status, **fields):
+    """Publish a job's progress so any node can answer GET /jobs/<id>"""
+    job_store.put('job:' + job['id'], {'id': job['id'], 'status': status, 'source_url': job['source_url'], **fields}, JOB_TTL)
+
+def limited_get(platform, url, ready=None, **kwargs):
+    """requests.get through the platform's limiter, treating 429/403 as throttling.
+
+    With ready, the body is streamed and the transfer stops as soon as
+    ready(scanner) holds (see pagescan.py).
+    """
+    limiter = get_limiter(platform)
+    stream = kwargs.pop('stream', False) or ready is not None
+    limiter.acquire()
+    try:
+        response = requests.get(url, stream=stream, **kwargs)
+    except Exception:
+        # No answer at all counts against the upstream like throttling, so an unreachable one fails fast
+        limiter.record(True)
+        raise
+    limiter.record(response.status_code in (403, 429))
+    if ready is not None:
+        return read_page(response, ready)
+    return response
+
+def evict_artifact(filename):
+    """Delete a finished file and its download record"""
+    artifact_store.delete(filename)
+    job_store.delete('artifact:' + filename)
+
+# Disk space held by running jobs and finished files on this machine
+storage_accountant = StorageAccountant(TEMP_FOLDER, evict=evict_artifact)
+
+def cleanup_file(filename):
+    """Delete an artifact after a delay"""
     def delete_after_delay():
-        time.sleep(30)  # Wait 30 seconds before cleanup
-        try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-        except:
-            pass
+        time.sleep(ARTIFACT_TTL)  # Wait 30 seconds before cleanup
+        evict_artifact(filename)
+        storage_accountant.remove_artifact(filename)
+        job_store.purge_expired()
 
     thread = threading.Thread(target=delete_after_delay)
     thread.daemon = True
     thread.start()
 
+# Browser headers for scraping Beatstars beat pages
+BEATSTARS_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://www.beatstars.com/'
+}
+
+def parse_beatstars_url(beatstars_url):
+    """Extract (beat slug, beat ID) from a Beatstars URL, or None"""
+    url_match = re.search(r'/beat/(?:([^/]+)-)?(\d+)', beatstars_url)
+    if not url_match:
+        return None
+    return url_match.group(1), url_match.group(2)
+
+def beatstars_slug_info(beat_slug, beat_id):
+    """Fallback beat information derived from the URL slug"""
+    if beat_slug:
+        beat_name = beat_slug.replace('-', ' ').title()
+        return beat_name, "Beatstars Producer"
+    return f"Beatstars Beat {beat_id}", "Beatstars Producer"
+
+def parse_beatstars_page(content):
+    """Extract (beat title, producer) from a Beatstars beat page, or None"""
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Look for beat title in various places
+    title_tag = soup.find('title')
+    if title_tag and title_tag.string:
+        title_text = title_tag.string.strip()
+        logger.debug("Found title from Beatstars: %s", title_text)
+
+        # Check if this is a generic Beatstars page (not a specific beat)
+        if "Buy Beats Online" in title_text or "Download Beats" in title_text:
+            logger.debug("This appears to be a generic Beatstars page, extracting from URL slug")
+            return None
+
+        # Clean up title (remove "Beatstars -" prefix, etc.)
+        title_text = re.sub(r'^Beatstars\s*-\s*', '', title_text)
+        title_text = re.sub(r'\s*\|\s*Beatstars.*$', '', title_text)
+
+        # Look for producer/artist name in more places
+        producer_name = None
+
+        # Try to find meta tags
+        meta_tags = soup.find_all('meta')
+        for tag in meta_tags:
+            if tag.get('property') == 'og:title':
+                og_title = tag.get('content', '')
+                logger.debug("Found OG title: %s", og_title)
+                if '|' in og_title:
+                    parts = og_title.split('|', 1)
+                    beat_title = parts[0].strip()
+                    producer_name = parts[1].strip()
+                    return beat_title, producer_name or "Unknown Producer"
+                elif ' - ' in og_title:
+                    parts = og_title.split(' - ', 1)
+                    beat_title = parts[0].strip()
+                    producer_name = parts[1].strip()
+                    return beat_title, producer_name or "Unknown Producer"
+                elif '-' in og_title and len(og_title.split('-')) == 2:
+                    parts = og_title.split('-', 1)
+                    beat_title = parts[0].strip()
+                    producer_name = parts[1].strip()
+                    return beat_title, producer_name or "Unknown Producer"
+
+        # Look for structured data (JSON-LD)
+        json_scripts = soup.find_all('script', type='application/ld+json')
+        for script in json_scripts:
+            if script.string:
+                try:
+                    import json
+                    data = json.loads(script.string)
+                    if isinstance(data, dict):
+                        # Look for music recording data
+                        if data.get('@type') == 'MusicRecording':
+                            beat_title = data.get('name', '')
+                            producer_name = None
+                            if 'byArtist' in data:
+                                producer_name = data['byArtist'].get('name', '')
+                            if beat_title:
+                                return beat_title, producer_name or "Beatstars Producer"
+                except:
+                    continue
+
+        # Look for specific Beatstars page elements
+        # Search for elements containing artist/producer information
+        artist_selectors = [
+            'span.artist-name',
+            'div.producer-name',
+            'h2.producer',
+            'a[href*="/user/"]',
+            '.beat-artist',
+            '.producer-link'
+        ]
+
+        for selector in artist_selectors:
+            elements = soup.select(selector)
+            for element in elements:
+                text = element.get_text().strip()
+                if text and len(text) > 2 and not text.isdigit():
+                    logger.debug("Found artist element: %s", text)
+                    producer_name = text
+                    break
+            if producer_name:
+                break
+
+        # Look for beat title in specific elements
+        title_selectors = [
+            'h1.beat-title',
+            'div.beat-name',
+            '.track-title',
+            '.beat-header h1'
+        ]
+
+        beat_title = None
+        for selector in title_selectors:
+            elements = soup.select(selector)
+            for element in elements:
+                text = element.get_text().strip()
+                if text and len(text) > 2:
+                    logger.debug("Found beat title element: %s", text)
+                    beat_title = text
+                    break
+            if beat_title:
+                break
+
+        # If we found both title and producer, return them
+        if beat_title and producer_name:
+            return beat_title, producer_name
+
+        # If we found just the producer, use the cleaned title
+        if producer_name and title_text and not ("Buy Beats" in title_text):
+            return title_text, producer_name
+
+        # Look for h1 tags that might contain the beat title
+        h1_tags = soup.find_all('h1')
+        for h1 in h1_tags:
+            if h1.string and len(h1.string.strip()) > 3:
+                beat_title = h1.string.strip()
+                logger.debug("Found H1 title: %s", beat_title)
+                return beat_title, producer_name or "Beatstars Producer"
+
+        # If we found a title but no producer, return just the title
+        if title_text and not ("Buy Beats" in title_text):
+            return title_text, "Beatstars Producer"
+
+    return None
+
 def extract_beatstars_info(beatstars_url):
     """Extract beat information from Beatstars URL"""
     try:
         # Extract beat ID from URL
-        url_match = re.search(r'/beat(?:/([^/]+)-)?(\d+)', beatstars_url)
-        if not url_match:
+        parsed = parse_beatstars_url(beatstars_url)
+        if not parsed:
             return None, None
 
-        beat_slug = url_match.group(1)
-        beat_id = url_match.group(2)
-        print(f"Extracted Beatstars beat ID: {beat_id}, slug: {beat_slug}")
+        beat_slug, beat_id = parsed
+        logger.debug("Extracted Beatstars beat ID: %s, slug: %s", beat_id, beat_slug)
 
         # Try to get beat information from the page
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Referer': 'https://www.beatstars.com/'
-        }
-
-        response = requests.get(beatstars_url, headers=headers, timeout=15)
+        response = limited_get('beatstars', beatstars_url, ready=beatstars_page_ready, headers=BEATSTARS_HEADERS, timeout=15)
         if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            # Look for beat title in various places
-            title_tag = soup.find('title')
-            if title_tag and title_tag.string:
-                title_text = title_tag.string.strip()
-                print(f"Found title from Beatstars: {title_text}")
-
-                # Check if this is a generic Beatstars page (not a specific beat)
-                if "Buy Beats Online" in title_text or "Download Beats" in title_text:
-                    print("This appears to be a generic Beatstars page, extracting from URL slug")
-                    # Extract beat name from URL slug
-                    if beat_slug:
-                        beat_name = beat_slug.replace('-', ' ').title()
-                        return beat_name, "Beatstars Producer"
-                    else:
-                        return f"Beatstars Beat {beat_id}", "Beatstars Producer"
-
-                # Clean up title (remove "Beatstars -" prefix, etc.)
-                title_text = re.sub(r'^Beatstars\s*-\s*', '', title_text)
-                title_text = re.sub(r'\s*\|\s*Beatstars.*$', '', title_text)
-
-                # Look for producer/artist name in more places
-                producer_name = None
-
-                # Try to find meta tags
-                meta_tags = soup.find_all('meta')
-                for tag in meta_tags:
-                    if tag.get('property') == 'og:title':
-                        og_title = tag.get('content', '')
-                        print(f"Found OG title: {og_title}")
-                        if '|' in og_title:
-                            parts = og_title.split('|', 1)
-                            beat_title = parts[0].strip()
-                            producer_name = parts[1].strip()
-                            return beat_title, producer_name or "Unknown Producer"
-                        elif ' - ' in og_title:
-                            parts = og_title.split(' - ', 1)
-                            beat_title = parts[0].strip()
-                            producer_name = parts[1].strip()
-                            return beat_title, producer_name or "Unknown Producer"
-                        elif '-' in og_title and len(og_title.split('-')) == 2:
-                            parts = og_title.split('-', 1)
-                            beat_title = parts[0].strip()
-                            producer_name = parts[1].strip()
-                            return beat_title, producer_name or "Unknown Producer"
-
-                # Look for structured data (JSON-LD)
-                json_scripts = soup.find_all('script', type='application/ld+json')
-                for script in json_scripts:
-                    if script.string:
-                        try:
-                            import json
-                            data = json.loads(script.string)
-                            if isinstance(data, dict):
-                                # Look for music recording data
-                                if data.get('@type') == 'MusicRecording':
-                                    beat_title = data.get('name', '')
-                                    producer_name = None
-                                    if 'byArtist' in data:
-                                        producer_name = data['byArtist'].get('name', '')
-                                    if beat_title:
-                                        return beat_title, producer_name or "Beatstars Producer"
-                        except:
-                            continue
-
-                # Look for specific Beatstars page elements
-                # Search for elements containing artist/producer information
-                artist_selectors = [
-                    'span.artist-name',
-                    'div.producer-name',
-                    'h2.producer',
-                    'a[href*="/user/"]',
-                    '.beat-artist',
-                    '.producer-link'
-                ]
-
-                for selector in artist_selectors:
-                    elements = soup.select(selector)
-                    for element in elements:
-                        text = element.get_text().strip()
-                        if text and len(text) > 2 and not text.isdigit():
-                            print(f"Found artist element: {text}")
-                            producer_name = text
-                            break
-                    if producer_name:
-                        break
-
-                # Look for beat title in specific elements
-                title_selectors = [
-                    'h1.beat-title',
-                    'div.beat-name',
-                    '.track-title',
-                    '.beat-header h1'
-                ]
-
-                beat_title = None
-                for selector in title_selectors:
-                    elements = soup.select(selector)
-                    for element in elements:
-                        text = element.get_text().strip()
-                        if text and len(text) > 2:
-                            print(f"Found beat title element: {text}")
-                            beat_title = text
-                            break
-                    if beat_title:
-                        break
-
-                # If we found both title and producer, return them
-                if beat_title and producer_name:
-                    return beat_title, producer_name
-
-                # If we found just the producer, use the cleaned title
-                if producer_name and title_text and not ("Buy Beats" in title_text):
-                    return title_text, producer_name
-
-                # Look for h1 tags that might contain the beat title
-                h1_tags = soup.find_all('h1')
-                for h1 in h1_tags:
-                    if h1.string and len(h1.string.strip()) > 3:
-                        beat_title = h1.string.strip()
-                        print(f"Found H1 title: {beat_title}")
-                        return beat_title, producer_name or "Beatstars Producer"
-
-                # If we found a title but no producer, return just the title
-                if title_text and not ("Buy Beats" in title_text):
-                    return title_text, "Beatstars Producer"
+            beat_info = parse_beatstars_page(response.content)
+            if beat_info:
+                return beat_info
 
         # Fallback: extract from URL slug
-        if beat_slug:
-            beat_name = beat_slug.replace('-', ' ').title()
-            return beat_name, "Beatstars Producer"
-
-        return f"Beatstars Beat {beat_id}", "Beatstars Producer"
+        return beatstars_slug_info(beat_slug, beat_id)
 
+    except UpstreamThrottled:
+        raise
     except Exception as e:
-        print(f"Error extracting Beatstars info: {e}")
+        logger.warning("Error extracting Beatstars info: %s", e)
         return None, None
 
+# Browser headers for Spotify's embed player and the regular track page
+SPOTIFY_EMBED_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://open.spotify.com/'
+}
+
+SPOTIFY_PAGE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5,en;q=0.3',
+    'Referer': 'https://www.google.com/',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+def spotify_track_id(spotify_url):
+    """Extract the track ID from a Spotify track URL, or None"""
+    url_match = re.search(r'/track/([a-zA-Z0-9]+)', spotify_url)
+    return url_match.group(1) if url_match else None
+
+def spotify_collection(spotify_url):
+    """Extract ('album' or 'playlist', ID) from a Spotify album/playlist URL, or None"""
+    url_match = re.search(r'/(album|playlist)/([a-zA-Z0-9]+)', spotify_url)
+    return (url_match.group(1), url_match.group(2)) if url_match else None
+
+def parse_spotify_embed(content):
+    """Extract (track, artist) from Spotify's embed player page, or None"""
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Look for track title in various places
+    title_tag = soup.find('title')
+    if title_tag and title_tag.string:
+        title_text = title_tag.string.strip()
+        logger.debug("Found title from embed: %s", title_text)
+
+        # Try to parse "Track Name - Artist Name" format
+        if ' - ' in title_text:
+            parts = title_text.split(' - ', 1)
+            track_name = parts[0].strip()
+            artist_name = parts[1].strip()
+            if track_name and artist_name:
+                return track_name, artist_name
+
+    # Look for JSON data in scripts
+    scripts = soup.find_all('script')
+    for script in scripts:
+        if script.string and ('Spotify.Entity' in script.string or 'entity' in script.string):
+            logger.debug("Found script with entity data, length: %s", len(script.string))
+            # Try to extract from JSON data
+            try:
+                import json
+
+                # Look for JSON objects in the script
+                json_start = script.string.find('{')
+                json_end = script.string.rfind('}') + 1
+
+                if json_start != -1 and json_end > json_start:
+                    json_str = script.string[json_start:json_end]
+                    data = json.loads(json_str)
+
+                    # Navigate through the nested structure
+                    if 'props' in data and 'pageProps' in data['props']:
+                        state = data['props']['pageProps'].get('state', {})
+                        entity_data = state.get('data', {}).get('entity', {})
+
+                        if entity_data.get('type') == 'track':
+                            track_name = entity_data.get('name')
+                            artists = entity_data.get('artists', [])
+                            if artists and len(artists) > 0:
+                                artist_name = artists[0].get('name')
+
+                                if track_name and artist_name:
+                                    logger.debug("Successfully extracted: '%s' by '%s'", track_name, artist_name)
+                                    return track_name, artist_name
+
+            except json.JSONDecodeError:
+                # Try regex approach as fallback
+                name_match = re.search(r'"name"\s*:\s*"([^"]+)"', script.string)
+                if name_match:
+                    track_name = name_match.group(1)
+                    logger.debug("Found track name via regex: %s", track_name)
+
+                    # Look for artist name in artists array
+                    artist_match = re.search(r'"artists"\s*:\s*\[\s*\{[^}]*"name"\s*:\s*"([^"]+)"', script.string)
+                    if artist_match:
+                        artist_name = artist_match.group(1)
+                        logger.debug("Found artist name via regex: %s", artist_name)
+                        return track_name, artist_name
+            except Exception as e:
+                logger.warning("Error parsing script: %s", e)
+                continue
+
+    return None
+
+def parse_spotify_page(content):
+    """Extract (track, artist) from a regular Spotify track page, or None"""
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Look for title tag
+    title_tag = soup.find('title')
+    if title_tag and title_tag.string:
+        title_text = title_tag.string.strip()
+        logger.debug("Found title from main page: %s", title_text)
+
+        # Current pages: "Track - song and lyrics by Artist | Spotify"
+        match = re.match(r'^(.+?) - song(?: and lyrics)? by (.+?)(?: \| Spotify)?$', title_text)
+        if match:
+            return match.group(1).strip(), match.group(2).strip()
+
+        # Parse different title formats
+        if '|' in title_text:
+            parts = title_text.split('|', 1)
+            if len(parts) >= 2:
+                track_name = parts[0].strip()
+                artist_name = parts[1].strip()
+                return track_name, artist_name
+        elif ' - ' in title_text:
+            parts = title_text.split(' - ', 1)
+            track_name = parts[0].strip()
+            artist_name = parts[1].strip()
+            return track_name, artist_name
+
+    # Look for meta tags
+    meta_tags = soup.find_all('meta')
+    for tag in meta_tags:
+        if tag.get('property') == 'og:title':
+            og_title = tag.get('content', '')
+            logger.debug("Found OG title: %s", og_title)
+            if '|' in og_title:
+                parts = og_title.split('|', 1)
+                if len(parts) >= 2:
+                    return parts[0].strip(), parts[1].strip()
+
+    return None
+
+def parse_spotify_collection(content):
+    """Extract (name, tracks) from an album/playlist embed page, or None.
+
+    The page's entity payload lists every track with its artists and length,
+    so the whole collection needs no per-track scrape. Each track is a dict
+    with title, artist, duration (seconds) and url.
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+    script = soup.find('script', id='__NEXT_DATA__')
+    if script is None or not script.string:
+        return None
+    try:
+        data = json.loads(script.string)
+    except ValueError:
+        return None
+    entity = (((data.get('props') or {}).get('pageProps') or {}).get('state') or {}).get('data', {}).get('entity') or {}
+    if entity.get('type') not in ('album', 'playlist'):
+        return None
+
+    tracks = []
+    for item in entity.get('trackList') or []:
+        uri_match = re.fullmatch(r'spotify:track:([A-Za-z0-9]+)', item.get('uri') or '')
+        # Local files and tracks unavailable in the page's region cannot be matched
+        if not uri_match or not item.get('title') or item.get('isPlayable') is False:
+            continue
+        tracks.append({
+            'title': item['title'],
+            'artist': (item.get('subtitle') or '').replace('\u00a0', ' ').strip() or None,
+            'duration': item['duration'] / 1000 if item.get('duration') else None,
+            'url': f'https://open.spotify.com/track/{uri_match.group(1)}',
+        })
+    return entity.get('name') or entity.get('title'), tracks
+
+def extract_spotify_collection(spotify_url):
+    """(name, tracks) of a Spotify album or playlist from a single embed page fetch"""
+    kind, collection_id = spotify_collection(spotify_url)
+    embed_url = f"https://open.spotify.com/embed/{kind}/{collection_id}"
+    response = limited_get('spotify', embed_url, ready=spotify_collection_ready, headers=SPOTIFY_EMBED_HEADERS, timeout=15)
+    parsed = parse_spotify_collection(response.content) if response.status_code == 200 else None
+    if not parsed or not parsed[1]:
+        raise ResolveError(f'Could not read the tracks of this Spotify {kind}. It might be private or unavailable in this region.')
+    return parsed
+
 def extract_spotify_info(spotify_url):
     """Extract track information from Spotify URL"""
     try:
         # First, try to extract from URL pattern
-        url_match = re.search(r'/track/([a-zA-Z0-9]+)', spotify_url)
-        if url_match:
-            track_id = url_match.group(1)
-            print(f"Extracted Spotify track ID: {track_id}")
+        track_id = spotify_track_id(spotify_url)
+        if track_id:
+            logger.debug("Extracted Spotify track ID: %s", track_id)
 
             # Try multiple approaches to get track info
 
             # Approach 1: Use Spotify's embed endpoint (often has more accessible data)
             embed_url = f"https://open.spotify.com/embed/track/{track_id}"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Referer': 'https://open.spotify.com/'
-            }
-
-            response = requests.get(embed_url, headers=headers, timeout=15)
+            response = limited_get('spotify', embed_url, ready=spotify_embed_ready, headers=SPOTIFY_EMBED_HEADERS, timeout=15)
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-
-                # Look for track title in various places
-                title_tag = soup.find('title')
-                if title_tag and title_tag.string:
-                    title_text = title_tag.string.strip()
-                    print(f"Found title from embed: {title_text}")
-
-                    # Try to parse "Track Name - Artist Name" format
-                    if ' - ' in title_text:
-                        parts = title_text.split(' - ', 1)
-                        track_name = parts[0].strip()
-                        artist_name = parts[1].strip()
-                        if track_name and artist_name:
-                            return track_name, artist_name
-
-                # Look for JSON data in scripts
-                scripts = soup.find_all('script')
-                for script in scripts:
-                    if script.string and ('Spotify.Entity' in script.string or 'entity' in script.string):
-                        print(f"Found script with entity data, length: {len(script.string)}")
-                        # Try to extract from JSON data
-                        try:
-                            import json
-
-                            # Look for JSON objects in the script
-                            json_start = script.string.find('{')
-                            json_end = script.string.rfind('}') + 1
-
-                            if json_start != -1 and json_end > json_start:
-                                json_str = script.string[json_start:json_end]
-                                data = json.loads(json_str)
-
-                                # Navigate through the nested structure
-                                if 'props' in data and 'pageProps' in data['props']:
-                                    state = data['props']['pageProps'].get('state', {})
-                                    entity_data = state.get('data', {}).get('entity', {})
-
-                                    if entity_data.get('type') == 'track':
-                                        track_name = entity_data.get('name')
-                                        artists = entity_data.get('artists', [])
-                                        if artists and len(artists) > 0:
-                                            artist_name = artists[0].get('name')
-
-                                            if track_name and artist_name:
-                                                print(f"Successfully extracted: '{track_name}' by '{artist_name}'")
-                                                return track_name, artist_name
-
-                        except json.JSONDecodeError:
-                            # Try regex approach as fallback
-                            name_match = re.search(r'"name"\s*:\s*"([^"]+)"', script.string)
-                            if name_match:
-                                track_name = name_match.group(1)
-                                print(f"Found track name via regex: {track_name}")
-
-                                # Look for artist name in artists array
-                                artist_match = re.search(r'"artists"\s*:\s*\[\s*\{[^}]*"name"\s*:\s*"([^"]+)"', script.string)
-                                if artist_match:
-                                    artist_name = artist_match.group(1)
-                                    print(f"Found artist name via regex: {artist_name}")
-                                    return track_name, artist_name
-                        except Exception as e:
-                            print(f"Error parsing script: {e}")
-                            continue
+                track_info = parse_spotify_embed(response.content)
+                if track_info:
+                    return track_info
 
             # Approach 2: Try the main Spotify page with better headers
-            headers_main = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5,en;q=0.3',
-                'Referer': 'https://www.google.com/',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            }
-
-            response = requests.get(spotify_url, headers=headers_main, timeout=15)
+            response = limited_get('spotify', spotify_url, ready=spotify_page_ready, headers=SPOTIFY_PAGE_HEADERS, timeout=15)
             if response.status_code == 200 and len(response.content) > 1000:  # Make sure we got actual content
-                soup = BeautifulSoup(response.content, 'html.parser')
-
-                # Look for title tag
-                title_tag = soup.find('title')
-                if title_tag and title_tag.string:
-                    title_text = title_tag.string.strip()
-                    print(f"Found title from main page: {title_text}")
-
-                    # Parse different title formats
-                    if '|' in title_text:
-                        parts = title_text.split('|', 1)
-                        if len(parts) >= 2:
-                            track_name = parts[0].strip()
-                            artist_name = parts[1].strip()
-                            return track_name, artist_name
-                    elif ' - ' in title_text:
-                        parts = title_text.split(' - ', 1)
-                        track_name = parts[0].strip()
-                        artist_name = parts[1].strip()
-                        return track_name, artist_name
-
-                # Look for meta tags
-                meta_tags = soup.find_all('meta')
-                for tag in meta_tags:
-                    if tag.get('property') == 'og:title':
-                        og_title = tag.get('content', '')
-                        print(f"Found OG title: {og_title}")
-                        if '|' in og_title:
-                            parts = og_title.split('|', 1)
-                            if len(parts) >= 2:
-                                return parts[0].strip(), parts[1].strip()
+                track_info = parse_spotify_page(response.content)
+                if track_info:
+                    return track_info
 
         # If all approaches fail, return None
-        print("Could not extract track information from Spotify URL")
+        logger.warning("Could not extract track information from Spotify URL")
         return None, None
 
+    except UpstreamThrottled:
+        raise
     except Exception as e:
-        print(f"Error extracting Spotify info: {e}")
+        logger.warning("Error extracting Spotify info: %s", e)
         return None, None
 
-def search_youtube_track(track_name, artist_name):
+def search_cache_key(search_query, count):
+    """Queries differing only in case or spacing get the same results"""
+    return ' '.join(search_query.lower().split()), count
+
+def youtube_search(search_query, count):
+    """Flat ytsearch results for a query, from the search cache where possible"""
+    return search_cache.get(search_cache_key(search_query, count), lambda: fetch_youtube_search(search_query, count))
+
+def fetch_youtube_search(search_query, count):
+    """Flat ytsearch results for a query, searched on YouTube"""
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': True,
+        'default_search': f'ytsearch{count}',
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl, get_limiter('youtube').guard():
+        search_results = ydl.extract_info(f"ytsearch{count}:{search_query}", download=False)
+    return (search_results or {}).get('entries') or []
+
+def search_youtube_track(track_name, artist_name, duration=None):
     """Search for track on YouTube and return the best match URL"""
     if not track_name:
         return None
 
-    try:
-        # Try different search queries for better results
-        search_queries = [
-            f"{artist_name} {track_name} official audio" if artist_name else f"{track_name} official audio",
-            f"{artist_name} {track_name} official music video" if artist_name else f"{track_name} music video",
-            f"{artist_name} {track_name}" if artist_name else f"{track_name}"
-        ]
-
-        for search_query in search_queries:
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': True,
-                'default_search': 'ytsearch3',  # Get top 3 results
-            }
-
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                try:
-                    search_results = ydl.extract_info(f"ytsearch3:{search_query}", download=False)
-
-                    if search_results and 'entries' in search_results and search_results['entries']:
-                        # Look for the best match (prefer official audio/official video)
-                        for entry in search_results['entries']:
-                            title = entry.get('title', '').lower()
-                            if any(keyword in title for keyword in ['official audio', 'official music video', 'official video']):
-                                video_id = entry.get('id') or entry.get('url', '').split('/')[-1].split('?')[0]
-                                return f"https://www.youtube.com/watch?v={video_id}"
-
-                        # If no official version found, return the first result
-                        first_result = search_results['entries'][0]
-                        video_id = first_result.get('id') or first_result.get('url', '').split('/')[-1].split('?')[0]
-                        return f"https://www.youtube.com/watch?v={video_id}"
-                except:
-                    continue  # Try next search query
+    # Try different search queries for better results
+    search_queries = [
+        f"{artist_name} {track_name} official audio" if artist_name else f"{track_name} official audio",
+        f"{artist_name} {track_name} official music video" if artist_name else f"{track_name} music video",
+        f"{artist_name} {track_name}" if artist_name else f"{track_name}"
+    ]
 
-    except Exception as e:
-        print(f"Error searching YouTube: {e}")
+    for search_query in search_queries:
+        try:
+            # Look for the best match (prefer official audio/official video), else the first result
+            match = pick_track(youtube_search(search_query, 3), duration)
+            if match:
+                return match.url
+        except UpstreamThrottled:
+            raise
+        except Exception as e:
+            logger.warning("Error searching YouTube: %s", e)
+            continue  # Try next search query
 
     return None
 
@@ -380,445 +639,1021 @@ def search_youtube_beat(beat_name, producer_name):
     if not beat_name:
         return None
 
-    try:
-        # Beat-specific search queries - prioritize artist name when available
-        search_queries = []
-
-        # If we have a producer name that's not generic, prioritize it
-        if producer_name and producer_name not in ["Beatstars Producer", "Unknown Producer"]:
-            search_queries.extend([
-                f"{beat_name} {producer_name}",  # Exact match like "Plus Jamais Layton"
-                f"{beat_name} by {producer_name}",
-                f"{producer_name} {beat_name} beat",
-                f"{producer_name} {beat_name}"
-            ])
-
-        # General beat searches
+    # Beat-specific search queries - prioritize artist name when available
+    search_queries = []
+
+    # If we have a producer name that's not generic, prioritize it
+    if producer_name and producer_name not in GENERIC_PRODUCERS:
         search_queries.extend([
-            f"{beat_name} beat instrumental",
-            f"{beat_name} type beat",
-            f"{beat_name} prod",
-            f"{beat_name} beat free",
-            f"{beat_name} instrumental beat"
+            f"{beat_name} {producer_name}",  # Exact match like "Plus Jamais Layton"
+            f"{beat_name} by {producer_name}",
+            f"{producer_name} {beat_name} beat",
+            f"{producer_name} {beat_name}"
         ])
 
+    # General beat searches
+    search_queries.extend([
+        f"{beat_name} beat instrumental",
+        f"{beat_name} type beat",
+        f"{beat_name} prod",
+        f"{beat_name} beat free",
+        f"{beat_name} instrumental beat"
+    ])
+
+    def result_batches():
+        # Searched one query at a time; ranking stops as soon as a batch has a match
         for search_query in search_queries:
-            print(f"Trying beat search: {search_query}")
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': True,
-                'default_search': 'ytsearch8',  # Get top 8 results for beats
-            }
-
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                try:
-                    search_results = ydl.extract_info(f"ytsearch8:{search_query}", download=False)
-
-                    if search_results and 'entries' in search_results and search_results['entries']:
-                        print(f"Found {len(search_results['entries'])} results for '{search_query}'")
-
-                        # Look for beat/instrumental content (avoid tutorials and vocal tracks)
-                        for entry in search_results['entries']:
-                            title = entry.get('title', '').lower()
-                            description = entry.get('description', '').lower() if entry.get('description') else ''
-
-                            print(f"  Checking: {entry.get('title', '')}")
-
-                            # Skip tutorial videos, vocal tracks, and non-beat content
-                            skip_keywords = ['tutorial', 'how to', 'export', 'fl studio', 'logic pro', 'ableton', 'vocal', 'lyrics', 'singing', 'cover', 'remix']
-                            if any(keyword in title or keyword in description for keyword in skip_keywords):
-                                print(f"    Skipping (contains skip keywords)")
-                                continue
-
-                            # High priority: exact beat name and producer match
-                            if producer_name and producer_name not in ["Beatstars Producer", "Unknown Producer"]:
-                                if (beat_name.lower() in title and
-                                    (producer_name.lower() in title or producer_name.lower() in description)):
-                                    video_id = entry.get('id') or entry.get('url', '').split('/')[-1].split('?')[0]
-                                    print(f"    ✅ Found exact match: {entry.get('title', '')}")
-                                    return f"https://www.youtube.com/watch?v={video_id}"
-
-                            # Prefer beat/instrumental content
-                            prefer_keywords = ['beat', 'instrumental', 'type beat', 'prod', 'producer', 'free beat', 'demo', 'boombap', 'trap beat']
-                            if any(keyword in title or keyword in description for keyword in prefer_keywords):
-                                # Make sure the beat name is in the title
-                                if beat_name.lower() in title:
-                                    video_id = entry.get('id') or entry.get('url', '').split('/')[-1].split('?')[0]
-                                    print(f"    Found preferred beat match: {entry.get('title', '')}")
-                                    return f"https://www.youtube.com/watch?v={video_id}"
-
-                        # If no preferred match found, return the first result that contains the beat name
-                        for entry in search_results['entries']:
-                            title = entry.get('title', '').lower()
-                            description = entry.get('description', '').lower() if entry.get('description') else ''
-
-                            # Skip tutorials
-                            if not any(keyword in title or keyword in description for keyword in ['tutorial', 'how to', 'export', 'fl studio']):
-                                # Check if beat name is in title
-                                if beat_name.lower() in title:
-                                    video_id = entry.get('id') or entry.get('url', '').split('/')[-1].split('?')[0]
-                                    print(f"    Using beat name match: {entry.get('title', '')}")
-                                    return f"https://www.youtube.com/watch?v={video_id}"
-
-                except Exception as e:
-                    print(f"Error with search query '{search_query}': {e}")
-                    continue
-
-    except Exception as e:
-        print(f"Error searching YouTube for beat: {e}")
+            logger.debug("Trying beat search: %s", search_query)
+            try:
+                yield youtube_search(search_query, 8)
+            except UpstreamThrottled:
+                raise
+            except Exception as e:
+                logger.warning("Error with search query '%s': %s", search_query, e)
 
+    # Avoid tutorials and vocal tracks; prefer the producer's upload or beat/instrumental content
+    match = pick_beat(result_batches(), beat_name, producer_name)
+    if match:
+        logger.debug("Found beat match: %s", match.entry.get('title', ''))
+        return match.url
     return None
 
 def search_youtube_beat_simple(search_query, search_type):
     """Simple YouTube search for beats - returns first non-tutorial result"""
     try:
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': True,
-            'default_search': 'ytsearch5',
-        }
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            search_results = ydl.extract_info(f"ytsearch5:{search_query}", download=False)
-
-            if search_results and 'entries' in search_results and search_results['entries']:
-                # Return the first non-tutorial result
-                for entry in search_results['entries']:
-                    title = entry.get('title', '').lower()
-                    description = entry.get('description', '').lower() if entry.get('description') else ''
-
-                    # Skip tutorials
-                    if not any(keyword in title or keyword in description for keyword in ['tutorial', 'how to', 'export', 'fl studio']):
-                        video_id = entry.get('id') or entry.get('url', '').split('/')[-1].split('?')[0]
-                        return f"https://www.youtube.com/watch?v={video_id}"
-
+        match = pick_non_tutorial(youtube_search(search_query, 5))
+        if match:
+            return match.url
+    except UpstreamThrottled:
+        raise
     except Exception as e:
-        print(f"Error in simple beat search: {e}")
+        logger.warning("Error in simple beat search: %s", e)
 
     return None
 
+def spotify_metadata(track_name, artist_name):
+    """Resolver metadata from a Spotify scrape result"""
+    if not track_name:
+        raise ResolveError('Could not extract track information from Spotify URL. Please try a different Spotify link or use the direct YouTube/SoundCloud link instead.')
+    return {'title': track_name, 'artist': artist_name}
+
+def fetch_spotify_metadata(spotify_url):
+    """Metadata fetcher for Spotify tracks"""
+    return spotify_metadata(*extract_spotify_info(spotify_url))
+
+def map_spotify_to_youtube(metadata):
+    """Find the Spotify track on YouTube"""
+    track_name, artist_name = metadata['title'], metadata['artist']
+    # Tracks of an album/playlist arrive with their length, which tells versions apart
+    youtube_url = search_youtube_track(track_name, artist_name, metadata.get('duration'))
+    if not youtube_url:
+        raise ResolveError(f'Could not find "{track_name}" by {artist_name or "Unknown Artist"} on YouTube. Please try searching manually or use a different link.')
+    logger.info("Spotify track found: '%s' by %s -> %s", track_name, artist_name or 'Unknown Artist', youtube_url)
+    return youtube_url
+
+def beatstars_metadata(beat_name, producer_name, beat_id=None):
+    """Resolver metadata from a Beatstars scrape result; beat_id lets the result be indexed"""
+    if not beat_name:
+        raise ResolveError('Could not extract beat information from Beatstars URL. Please try a different Beatstars link or use the direct YouTube/SoundCloud link instead.')
+    metadata = {'title': beat_name, 'artist': producer_name}
+    if beat_id:
+        metadata['beat_id'] = beat_id
+    return metadata
+
+def beatstars_beat_id(beatstars_url):
+    parsed = parse_beatstars_url(beatstars_url)
+    return parsed[1] if parsed else None
+
+def catalog_metadata(beatstars_url):
+    """Resolver metadata from the beat catalog, or None if it does not know the beat well enough to skip the scrape"""
+    beat_id = beatstars_beat_id(beatstars_url)
+    beat = beat_catalog.get(beat_id) if beat_id else None
+    if not beat or not beat['title'] or not (beat['producer'] or beat['youtube_url']):
+        return None
+    metadata = beatstars_metadata(beat['title'], beat['producer'] or GENERIC_PRODUCERS[0], beat_id)
+    if beat['youtube_url']:
+        metadata['youtube_url'] = beat['youtube_url']
+    return metadata
+
+def fetch_beatstars_metadata(beatstars_url):
+    """Metadata fetcher for Beatstars beats, answered from the beat catalog when it knows the beat"""
+    metadata = catalog_metadata(beatstars_url)
+    if metadata is None:
+        metadata = beatstars_metadata(*extract_beatstars_info(beatstars_url), beatstars_beat_id(beatstars_url))
+    return metadata
+
+def refresh_catalog_beat(beat_id):
+    """Scrape and search an indexed beat again, updating its catalog entry"""
+    beat = beat_catalog.get(beat_id) or {}
+    beat_name, producer_name = extract_beatstars_info(f'https://www.beatstars.com/beat/{beat_id}')
+    # A failed scrape only has the URL slug; what the catalog knows is better
+    if beat.get('title') and (not beat_name or producer_name in GENERIC_PRODUCERS):
+        beat_name, producer_name = beat['title'], beat.get('producer') or producer_name
+    metadata = beatstars_metadata(beat_name, producer_name, beat_id)
+    return map_beatstars_to_youtube(metadata, use_catalog=False)
+
+def map_beatstars_to_youtube(metadata, use_catalog=True):
+    """Find the Beatstars beat on YouTube; beats with a beat_id are recorded in the beat catalog"""
+    beat_name, producer_name = metadata['title'], metadata['artist']
+    if use_catalog and metadata.get('youtube_url'):
+        return metadata['youtube_url']
+    youtube_url = None
+    # Only uploads whose title names the beat are recorded; a direct-search hit is
+    # just the first result that is not a tutorial, and the catalog is never searched past
+    confirmed = False
+
+    # For Beatstars beats, try some common producer names if we don't have one
+    if producer_name in GENERIC_PRODUCERS:
+        # Try searching with common variations of the beat name
+        # This is a workaround since Beatstars pages often don't show producer info.
+        # Producers the catalog knows for a beat of this name come first
+        common_searches = [f"{beat_name} {producer}" for producer in beat_catalog.producers_for_title(beat_name)[:2]]
+        common_searches += [
+            f"{beat_name} layton",  # Common producer name
+            f"{beat_name} instrumental",
+            f"{beat_name} beat"
+        ]
+
+        for search_term in common_searches:
+            logger.debug("Trying direct search: %s", search_term)
+            youtube_url = search_youtube_beat_simple(search_term, "direct")
+            if youtube_url:
+                logger.info("Found beat with direct search: %s -> %s", search_term, youtube_url)
+                break
+
+    # We have a producer name or the direct searches failed, use normal search
+    if not youtube_url:
+        youtube_url = search_youtube_beat(beat_name, producer_name)
+        confirmed = youtube_url is not None
+    if not youtube_url:
+        raise ResolveError(f'Could not find "{beat_name}" beat on YouTube. Please try searching manually or use a different link.')
+
+    logger.info("Beatstars beat found: '%s' by %s -> %s", beat_name, producer_name or 'Unknown Producer', youtube_url)
+    if metadata.get('beat_id'):
+        beat_catalog.put(metadata['beat_id'], beat_name, producer_name, youtube_url if confirmed else None)
+    return youtube_url
+
+# yt-dlp options per download platform
+YOUTUBE_DOWNLOAD_OPTS = {
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'referer': 'https://www.youtube.com/',
+    'http_headers': {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'en-us,en;q=0.5',
+        'Accept-Encoding': 'gzip, deflate',
+        'DNT': '1',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+    },
+}
+
+# YouTube Music - use YouTube settings but with Music domain
+YOUTUBE_MUSIC_DOWNLOAD_OPTS = {**YOUTUBE_DOWNLOAD_OPTS, 'referer': 'https://music.youtube.com/'}
+
+# SoundCloud-specific settings to get full tracks
+SOUNDCLOUD_DOWNLOAD_OPTS = {
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'referer': 'https://soundcloud.com/',
+    'http_headers': {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'en-us,en;q=0.5',
+        'Accept-Encoding': 'gzip, deflate',
+        'DNT': '1',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+        'Sec-Fetch-Dest': 'document',
+        'Sec-Fetch-Mode': 'navigate',
+        'Sec-Fetch-Site': 'none',
+        'Cache-Control': 'max-age=0',
+    },
+    # Additional SoundCloud options
+    'extractor_args': {
+        'soundcloud': {
+            'client_id': None,  # Let yt-dlp find the best client_id
+        }
+    }
+}
+
+# Supported sources, matched in registration order (YouTube Music before YouTube)
+register(Resolver('youtube_music', host_pattern('music.youtube.com'), 'youtube',
+                  canonicalize=canonical_youtube_music, download_opts=YOUTUBE_MUSIC_DOWNLOAD_OPTS))
+register(Resolver('youtube', f"{host_pattern('youtube.com')}|{host_pattern('youtu.be')}", 'youtube',
+                  canonicalize=canonical_youtube, download_opts=YOUTUBE_DOWNLOAD_OPTS))
+register(Resolver('soundcloud', host_pattern('soundcloud.com'), 'soundcloud',
+                  canonicalize=canonical_soundcloud, download_opts=SOUNDCLOUD_DOWNLOAD_OPTS))
+register(Resolver('spotify', host_pattern('spotify.com'), 'spotify', canonicalize=canonical_spotify,
+                  fetch_metadata=fetch_spotify_metadata, map_to_youtube=map_spotify_to_youtube))
+register(Resolver('beatstars', host_pattern('beatstars.com'), 'beatstars', canonicalize=canonical_beatstars,
+                  fetch_metadata=fetch_beatstars_metadata, map_to_youtube=map_beatstars_to_youtube))
+
+def conversion_response(filename, title, name):
+    """JSON body returned for a finished conversion"""
+    return {
+        'success': True,
+        'filename': filename,
+        'title': title,
+        'download_name': name,
+        'download_url': f'/download/{filename}'
+    }
+
+def outputs_response(title, outputs):
+    """Conversion body listing every output format; the first one is also reported at the top level"""
+    first = outputs[0]
+    response = conversion_response(first['filename'], title, first['download_name'])
+    response['outputs'] = [{**output, 'download_url': f"/download/{output['filename']}"} for output in outputs]
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/convert', methods=['POST'])
-def convert_video():
+class ConversionError(Exception):
+    """A failed conversion with the message and HTTP status to report"""
+
+    def __init__(self, message, status=500, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+def conversion_error(e):
+    """Map an exception raised during a conversion to the error shown to the user"""
+    if isinstance(e, ConversionError):
+        return e
+    if isinstance(e, UpstreamThrottled):
+        # Upstream is backing off: fail fast instead of deepening the throttling
+        return ConversionError('Too many requests. Please wait a few minutes before trying again.', 503, e.retry_after)
+    if isinstance(e, ResolveError):
+        return ConversionError(str(e), 400)
+    if isinstance(e, JobCancelled):
+        return ConversionError('The conversion was cancelled.', 409)
+    if isinstance(e, SchedulerBusy):
+        return ConversionError('The server is busy with other conversions. Please try again in a minute.', 503, e.retry_after)
+    if isinstance(e, PipelineError) and ('memory' in str(e).lower() or 'MemoryError' in str(e)):
+        return ConversionError('This content is too long to convert on this server.', 413)
+    if isinstance(e, InsufficientStorage):
+        if e.retry_after is None:
+            return ConversionError('This content is too long to convert on this server.', 413)
+        # Deferred as long as is reasonable for a waiting request; running jobs will free space
+        return ConversionError('The server is busy with other conversions. Please try again in a minute.', 503, e.retry_after)
+
+    error_msg = str(e)
+    if 'Requested format is not available' in error_msg:
+        return ConversionError('The requested audio format is not available for this video. This might be due to regional restrictions or the video being unavailable.')
+    elif 'HTTP Error 403' in error_msg or 'Forbidden' in error_msg:
+        return ConversionError('The platform blocked the request. Try again in a few minutes or try a different link.')
+    elif 'HTTP Error 429' in error_msg:
+        return ConversionError('Too many requests. Please wait a few minutes before trying again.')
+    elif 'Video unavailable' in error_msg or 'Private video' in error_msg:
+        return ConversionError('This content is unavailable, private, or restricted.')
+    elif 'Sign in to confirm' in error_msg or 'age-restricted' in error_msg:
+        return ConversionError('This content is age-restricted. Please sign in to the platform first and try again.')
+    else:
+        return ConversionError(f'An error occurred: {error_msg}')
+
+def prepare_conversion(data):
+    """Validate a /convert request body and describe the conversion job"""
+    url = (data.get('url') or '').strip()
+    if not url:
+        raise ConversionError('Please provide a URL', 400)
+
+    # Validate URL (YouTube, YouTube Music, SoundCloud, Spotify, or Beatstars)
+    resolver = find_resolver(url)
+    if resolver is None:
+        raise ConversionError('Please provide a valid YouTube, YouTube Music, SoundCloud, Spotify, or Beatstars URL', 400)
+    if resolver.name == 'spotify' and spotify_collection(url):
+        raise ConversionError('This is a Spotify album or playlist. Convert its tracks with POST /playlist.', 400)
+    normalize, formats = parse_conversion_options(data)
+
+    # Clients may name the job up front to poll GET /jobs/<id> while it runs (see claim_job)
+    job_id = data.get('job_id') or uuid.uuid4().hex
+    if not isinstance(job_id, str) or not re.fullmatch(r'[A-Za-z0-9-]{8,64}', job_id):
+        raise ConversionError('job_id must be 8-64 letters, digits or dashes', 400)
+
+    # Canonical form so the same track shared differently hits the same cache entry
+    return new_job(job_id, resolver, resolver.canonicalize(url), normalize, formats)
+
+def parse_conversion_options(data):
+    """Validated (normalize, formats) of a /convert or /playlist request body"""
+    # Optional EBU R128 loudness normalization: 'single' or 'two-pass'
+    normalize = parse_normalize_option(data.get('normalize'))
+    if normalize is None:
+        raise ConversionError('normalize must be one of: off, single, two-pass', 400)
+
+    # Output formats, e.g. ["mp3", "opus:96"]; all of them come from a single download
+    formats = parse_formats_option(data.get('formats'))
+    if formats is None:
+        raise ConversionError(f"formats must list up to 4 of {', '.join(OUTPUT_CODECS)}, "
+                              "optionally with a bitrate in kbps such as opus:96", 400)
+    return normalize, formats
+
+def claim_job(job_id, client_id):
+    """Record the client that submitted a job, the only one that may cancel it; an ID in use is refused"""
+    if not job_store.add('owner:' + job_id, client_id, JOB_TTL):
+        raise ConversionError('This job_id is already in use. Please choose another one.', 409)
+
+def new_job(job_id, resolver, source_url, normalize, formats=DEFAULT_FORMATS):
+    return {
+        'id': job_id,
+        'resolver': resolver,
+        'source_url': source_url,
+        'normalize': normalize,
+        'formats': list(formats),
+        'cache_key': (source_url, normalize),
+    }
+
+def output_path(timestamp, spec):
+    """Work folder path of one output of a multi-format job"""
+    codec, bitrate = split_format(spec)
+    return os.path.join(app.config['TEMP_FOLDER'], f"audio_{timestamp}_{codec}-{bitrate}.{OUTPUT_CODECS[codec]['ext']}")
+
+def audio_duration(path):
+    """Length of an MP3, Opus or M4A file in seconds, or None if it cannot be read"""
     try:
-        data = request.get_json()
-        url = data.get('url', '').strip()
+        import mutagen
+        return mutagen.File(path).info.length
+    except ImportError:
+        return None  # mutagen not available
+    except Exception:
+        return None
 
-        if not url:
-            return jsonify({'error': 'Please provide a URL'}), 400
+def cached_resolution(job):
+    """A recent resolution of the job's source URL, e.g. from /probe"""
+    return resolution_cache.get(job['source_url'])
+
+def resolve_job(job, metadata=None):
+    """Resolve the job's source URL, reusing a recent resolution"""
+    resolution = cached_resolution(job)
+    if resolution is None:
+        resolution = job['resolver'].resolve(job['source_url'], metadata)
+        resolution_cache.put(job['source_url'], resolution)
+    return resolution
+
+def extract_video_info(resolution):
+    """Unprocessed yt-dlp info for the download URL, cached briefly.
+
+    Formats are selected later by process_ie_result, so /probe, the Go+ check
+    and every format attempt share a single extraction.
+    """
+    url = resolution.download_url
+    info = info_cache.get(url)
+    if info is None:
+        opts = {**INFO_OPTS, **resolution.platform.download_opts}
+        with get_limiter(resolution.platform.upstream).guard(), yt_dlp.YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(url, download=False, process=False)
+        info_cache.put(url, info)
+    return info
+
+def cached_outputs(job):
+    """Every requested format of a previous conversion of the same URL, if all are still stored"""
+    entries = [cached_result(output_cache_key(job, spec)) for spec in job['formats']]
+    if not all(entries):
+        return None
+    return [{'format': spec, 'filename': entry['filename'], 'download_name': entry['download_name']}
+            for spec, entry in zip(job['formats'], entries)], entries[0]['title']
+
+def cached_response(job):
+    """Reuse a conversion of the same URL that is still on disk"""
+    cached = cached_outputs(job)
+    if cached:
+        outputs, title = cached
+        return outputs_response(title, outputs)
+    return None
 
-        # Validate URL (YouTube, YouTube Music, SoundCloud, Spotify, or Beatstars)
-        if not (('youtube.com' in url or 'youtu.be' in url or 'music.youtube.com' in url) or ('soundcloud.com' in url) or ('spotify.com' in url or 'open.spotify.com' in url) or ('beatstars.com' in url)):
-            return jsonify({'error': 'Please provide a valid YouTube, YouTube Music, SoundCloud, Spotify, or Beatstars URL'}), 400
-        
-        # Handle Spotify and Beatstars URLs by finding the track/beat on YouTube
-        original_url = url
-        is_spotify = 'spotify.com' in url or 'open.spotify.com' in url
-        is_beatstars = 'beatstars.com' in url
-
-        if is_spotify:
-            # Extract track info from Spotify
-            track_name, artist_name = extract_spotify_info(url)
-
-            if not track_name:
-                return jsonify({'error': 'Could not extract track information from Spotify URL. Please try a different Spotify link or use the direct YouTube/SoundCloud link instead.'}), 400
-
-            # Search for the track on YouTube
-            youtube_url = search_youtube_track(track_name, artist_name)
-
-            if not youtube_url:
-                return jsonify({'error': f'Could not find "{track_name}" by {artist_name or "Unknown Artist"} on YouTube. Please try searching manually or use a different link.'}), 400
-
-            # Use the YouTube URL instead
-            url = youtube_url
-            print(f"Spotify track found: '{track_name}' by {artist_name or 'Unknown Artist'} -> {youtube_url}")
-
-        elif is_beatstars:
-            # Extract beat info from Beatstars
-            beat_name, producer_name = extract_beatstars_info(url)
-
-            if not beat_name:
-                return jsonify({'error': 'Could not extract beat information from Beatstars URL. Please try a different Beatstars link or use the direct YouTube/SoundCloud link instead.'}), 400
-
-            # For Beatstars beats, try some common producer names if we don't have one
-            if producer_name in ["Beatstars Producer", "Unknown Producer"]:
-                # Try searching with common variations of the beat name
-                # This is a workaround since Beatstars pages often don't show producer info
-                common_searches = [
-                    f"{beat_name} layton",  # Common producer name
-                    f"{beat_name} instrumental",
-                    f"{beat_name} beat"
-                ]
-
-                for search_term in common_searches:
-                    print(f"Trying direct search: {search_term}")
-                    temp_youtube_url = search_youtube_beat_simple(search_term, "direct")
-                    if temp_youtube_url:
-                        url = temp_youtube_url
-                        print(f"Found beat with direct search: {search_term} -> {temp_youtube_url}")
-                        break
-                else:
-                    # If direct searches fail, use the normal beat search
-                    youtube_url = search_youtube_beat(beat_name, producer_name)
-                    if not youtube_url:
-                        return jsonify({'error': f'Could not find "{beat_name}" beat on YouTube. Please try searching manually or use a different link.'}), 400
-                    url = youtube_url
-            else:
-                # We have a producer name, use normal search
-                youtube_url = search_youtube_beat(beat_name, producer_name)
-                if not youtube_url:
-                    return jsonify({'error': f'Could not find "{beat_name}" beat on YouTube. Please try searching manually or use a different link.'}), 400
-                url = youtube_url
-
-            print(f"Beatstars beat found: '{beat_name}' by {producer_name or 'Unknown Producer'} -> {url}")
-
-        # Create unique filename
-        timestamp = str(int(time.time()))
-        output_filename = f"audio_{timestamp}.%(ext)s"
-        output_path = os.path.join(app.config['TEMP_FOLDER'], output_filename)
-        mp3_filename = f"audio_{timestamp}.mp3"
-        mp3_path = os.path.join(app.config['TEMP_FOLDER'], mp3_filename)
-
-        # Configure yt-dlp options based on platform
-        is_soundcloud = 'soundcloud.com' in url
-        is_youtube_music = 'music.youtube.com' in url
-
-        base_opts = {
-            'format': 'bestaudio[ext=m4a]/bestaudio[ext=mp4]/bestaudio/best',
-            'outtmpl': output_path,
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-            'quiet': True,
-            'no_warnings': True,
-            'extractor_retries': 3,
-            'cookiefile': None,
-            'nocheckcertificate': True,
-            'ignoreerrors': False,
-        }
+def check_client_quota(client_id):
+    """Protect the workers from a single client starting too many conversions"""
+    retry_after = client_quota.check(client_id)
+    if retry_after:
+        raise ConversionError('You are converting too quickly. Please wait a moment before trying again.', 429, retry_after)
+
+def source_fingerprint(source_info, ydl_opts, limiter):
+    """Fingerprint the start of the audio stream yt-dlp would download, or None.
+
+    The fetch is a request to the platform like the download, so it takes a
+    token from the platform's limiter, and at most FINGERPRINT_FETCHES run at once.
+    """
+    if not fingerprint_slots.acquire(timeout=FINGERPRINT_WAIT):
+        logger.info("All fingerprint fetches busy, converting without the dedupe check")
+        return None
+    try:
+        with yt_dlp.YoutubeDL({**ydl_opts, 'postprocessors': [], 'progress_hooks': []}) as ydl:
+            selected = ydl.process_ie_result(copy.deepcopy(source_info), download=False)
+        if not selected.get('url'):
+            return None
+        with limiter.guard():
+            return fingerprint_url(selected['url'], selected.get('http_headers'))
+    except Exception as e:
+        logger.warning("Error fingerprinting source: %s", e)
+        return None
+    finally:
+        fingerprint_slots.release()
 
-        # Platform-specific optimizations
-        if is_youtube_music:
-            # YouTube Music - use YouTube settings but with Music domain
-            platform_opts = {
-                'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'referer': 'https://music.youtube.com/',
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'en-us,en;q=0.5',
-                    'Accept-Encoding': 'gzip, deflate',
-                    'DNT': '1',
-                    'Connection': 'keep-alive',
-                    'Upgrade-Insecure-Requests': '1',
-                },
-            }
-        elif is_soundcloud:
-            # SoundCloud-specific settings to get full tracks
-            platform_opts = {
-                'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'referer': 'https://soundcloud.com/',
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'en-us,en;q=0.5',
-                    'Accept-Encoding': 'gzip, deflate',
-                    'DNT': '1',
-                    'Connection': 'keep-alive',
-                    'Upgrade-Insecure-Requests': '1',
-                    'Sec-Fetch-Dest': 'document',
-                    'Sec-Fetch-Mode': 'navigate',
-                    'Sec-Fetch-Site': 'none',
-                    'Cache-Control': 'max-age=0',
-                },
-                # Additional SoundCloud options
-                'extractor_args': {
-                    'soundcloud': {
-                        'client_id': None,  # Let yt-dlp find the best client_id
-                    }
-                }
-            }
-
-            # Try to get more info about the track to detect Go+ content
+def copy_converted_outputs(job, resolution, info, timestamp):
+    """Re-tagged copies of the outputs already converted from the job's download URL, or None if any is missing"""
+    entries = [cached_result(download_cache_key(job, resolution, spec)) for spec in job['formats']]
+    if not all(entries):
+        return None
+    outputs = [(spec, output_path(timestamp, spec)) for spec in job['formats']]
+    # The copies are the only files written
+    needed = estimate_job_bytes(info, output_bitrate(job['formats']), include_source=False)
+    with storage_accountant.reserve(job['id'], needed):
+        try:
+            for (_, path), entry in zip(outputs, entries):
+                artifact_store.fetch(entry['filename'], path)
+        except Exception as e:
+            logger.info("Stored outputs of %s are gone, converting again: %s", resolution.download_url, e)
+            discard_job_files(timestamp)
+            return None
+        # The stored files carry the tags of the request that converted them
+        tags = track_tags(info, resolution.metadata, job['source_url'])
+        tag_outputs(outputs, tags, fetch_job_cover(info, resolution))
+        logger.info("Serving %s from outputs already converted from %s", job['source_url'], resolution.download_url)
+        return outputs_response(entries[0]['title'], publish_outputs(job, resolution, outputs, tags, entries[0]['title']))
+
+def output_bitrate(formats):
+    """Bits per second of every requested output together"""
+    return sum(split_format(spec)[1] for spec in formats) * 1000
+
+def fetch_job_cover(info, resolution):
+    """Cover art for a job's outputs, fetched through the download platform's limiter"""
+    return fetch_cover(pick_thumbnail(info), get=functools.partial(limited_get, resolution.platform.upstream))
+
+def tag_outputs(outputs, tags, cover):
+    for _, path in outputs:
+        try:
+            write_tags(path, tags, cover)
+        except Exception as e:
+            logger.warning("Error writing tags: %s", e)
+
+def publish_outputs(job, resolution, outputs, tags, title):
+    """Move each file to the shared store, cache it under its own format and schedule its cleanup"""
+    published = []
+    for spec, path in outputs:
+        filename = os.path.basename(path)
+        name = download_name(tags, OUTPUT_CODECS[split_format(spec)[0]]['ext'])
+        stored = artifact_store.put(path, filename, mime_type(filename))
+        if artifact_store.local_path(filename) is not None:
+            storage_accountant.add_artifact(filename, stored)
+        cleanup_file(filename)
+        remember_result(output_cache_key(job, spec), filename, title, name)
+        remember_result(download_cache_key(job, resolution, spec), filename, title, name)
+        published.append({'format': spec, 'filename': filename, 'download_name': name})
+    return published
+
+def download_and_convert(job, resolution):
+    """Download the resolved URL with yt-dlp and encode it to each requested format, tagged"""
+    # Create unique filename; a resumed job keeps its name so yt-dlp finds its .part file
+    timestamp = job.setdefault('timestamp', f"{int(time.time())}_{uuid.uuid4().hex[:8]}")
+    # DELETE /jobs/<id> stops the download at its next hook and kills the FFmpeg working on these files
+    cancellation = cancellations.register(job['id'], f"audio_{timestamp}")
+    try:
+        return convert_source(job, resolution, cancellation)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        # A killed FFmpeg or an aborted download surfaces as an ordinary error
+        if cancellation.cancelled:
+            raise JobCancelled(job['id']) from e
+        raise
+    finally:
+        cancellations.unregister(cancellation)
+
+def convert_source(job, resolution, cancellation):
+    url = resolution.download_url
+    original_url = job['source_url']
+    normalize = job['normalize']
+    formats = job['formats']
+    timestamp = job['timestamp']
+    output_filename = f"audio_{timestamp}.%(ext)s"
+    download_path = os.path.join(app.config['TEMP_FOLDER'], output_filename)
+    mp3_path = os.path.join(app.config['TEMP_FOLDER'], f"audio_{timestamp}.mp3")
+
+    # The default MP3 goes through yt-dlp's own encode; any other set of
+    # formats is encoded by one FFmpeg run that decodes the source once. So
+    # are normalized jobs: yt-dlp copies an MP3 source (e.g. SoundCloud's
+    # http_mp3_128) instead of encoding it, which would skip the loudnorm filter
+    single_mp3 = formats == list(DEFAULT_FORMATS) and normalize == 'off'
+    outputs = [(formats[0], mp3_path)] if single_mp3 else [(spec, output_path(timestamp, spec)) for spec in formats]
+    primary_path = outputs[0][1]
+
+    # Configure yt-dlp options based on platform
+    is_soundcloud = resolution.platform.name == 'soundcloud'
+    is_youtube_music = resolution.platform.name == 'youtube_music'
+
+    base_opts = {
+        'outtmpl': download_path,
+        'postprocessors': [EXTRACT_AUDIO],
+        'quiet': True,
+        'no_warnings': True,
+        'extractor_retries': 3,
+        'cookiefile': None,
+        'nocheckcertificate': True,
+        'ignoreerrors': False,
+    }
+
+    # Platform-specific optimizations
+    platform_opts = resolution.platform.download_opts
+
+    ydl_opts = {**base_opts, **platform_opts}
+    limiter = get_limiter(resolution.platform.upstream)
+
+    # Normalization runs inside the encode; an uncached two-pass analysis
+    # has to be ordered before it, so those postprocessors are added per run
+    needs_analysis = apply_normalization(ydl_opts, normalize, original_url)
+    if not single_mp3:
+        ydl_opts['postprocessors'] = []
+
+    journal.record(job['id'], 'downloading', source_url=original_url, normalize=normalize,
+                   resolver=job['resolver'].name, platform=resolution.platform.name, download_url=url,
+                   metadata=resolution.metadata, timestamp=timestamp, formats=formats)
+
+    # One extraction, shared with /probe, serves format selection, the fingerprint and the download
+    source_info = extract_video_info(resolution)
+
+    # The same media reached through another URL (youtu.be, YouTube Music, a
+    # Spotify mapping) is served from copies of the stored files, tagged for this job
+    copied = copy_converted_outputs(job, resolution, source_info, timestamp)
+    if copied:
+        return copied
+
+    # Pick the stream once from the extracted format list; yt-dlp only chooses when the list is empty
+    target_kbps = max(split_format(spec)[1] for spec in formats)
+    ydl_opts['format'] = select_source_format(source_info, target_kbps) or 'bestaudio/best'
+
+    # DASH/HLS sources are fetched several fragments at a time; the platform's
+    # profile learns from each download's throughput how many is fastest
+    selected = next((f for f in source_info.get('formats') or [] if f.get('format_id') == ydl_opts['format']), None)
+    fragmented = selected is not None and is_fragmented(selected)
+    profile = get_download_profile(resolution.platform.upstream)
+    fragments = profile.choose_fragments() if fragmented else profile.fragments
+    ydl_opts.update(profile.options(fragments))
+
+    # Very long sources are streamed from a yt-dlp subprocess into FFmpeg, so
+    # neither the source file nor the finished outputs are read back in full
+    long_input = wants_long_input(source_info.get('duration'), selected) and shutil.which('ffmpeg') is not None
+
+    def on_progress(progress):
+        cancellation.check()
+        if progress['status'] == 'finished':
+            if fragmented:
+                profile.record(fragments, progress.get('downloaded_bytes') or progress.get('total_bytes') or 0,
+                               progress.get('elapsed') or 0)
+            # The encode starts next; after a crash it is re-run from the downloaded file
+            journal.record(job['id'], 'encoding')
+    ydl_opts['progress_hooks'] = [on_progress]
+    ydl_opts['postprocessor_hooks'] = [cancellation.check]
+
+    # Check for SoundCloud Go+ content
+    is_go_plus = False
+    if is_soundcloud and not is_youtube_music:
+        # If duration is exactly 30 seconds, it's likely a Go+ preview
+        if source_info.get('duration') == 30:
+            logger.warning("Track appears to be SoundCloud Go+ content (30s preview detected)")
+            is_go_plus = True
+
+    # The same recording reached through another URL (re-upload, YouTube Music,
+    # a Spotify mapping) is served from the file that is already converted
+    fingerprint = source_fingerprint(source_info, ydl_opts, limiter) if FINGERPRINT_DEDUPE else None
+    fingerprint_key = (normalize, *formats)
+    if fingerprint:
+        duplicate = fingerprint_index.find(
+            fingerprint, key=fingerprint_key,
+            accept=lambda entry: all(artifact_store.exists(output['filename']) for output in entry['outputs']))
+        if duplicate:
+            logger.info("Serving %s from matching recording %s", original_url, duplicate['outputs'][0]['filename'])
+            for output in duplicate['outputs']:
+                remember_result(output_cache_key(job, output['format']), output['filename'], duplicate['title'],
+                                output['download_name'])
+            return outputs_response(duplicate['title'], duplicate['outputs'])
+
+    # Wait for a conversion slot, then reserve disk space for the download and the encodes
+    # Cover art is fetched before waiting for a slot, so a slow thumbnail host never holds one.
+    # Streamed outputs keep no cover art, as adding it rewrites the file
+    cover = None if long_input else fetch_job_cover(source_info, resolution)
+
+    cost = job_cost(source_info.get('duration'), len(formats), needs_analysis)
+    # A streamed source never touches the disk, only its outputs do
+    needed = estimate_job_bytes(source_info, output_bitrate(formats), include_source=not long_input)
+    update_job(job, 'queued')
+    with scheduler.slot(job.get('client_id'), cost, abort=cancellation.check), \
+            storage_accountant.reserve(job['id'], needed):
+        update_job(job, 'downloading')
+
+        if long_input:
+            # Tags are written by the encode; a two-pass analysis would need a second download, so it runs single-pass
+            tags = track_tags(source_info, resolution.metadata, original_url)
+            audio_filter = loudnorm_filter() if needs_analysis else normalization_filter(ydl_opts)
+            info_path = os.path.join(app.config['TEMP_FOLDER'], f"audio_{timestamp}.info.json")
+            write_info(source_info, info_path)
             try:
-                with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as temp_ydl:
-                    temp_info = temp_ydl.extract_info(url, download=False)
-                    if temp_info and 'duration' in temp_info:
-                        track_duration = temp_info.get('duration', 0)
-                        # If duration is exactly 30 seconds, it's likely a Go+ preview
-                        if track_duration == 30:
-                            print(f"Warning: Track appears to be SoundCloud Go+ content (30s preview detected)")
-            except:
-                pass
+                with limiter.guard():
+                    download_peak, encode_peak = run_pipeline(
+                        download_command(info_path, selected['format_id'], fragments, profile.chunk_size),
+                        encode_command(outputs, audio_filter, tags))
+            finally:
+                os.remove(info_path)
+            cancellation.check()
+            logger.info("Streamed %ss source; peak memory %d MB download, %d MB encode",
+                        source_info.get('duration'), download_peak // (1024 * 1024), encode_peak // (1024 * 1024))
+            info = source_info
         else:
-            # YouTube-specific settings
-            platform_opts = {
-                'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'referer': 'https://www.youtube.com/',
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'en-us,en;q=0.5',
-                    'Accept-Encoding': 'gzip, deflate',
-                    'DNT': '1',
-                    'Connection': 'keep-alive',
-                    'Upgrade-Insecure-Requests': '1',
-                },
-            }
-
-        ydl_opts = {**base_opts, **platform_opts}
-
-        # Check for SoundCloud Go+ content
-        is_go_plus = False
-        if is_soundcloud and not is_youtube_music:
+            # Download and convert the selected stream from the already extracted info
+            with limiter.guard(), yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                if not single_mp3:
+                    add_multi_encode(ydl, original_url, outputs, analyse=needs_analysis)
+                info = ydl.process_ie_result(copy.deepcopy(source_info), download=True)
+        video_title = info.get('title', 'Unknown')
+
+        if single_mp3 and not os.path.exists(mp3_path):
+            # Try to find any audio file that might have been created
+            temp_dir = app.config['TEMP_FOLDER']
+            for file in os.listdir(temp_dir):
+                if file.startswith(f"audio_{timestamp}") and file.endswith(('.m4a', '.webm')):
+                    os.rename(os.path.join(temp_dir, file), mp3_path)
+                    break
+
+        if not all(os.path.exists(path) for _, path in outputs):
+            raise ConversionError('Conversion failed. The content might be unavailable, private, age-restricted, or temporarily blocked.')
+
+        # Check for a 30-second Go+ preview in the downloaded file (streamed sources are long by definition)
+        if is_soundcloud and not is_youtube_music and not long_input:
+            duration = audio_duration(primary_path)
+            if is_go_plus and duration is not None and duration <= 35:  # Allow some tolerance
+                raise ConversionError('This appears to be a SoundCloud Go+ track. Full tracks are only available to SoundCloud Go+ subscribers. Try accessing the track through the official SoundCloud website or app with a Go+ subscription, or look for a free version of this track.')
+            if duration is not None and duration <= 35:  # Very short track, likely Go+ preview
+                raise ConversionError('This track appears to be only 30 seconds long, which suggests it may be SoundCloud Go+ content. Full tracks are only available to SoundCloud Go+ subscribers. Try accessing the track through the official SoundCloud website or app with a Go+ subscription.')
+
+        # Tag every output from metadata already in memory; streamed outputs were tagged by the encode
+        if not long_input:
+            tags = track_tags(info, resolution.metadata, original_url)
+            tag_outputs(outputs, tags, cover)
+
+    published = publish_outputs(job, resolution, outputs, tags, video_title)
+    if fingerprint:
+        fingerprint_index.add(fingerprint, {'title': video_title, 'outputs': published}, key=fingerprint_key)
+
+    return outputs_response(video_title, published)
+
+def run_conversion(data, client_id):
+    """Full conversion pipeline for one /convert request body"""
+    try:
+        job = prepare_conversion(data)
+        claim_job(job['id'], client_id)
+    except Exception as e:
+        raise conversion_error(e)
+    job['client_id'] = client_id
+
+    with job_context(job['id']):
+        try:
+            cached = cached_response(job)
+            if cached:
+                return cached
+            check_client_quota(client_id)
+
+            # Spotify and Beatstars URLs are mapped to a YouTube upload of the track/beat
+            update_job(job, 'resolving')
+            resolution = resolve_job(job)
+            return finish_job(job, download_and_convert(job, resolution))
+        except Exception as e:
+            error = conversion_error(e)
+            fail_job(job, error)
+            raise error
+
+def finish_job(job, result):
+    result['job_id'] = job['id']
+    update_job(job, 'done', **result)
+    journal.record(job['id'], 'done')
+    return result
+
+def fail_job(job, error):
+    """Publish a job's failure; returns its final status, 'failed' or 'cancelled'"""
+    if job_store.get('cancel:' + job['id']) is not None:
+        status = 'cancelled'
+        update_job(job, status)
+    else:
+        status = 'failed'
+        update_job(job, status, error=str(error))
+    if 'timestamp' in job:
+        journal.record(job['id'], 'failed')
+        discard_job_files(job['timestamp'])
+    return status
+
+def prepare_playlist(data):
+    """Validate a /playlist request body: a Spotify album or playlist URL and the conversion options"""
+    url = (data.get('url') or '').strip()
+    resolver = find_resolver(url) if url else None
+    if resolver is None or resolver.name != 'spotify' or not spotify_collection(url):
+        raise ConversionError('Please provide a Spotify album or playlist URL', 400)
+    normalize, formats = parse_conversion_options(data)
+    return resolver, resolver.canonicalize(url), normalize, formats
+
+def run_playlist(data, client_id):
+    """Expand a Spotify album/playlist and convert its tracks in the background.
+
+    Returns the playlist's job record; every track is a job of its own, polled
+    with GET /jobs/<job_id> and downloaded like any other conversion.
+    """
+    try:
+        resolver, source_url, normalize, formats = prepare_playlist(data)
+        # Refused up front when the client is out of tokens; this token pays for the first track
+        check_client_quota(client_id)
+        name, tracks = extract_spotify_collection(source_url)
+    except Exception as e:
+        raise conversion_error(e)
+
+    tracks = tracks[:MAX_PLAYLIST_TRACKS]
+    jobs = []
+    for track in tracks:
+        job = new_job(uuid.uuid4().hex, resolver, track['url'], normalize, formats)
+        job['client_id'] = client_id
+        claim_job(job['id'], client_id)
+        update_job(job, 'queued')
+        jobs.append(job)
+    playlist = {
+        'id': uuid.uuid4().hex,
+        'status': 'running',
+        'source_url': source_url,
+        'title': name,
+        'tracks': [{'job_id': job['id'], 'title': track['title'], 'artist': track['artist'], 'status': 'queued'}
+                   for job, track in zip(jobs, tracks)],
+    }
+    claim_job(playlist['id'], client_id)
+    job_store.put('job:' + playlist['id'], playlist, JOB_TTL)
+    queue_playlist_tracks(client_id, [(playlist, job, track, i == 0) for i, (job, track) in enumerate(zip(jobs, tracks))])
+    return playlist
+
+def queue_playlist_tracks(client_id, entries):
+    """Queue tracks behind the client's earlier ones and start its workers, at most PLAYLIST_CLIENT_WORKERS"""
+    with playlist_queue_lock:
+        playlist_queues.setdefault(client_id, deque()).extend(entries)
+        running = playlist_workers.get(client_id, 0)
+        started = max(0, min(PLAYLIST_CLIENT_WORKERS - running, len(playlist_queues[client_id])))
+        playlist_workers[client_id] = running + started
+    for _ in range(started):
+        thread = threading.Thread(target=run_playlist_queue, args=(client_id,))
+        thread.daemon = True
+        thread.start()
+
+def run_playlist_queue(client_id):
+    # Each track is searched for and then converted under the client's scheduler
+    # share before the worker takes the next; workers exit once the queue is empty
+    while True:
+        with playlist_queue_lock:
+            queue = playlist_queues.get(client_id)
+            if not queue:
+                playlist_queues.pop(client_id, None)
+                playlist_workers[client_id] -= 1
+                if not playlist_workers[client_id]:
+                    del playlist_workers[client_id]
+                return
+            playlist, job, track, charged = queue.popleft()
+        resolution = resolve_playlist_track(playlist, job, track, charged)
+        if resolution is not None:
+            convert_playlist_track(playlist, job, resolution)
+
+def wait_for_client_quota(job):
+    """Take a quota token for a playlist track, waiting for one rather than failing"""
+    while True:
+        retry_after = client_quota.check(job['client_id'])
+        if not retry_after:
+            return
+        if job_store.get('cancel:' + job['id']) is not None:
+            raise JobCancelled(job['id'])
+        time.sleep(retry_after)
+
+def resolve_playlist_track(playlist, job, track, charged=False):
+    """Find a playlist track on YouTube with the metadata from the collection page; None when done already"""
+    with job_context(job['id']):
+        try:
+            if job_store.get('cancel:' + job['id']) is not None:
+                raise JobCancelled(job['id'])
+            cached = cached_response(job)
+            if cached:
+                finish_job(job, cached)
+                finish_playlist_track(playlist, job, 'done')
+                return None
+            # Every track costs a token, like a /convert request
+            if not charged:
+                wait_for_client_quota(job)
+            update_job(job, 'resolving')
+            metadata = {'title': track['title'], 'artist': track['artist'], 'duration': track['duration']}
+            return resolve_job(job, metadata)
+        except Exception as e:
+            finish_playlist_track(playlist, job, fail_job(job, conversion_error(e)))
+            return None
+
+def convert_playlist_track(playlist, job, resolution):
+    with job_context(job['id']):
+        try:
+            finish_job(job, download_and_convert(job, resolution))
+            status = 'done'
+        except Exception as e:
+            status = fail_job(job, conversion_error(e))
+    finish_playlist_track(playlist, job, status)
+
+def finish_playlist_track(playlist, job, status):
+    """Record a track's final status in its playlist's job record"""
+    with playlist_lock:
+        for track in playlist['tracks']:
+            if track['job_id'] == job['id']:
+                track['status'] = status
+        if all(track['status'] != 'queued' for track in playlist['tracks']):
+            playlist['status'] = 'done'
+        job_store.put('job:' + playlist['id'], playlist, JOB_TTL)
+
+def discard_job_files(timestamp):
+    """Delete a job's partial downloads and encodes from TEMP_FOLDER"""
+    for file in os.listdir(TEMP_FOLDER):
+        if file.startswith(f"audio_{timestamp}"):
             try:
-                with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as temp_ydl:
-                    temp_info = temp_ydl.extract_info(url, download=False)
-                    if temp_info and 'duration' in temp_info:
-                        track_duration = temp_info.get('duration', 0)
-                        # If duration is exactly 30 seconds, it's likely a Go+ preview
-                        if track_duration == 30:
-                            is_go_plus = True
-            except:
+                os.remove(os.path.join(TEMP_FOLDER, file))
+            except OSError:
                 pass
 
-        # Download and convert with fallback options
-        video_title = 'Unknown'
-        download_successful = False
-
-        # Try different format combinations
-        format_options = [
-            'bestaudio[ext=m4a]/bestaudio[ext=mp4]/bestaudio/best',
-            'bestaudio/best[height<=480]/best[height<=480]',  # Lower quality fallback
-            'best'  # Ultimate fallback
-        ]
-
-        for format_option in format_options:
+def restore_job(entry):
+    """Rebuild a journaled job and its resolution"""
+    job = new_job(entry['id'], get_resolver(entry['resolver']), entry['source_url'], entry['normalize'],
+                  entry.get('formats') or DEFAULT_FORMATS)
+    job['timestamp'] = entry['timestamp']
+    resolution = Resolution(job['resolver'], entry['source_url'], entry['download_url'],
+                            get_resolver(entry['platform']), entry['metadata'])
+    return job, resolution
+
+def recover_jobs():
+    """Resume jobs interrupted by a crash and delete scratch files nothing will resume"""
+    pending = journal.compact()
+    # Finished files kept here lost their cleanup timer with the old process, so they go too;
+    # newer ones in the shared artifact folder may still be timed by another process
+    resumable = tuple(f"audio_{entry['timestamp']}" for entry in pending if 'timestamp' in entry)
+    for folder in (TEMP_FOLDER, ARTIFACT_FOLDER):
+        for file in os.listdir(folder) if os.path.isdir(folder) else ():
+            if file.startswith('audio_') and not file.startswith(resumable):
+                path = os.path.join(folder, file)
+                try:
+                    if folder == TEMP_FOLDER or time.time() - os.stat(path).st_ctime > ARTIFACT_TTL:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    for entry in pending:
+        with job_context(entry['id']):
+            job = None
             try:
-                ydl_opts['format'] = format_option
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    # Get video info first
-                    info = ydl.extract_info(url, download=False)
-                    video_title = info.get('title', 'Unknown')
-
-                    # Download and convert
-                    ydl.download([url])
-
-                    # Check if output file was created
-                    if os.path.exists(mp3_path):
-                        # Check if it's a 30-second Go+ preview
-                        try:
-                            import mutagen
-                            from mutagen.mp3 import MP3
-                            audio = MP3(mp3_path)
-                            duration = audio.info.length
-                            if duration <= 35 and is_go_plus:  # Allow some tolerance
-                                return jsonify({'error': 'This appears to be a SoundCloud Go+ track. Full tracks are only available to SoundCloud Go+ subscribers. Try accessing the track through the official SoundCloud website or app with a Go+ subscription, or look for a free version of this track.'}), 500
-                        except ImportError:
-                            # mutagen not available, skip duration check
-                            pass
-                        except Exception:
-                            # Other errors, continue anyway
-                            pass
-
-                        download_successful = True
-                        break
-                    else:
-                        # Try to find any audio file that might have been created
-                        temp_dir = app.config['TEMP_FOLDER']
-                        for file in os.listdir(temp_dir):
-                            if file.startswith(f"audio_{timestamp}") and file.endswith(('.mp3', '.m4a', '.webm')):
-                                # Rename to mp3 if needed
-                                old_path = os.path.join(temp_dir, file)
-                                if not file.endswith('.mp3'):
-                                    os.rename(old_path, mp3_path)
-                                download_successful = True
-                                break
-
+                # Downloads continue from their .part file, interrupted encodes re-run
+                job, resolution = restore_job(entry)
+                logger.info("Resuming interrupted job (%s)", entry['stage'])
+                finish_job(job, download_and_convert(job, resolution))
             except Exception as e:
-                error_msg = str(e)
-                if 'Requested format is not available' in error_msg:
-                    continue  # Try next format option
+                if job is None:
+                    journal.record(entry['id'], 'failed')
                 else:
-                    raise e  # Re-raise non-format related errors
+                    fail_job(job, conversion_error(e))
 
-        if not download_successful:
-            return jsonify({'error': 'Unable to find a compatible audio format for this content. The content might be restricted or unavailable.'}), 500
-
-        if not os.path.exists(mp3_path):
-            return jsonify({'error': 'Conversion failed. The content might be unavailable, private, age-restricted, or temporarily blocked.'}), 500
+def start_recovery():
+    """Resume interrupted jobs in the background, if this process owns the work folder"""
+    if work_lock is None:
+        return
+    thread = threading.Thread(target=recover_jobs)
+    thread.daemon = True
+    thread.start()
 
-        # Final check for Go+ content in the downloaded file
-        if is_soundcloud and not is_youtube_music:
-            try:
-                import mutagen
-                from mutagen.mp3 import MP3
-                audio = MP3(mp3_path)
-                duration = audio.info.length
-                if duration <= 35:  # Very short track, likely Go+ preview
-                    return jsonify({'error': 'This track appears to be only 30 seconds long, which suggests it may be SoundCloud Go+ content. Full tracks are only available to SoundCloud Go+ subscribers. Try accessing the track through the official SoundCloud website or app with a Go+ subscription.'}), 500
-            except ImportError:
-                pass  # mutagen not available
-            except Exception:
-                pass  # Other errors, continue
-        
-        # Schedule file cleanup
-        cleanup_file(mp3_path)
-        
-        return jsonify({
-            'success': True,
-            'filename': mp3_filename,
-            'title': video_title,
-            'download_url': f'/download/{mp3_filename}'
-        })
-        
+def probe_response(job, resolution, info):
+    """Preview of what /convert will produce"""
+    tags = track_tags(info, resolution.metadata, job['source_url'])
+    return {
+        'success': True,
+        'title': tags['title'],
+        'artist': tags['artist'],
+        'duration': info.get('duration'),
+        'thumbnail': pick_thumbnail(info),
+        'source': job['resolver'].name,
+        'converted': cached_outputs(job) is not None,
+    }
+
+def run_probe(data, client_id):
+    """Resolve a pasted URL ahead of /convert, warming the resolution and info caches"""
+    try:
+        job = prepare_conversion(data)
+        retry_after = probe_quota.check(client_id)
+        if retry_after:
+            raise ConversionError('Too many previews. Please wait a moment.', 429, retry_after)
+        resolution = resolve_job(job)
+        return probe_response(job, resolution, extract_video_info(resolution))
     except Exception as e:
-        error_msg = str(e)
-        if 'Requested format is not available' in error_msg:
-            return jsonify({'error': 'The requested audio format is not available for this video. This might be due to regional restrictions or the video being unavailable.'}), 500
-        elif 'HTTP Error 403' in error_msg or 'Forbidden' in error_msg:
-            return jsonify({'error': 'The platform blocked the request. Try again in a few minutes or try a different link.'}), 500
-        elif 'HTTP Error 429' in error_msg:
-            return jsonify({'error': 'Too many requests. Please wait a few minutes before trying again.'}), 500
-        elif 'Video unavailable' in error_msg or 'Private video' in error_msg:
-            return jsonify({'error': 'This content is unavailable, private, or restricted.'}), 500
-        elif 'Sign in to confirm' in error_msg or 'age-restricted' in error_msg:
-            return jsonify({'error': 'This content is age-restricted. Please sign in to the platform first and try again.'}), 500
-        else:
-            return jsonify({'error': f'An error occurred: {error_msg}'}), 500
+        raise conversion_error(e)
+
+def error_response(error):
+    response = jsonify({'error': str(error)})
+    if error.retry_after:
+        response.headers['Retry-After'] = str(int(error.retry_after) + 1)
+    return response, error.status
+
+@app.route('/convert', methods=['POST'])
+def convert_video():
+    try:
+        return jsonify(run_conversion(request.get_json() or {}, request.remote_addr))
+    except ConversionError as e:
+        return error_response(e)
+
+@app.route('/playlist', methods=['POST'])
+def convert_playlist():
+    try:
+        return jsonify(run_playlist(request.get_json() or {}, request.remote_addr)), 202
+    except ConversionError as e:
+        return error_response(e)
+
+@app.route('/probe', methods=['POST'])
+def probe_url():
+    try:
+        return jsonify(run_probe(request.get_json() or {}, request.remote_addr))
+    except ConversionError as e:
+        return error_response(e)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_store.get('job:' + job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job)
+
+def cancel_job(job_id):
+    """Flag a job as cancelled for every node, and stop it now if it runs in this process"""
+    job_store.put('cancel:' + job_id, True, JOB_TTL)
+    cancellations.cancel(job_id)
+
+def is_job_owner(job_id, client_id):
+    return client_id is not None and job_store.get('owner:' + job_id) == client_id
+
+def cancel_own_job(job_id, client_id):
+    """cancel_job if the client submitted the job; returns whether it did"""
+    if not is_job_owner(job_id, client_id):
+        return False
+    cancel_job(job_id)
+    return True
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    job = job_store.get('job:' + job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    if not is_job_owner(job_id, request.remote_addr):
+        return jsonify({'error': 'Only the client that started a job can cancel it'}), 403
+    if job['status'] in ('done', 'failed', 'cancelled'):
+        return jsonify({'error': f"Job already {job['status']}"}), 409
+    # A playlist stops every track that has not finished
+    for track in job.get('tracks', []):
+        if track['status'] == 'queued':
+            cancel_job(track['job_id'])
+    cancel_job(job_id)
+    return jsonify({'id': job_id, 'status': 'cancelling'}), 202
+
+# Names of converted files, the only ones /download serves
+ARTIFACT_NAME = re.compile(r'audio_[A-Za-z0-9_-]+\.(?:' + '|'.join(codec['ext'] for codec in OUTPUT_CODECS.values()) + ')')
+
+def is_artifact_name(filename):
+    return ARTIFACT_NAME.fullmatch(filename) is not None
+
+def download_name_for(filename):
+    """Browser download name for an artifact, named after the track's tags"""
+    entry = job_store.get('artifact:' + filename)
+    if entry:
+        return entry['download_name']
+    stem, ext = os.path.splitext(filename)
+    return stem.replace('audio_', '') + ext
 
 @app.route('/download/<filename>')
 def download_file(filename):
+    if not is_artifact_name(filename):
+        return jsonify({'error': 'File not found or has been cleaned up'}), 404
     try:
-        file_path = os.path.join(app.config['TEMP_FOLDER'], filename)
-        
-        if not os.path.exists(file_path):
-            return jsonify({'error': 'File not found or has been cleaned up'}), 404
-        
         # Get safe filename for download
-        safe_filename = filename.replace('audio_', '').replace('.mp3', '') + '.mp3'
+        safe_filename = download_name_for(filename)
+
+        file_path = artifact_store.local_path(filename)
+        if file_path is None:
+            # Artifacts in object storage are fetched from the store directly
+            url = artifact_store.exists(filename) and artifact_store.url(filename, safe_filename)
+            if not url:
+                return jsonify({'error': 'File not found or has been cleaned up'}), 404
+            return redirect(url)
         
         return send_file(
             file_path,
             as_attachment=True,
             download_name=safe_filename,
-            mimetype='audio/mpeg'
+            mimetype=mime_type(filename)
         )
         
     except Exception as e:
         return jsonify({'error': f'Download failed: {str(e)}'}), 500
 
 if __name__ == '__main__':
-    # Cleanup temp folder on startup
-    if os.path.exists(TEMP_FOLDER):
-        shutil.rmtree(TEMP_FOLDER)
-    os.makedirs(TEMP_FOLDER, exist_ok=True)
-    
+    setup_logging()
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Serving process started by the debug reloader
+        start_recovery()
+    else:
+        # The reloader parent only watches files; let the serving process own the work folder
+        release_folder(work_lock)
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
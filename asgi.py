@@ -0,0 +1,350 @@
+"""ASGI serving mode: uvicorn asgi:application
+
+Conversions, Spotify/Beatstars scraping and file downloads are handled on the
+event loop, so idle and slow connections do not hold an OS thread each. The
+blocking yt-dlp searches, downloads and FFmpeg encodes run in thread pools.
+Every other route is served by the Flask app.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+
+import app as wsgi
+from audio import mime_type
+from logconfig import job_context, setup_logging
+from pagescan import beatstars_page_ready, read_page_async, spotify_embed_ready, spotify_page_ready
+from ratelimit import UpstreamThrottled, get_limiter
+
+# Concurrent yt-dlp searches
+SEARCH_WORKERS = int(os.environ.get('SEARCH_WORKERS', 8))
+
+CHUNK_SIZE = 256 * 1024
+
+# A thread for every conversion app.scheduler admits, running or waiting for a slot,
+# so none waits in this pool's FIFO queue and the scheduler decides which runs next
+conversion_pool = ThreadPoolExecutor(max_workers=wsgi.scheduler.capacity, thread_name_prefix='convert')
+search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix='search')
+flask_app = WsgiToAsgi(wsgi.app)
+
+# This module is the server's entry point, so it configures logging for the app
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Shared connection pool for the scrapers, opened on lifespan startup
+http_client = None
+
+
+def get_http_client():
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(follow_redirects=True, timeout=15,
+                                        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20))
+    return http_client
+
+
+async def in_pool(pool, fn, *args):
+    """run_in_executor that carries context variables, such as the job ID, into the thread"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(pool, context.run, fn, *args)
+
+
+async def limited_get(platform, url, headers, ready=None):
+    """Async GET through the platform's limiter, treating 429/403 as throttling; ready as in app.limited_get"""
+    limiter = get_limiter(platform)
+    await limiter.acquire_async()
+    client = get_http_client()
+    try:
+        if ready is None:
+            response = await client.get(url, headers=headers)
+        else:
+            response = await client.send(client.build_request('GET', url, headers=headers), stream=True)
+    except Exception:
+        # No answer at all counts against the upstream like throttling, so an unreachable one fails fast
+        limiter.record(True)
+        raise
+    limiter.record(response.status_code in (403, 429))
+    if ready is not None:
+        return await read_page_async(response, ready)
+    return response
+
+
+async def extract_spotify_info(spotify_url):
+    """Async counterpart of app.extract_spotify_info"""
+    try:
+        track_id = wsgi.spotify_track_id(spotify_url)
+        if track_id:
+            embed_url = f"https://open.spotify.com/embed/track/{track_id}"
+            response = await limited_get('spotify', embed_url, wsgi.SPOTIFY_EMBED_HEADERS, spotify_embed_ready)
+            if response.status_code == 200:
+                track_info = wsgi.parse_spotify_embed(response.content)
+                if track_info:
+                    return track_info
+
+            response = await limited_get('spotify', spotify_url, wsgi.SPOTIFY_PAGE_HEADERS, spotify_page_ready)
+            if response.status_code == 200 and len(response.content) > 1000:
+                track_info = wsgi.parse_spotify_page(response.content)
+                if track_info:
+                    return track_info
+
+        logger.warning("Could not extract track information from Spotify URL")
+        return None, None
+
+    except UpstreamThrottled:
+        raise
+    except Exception as e:
+        logger.warning("Error extracting Spotify info: %s", e)
+        return None, None
+
+
+async def extract_beatstars_info(beatstars_url):
+    """Async counterpart of app.extract_beatstars_info"""
+    try:
+        parsed = wsgi.parse_beatstars_url(beatstars_url)
+        if not parsed:
+            return None, None
+
+        response = await limited_get('beatstars', beatstars_url, wsgi.BEATSTARS_HEADERS, beatstars_page_ready)
+        if response.status_code == 200:
+            beat_info = wsgi.parse_beatstars_page(response.content)
+            if beat_info:
+                return beat_info
+
+        return wsgi.beatstars_slug_info(*parsed)
+
+    except UpstreamThrottled:
+        raise
+    except Exception as e:
+        logger.warning("Error extracting Beatstars info: %s", e)
+        return None, None
+
+
+async def fetch_spotify_metadata(spotify_url):
+    return wsgi.spotify_metadata(*await extract_spotify_info(spotify_url))
+
+
+async def fetch_beatstars_metadata(beatstars_url):
+    metadata = await asyncio.to_thread(wsgi.catalog_metadata, beatstars_url)
+    if metadata is None:
+        metadata = wsgi.beatstars_metadata(*await extract_beatstars_info(beatstars_url),
+                                           wsgi.beatstars_beat_id(beatstars_url))
+    return metadata
+
+
+# Resolvers whose metadata is scraped on the event loop instead of a thread
+ASYNC_METADATA_FETCHERS = {
+    'spotify': fetch_spotify_metadata,
+    'beatstars': fetch_beatstars_metadata,
+}
+
+
+async def resolve_job(job):
+    """Async counterpart of app.resolve_job"""
+    resolution = wsgi.cached_resolution(job)
+    if resolution is not None:
+        return resolution
+    metadata = None
+    fetch_metadata = ASYNC_METADATA_FETCHERS.get(job['resolver'].name)
+    if fetch_metadata:
+        metadata = await fetch_metadata(job['source_url'])
+    # The YouTube search for Spotify/Beatstars goes through yt-dlp, which blocks
+    return await in_pool(search_pool, wsgi.resolve_job, job, metadata)
+
+
+async def run_conversion(data, client_id):
+    """Async counterpart of app.run_conversion.
+
+    Job store calls block on SQLite or Redis, so they run in a thread like the conversion.
+    """
+    try:
+        job = wsgi.prepare_conversion(data)
+        await asyncio.to_thread(wsgi.claim_job, job['id'], client_id)
+    except Exception as e:
+        raise wsgi.conversion_error(e)
+    job['client_id'] = client_id
+
+    with job_context(job['id']):
+        try:
+            cached = await asyncio.to_thread(wsgi.cached_response, job)
+            if cached:
+                return cached
+            wsgi.check_client_quota(client_id)
+            await asyncio.to_thread(wsgi.update_job, job, 'resolving')
+            resolution = await resolve_job(job)
+            with wsgi.scheduler.admission():
+                result = await in_pool(conversion_pool, wsgi.download_and_convert, job, resolution)
+            return await asyncio.to_thread(wsgi.finish_job, job, result)
+        except Exception as e:
+            error = wsgi.conversion_error(e)
+            await asyncio.to_thread(wsgi.fail_job, job, error)
+            raise error
+
+
+async def run_probe(data, client_id):
+    """Async counterpart of app.run_probe"""
+    try:
+        job = wsgi.prepare_conversion(data)
+        retry_after = wsgi.probe_quota.check(client_id)
+        if retry_after:
+            raise wsgi.ConversionError('Too many previews. Please wait a moment.', 429, retry_after)
+        resolution = await resolve_job(job)
+        info = await in_pool(search_pool, wsgi.extract_video_info, resolution)
+        return await asyncio.to_thread(wsgi.probe_response, job, resolution, info)
+    except Exception as e:
+        raise wsgi.conversion_error(e)
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_json(send, data, status=200, headers=()):
+    body = json.dumps(data).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def cancel_on_disconnect(receive, job_id, client_id):
+    """Cancel the job once the client that started it goes away; a job ID another client owns is left alone"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            if await asyncio.to_thread(wsgi.cancel_own_job, job_id, client_id):
+                logger.info("Client disconnected, cancelled job %s", job_id)
+            return
+
+
+async def handle_json(scope, receive, send, handler, cancellable=False):
+    """Run an async JSON API handler, reporting ConversionError as JSON.
+
+    A cancellable handler's job is cancelled if the client disconnects before the response.
+    """
+    body = await read_body(receive)
+    if body is None:
+        return
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        data = {}
+    data = data if isinstance(data, dict) else {}
+    client = scope.get('client')
+    client_id = client[0] if client else None
+    watcher = None
+    if cancellable:
+        # Name the job here so the watcher knows what to cancel
+        data.setdefault('job_id', uuid.uuid4().hex)
+        if isinstance(data['job_id'], str):
+            watcher = asyncio.ensure_future(cancel_on_disconnect(receive, data['job_id'], client_id))
+    try:
+        result = await handler(data, client_id)
+        response = (result, 200, [])
+    except wsgi.ConversionError as e:
+        headers = [(b'retry-after', str(int(e.retry_after) + 1).encode())] if e.retry_after else []
+        response = ({'error': str(e)}, e.status, headers)
+    finally:
+        # The server reports a disconnect after every response; stop listening first
+        if watcher is not None:
+            watcher.cancel()
+    await send_json(send, *response)
+
+
+def content_disposition(name):
+    ascii_name = name.encode('ascii', 'ignore').decode().replace('"', '') or 'audio.mp3'
+    return f'attachment; filename="{ascii_name}"; filename*=UTF-8\'\'{quote(name)}'.encode('latin-1')
+
+
+async def download(scope, send, filename):
+    """Stream a converted file without tying up a thread for the whole transfer"""
+    if not wsgi.is_artifact_name(filename):
+        return await send_json(send, {'error': 'File not found or has been cleaned up'}, 404)
+    loop = asyncio.get_running_loop()
+    store = wsgi.artifact_store
+    file_path = store.local_path(filename)
+    if file_path is None:
+        # Artifacts in object storage are fetched from the store directly
+        exists = await loop.run_in_executor(search_pool, store.exists, filename)
+        url = exists and store.url(filename, await asyncio.to_thread(wsgi.download_name_for, filename))
+        if not url:
+            return await send_json(send, {'error': 'File not found or has been cleaned up'}, 404)
+        await send({'type': 'http.response.start', 'status': 302, 'headers': [(b'location', url.encode())]})
+        return await send({'type': 'http.response.body', 'body': b''})
+    try:
+        f = open(file_path, 'rb')
+    except OSError:
+        return await send_json(send, {'error': 'File not found or has been cleaned up'}, 404)
+
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        download_name = await asyncio.to_thread(wsgi.download_name_for, filename)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', mime_type(filename).encode()),
+                (b'content-length', str(size).encode()),
+                (b'content-disposition', content_disposition(download_name)),
+            ],
+        })
+        if scope['method'] == 'HEAD':
+            return await send({'type': 'http.response.body', 'body': b''})
+        while True:
+            chunk = await loop.run_in_executor(None, f.read, CHUNK_SIZE)
+            more = len(chunk) == CHUNK_SIZE
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': more})
+            if not more:
+                break
+
+
+async def lifespan(receive, send):
+    global http_client
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            get_http_client()
+            wsgi.start_recovery()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if http_client is not None:
+                await http_client.aclose()
+                http_client = None
+            conversion_pool.shutdown(wait=False)
+            search_pool.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http':
+        path, method = scope['path'], scope['method']
+        if path == '/convert' and method == 'POST':
+            return await handle_json(scope, receive, send, run_conversion, cancellable=True)
+        if path == '/probe' and method == 'POST':
+            return await handle_json(scope, receive, send, run_probe)
+        if path.startswith('/download/') and method in ('GET', 'HEAD'):
+            return await download(scope, send, path[len('/download/'):])
+    return await flask_app(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:application', host='0.0.0.0', port=5000)
@@ -0,0 +1,244 @@
+import json
+import logging
+import re
+import subprocess
+
+from yt_dlp.postprocessor.common import PostProcessor
+from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+
+from cache import LRUCache
+
+# EBU R128 targets: integrated loudness, true peak and loudness range
+LOUDNESS_TARGET = {'I': -16.0, 'TP': -1.5, 'LRA': 11.0}
+
+# loudnorm works at 192kHz internally, so resample for the MP3 encoder
+OUTPUT_SAMPLE_RATE = '44100'
+
+NORMALIZE_MODES = ('off', 'single', 'two-pass')
+
+# Where the loudnorm arguments are kept in the YoutubeDL params, for the encode
+# to read with normalization_filter when it runs
+EXTRACT_AUDIO_ARGS_KEY = 'extractaudio+ffmpeg_o'
+
+# Output codecs a request may ask for: FFmpeg encoder, file extension, MIME
+# type, default bitrate in kbps and the sample rate used after loudnorm
+OUTPUT_CODECS = {
+    'mp3': {'encoder': 'libmp3lame', 'ext': 'mp3', 'mime': 'audio/mpeg', 'bitrate': 192, 'sample_rate': OUTPUT_SAMPLE_RATE},
+    'opus': {'encoder': 'libopus', 'ext': 'opus', 'mime': 'audio/ogg', 'bitrate': 128, 'sample_rate': '48000'},
+    'aac': {'encoder': 'aac', 'ext': 'm4a', 'mime': 'audio/mp4', 'bitrate': 192, 'sample_rate': OUTPUT_SAMPLE_RATE},
+}
+DEFAULT_FORMATS = ('mp3:192',)
+MAX_OUTPUT_FORMATS = 4
+MIN_BITRATE, MAX_BITRATE = 32, 320  # kbps
+
+# Download protocols that are a single HTTP request rather than DASH/HLS fragments
+DIRECT_PROTOCOLS = ('http', 'https')
+
+# Measured loudness per source URL
+measured_loudness = LRUCache(1000)
+
+logger = logging.getLogger(__name__)
+
+
+def parse_normalize_option(value):
+    """Map the request's normalize option to a mode, or None if invalid"""
+    if value in (None, False, ''):
+        return 'off'
+    if value is True:
+        return 'single'
+    return value if value in NORMALIZE_MODES else None
+
+
+def parse_formats_option(value):
+    """Map the request's formats option ('mp3,opus:96' or a list) to 'codec:kbps' specs, or None if invalid"""
+    if value in (None, '', []):
+        return list(DEFAULT_FORMATS)
+    items = value.split(',') if isinstance(value, str) else value
+    if not isinstance(items, list):
+        return None
+    formats = []
+    for item in items:
+        if not isinstance(item, str):
+            return None
+        codec, _, bitrate = item.strip().lower().partition(':')
+        if codec not in OUTPUT_CODECS:
+            return None
+        if not bitrate:
+            bitrate = OUTPUT_CODECS[codec]['bitrate']
+        elif not bitrate.isdigit() or not MIN_BITRATE <= int(bitrate) <= MAX_BITRATE:
+            return None
+        spec = f'{codec}:{int(bitrate)}'
+        if spec not in formats:
+            formats.append(spec)
+    return formats if 0 < len(formats) <= MAX_OUTPUT_FORMATS else None
+
+
+def split_format(spec):
+    """'opus:96' -> ('opus', 96)"""
+    codec, bitrate = spec.split(':')
+    return codec, int(bitrate)
+
+
+def mime_type(filename):
+    """MIME type of an output file, by extension"""
+    ext = filename.rsplit('.', 1)[-1].lower()
+    return next((c['mime'] for c in OUTPUT_CODECS.values() if c['ext'] == ext), 'audio/mpeg')
+
+
+def stream_bitrate(fmt):
+    """Audio bitrate of a listed format in kbps, or None if unknown"""
+    return fmt.get('abr') or (fmt.get('tbr') if fmt.get('vcodec') == 'none' else None)
+
+
+def is_fragmented(fmt):
+    """Whether a listed format downloads as DASH/HLS fragments rather than one HTTP request"""
+    return fmt.get('protocol', 'https') not in DIRECT_PROTOCOLS
+
+
+def select_source_format(info, target_kbps):
+    """format_id of the stream to download, chosen once from the extracted format list.
+
+    The smallest audio-only stream whose bitrate reaches the best requested
+    output bitrate wins, direct HTTP before fragmented DASH/HLS; when none does,
+    the highest-bitrate audio-only stream. Muxed video is only used when no
+    audio-only stream exists. Returns None when the list has nothing to choose
+    from, leaving the choice to yt-dlp.
+    """
+    formats = [f for f in info.get('formats') or [] if f.get('format_id') and f.get('acodec') != 'none']
+    audio_only = [f for f in formats if f.get('vcodec') == 'none']
+    if not audio_only:
+        # Only muxed streams: the smallest one that still has audio
+        muxed = [f for f in formats if f.get('acodec')]
+        return min(muxed, key=lambda f: f.get('tbr') or float('inf'))['format_id'] if muxed else None
+
+    def size(f):
+        estimate = (stream_bitrate(f) or float('inf')) * 125 * (info.get('duration') or 1)
+        return f.get('filesize') or f.get('filesize_approx') or estimate
+
+    good_enough = [f for f in audio_only if (stream_bitrate(f) or 0) >= target_kbps]
+    if good_enough:
+        return min(good_enough, key=lambda f: (is_fragmented(f), size(f)))['format_id']
+    best = max(stream_bitrate(f) or 0 for f in audio_only)
+    return min((f for f in audio_only if (stream_bitrate(f) or 0) == best),
+               key=lambda f: (is_fragmented(f), size(f)))['format_id']
+
+
+def loudnorm_filter(measured=None):
+    """Build the loudnorm filter; with measurements it runs in linear two-pass mode"""
+    target = ':'.join(f'{k}={v}' for k, v in LOUDNESS_TARGET.items())
+    if not measured:
+        return f'loudnorm={target}'
+    return (f"loudnorm={target}:measured_I={measured['input_i']}:measured_TP={measured['input_tp']}"
+            f":measured_LRA={measured['input_lra']}:measured_thresh={measured['input_thresh']}"
+            f":offset={measured['target_offset']}:linear=true")
+
+
+def loudnorm_args(measured=None):
+    return ['-af', loudnorm_filter(measured), '-ar', OUTPUT_SAMPLE_RATE]
+
+
+def measure_loudness(path, ffmpeg='ffmpeg'):
+    """Run the loudnorm analysis pass and return its measurements, or None"""
+    cmd = [ffmpeg, '-hide_banner', '-nostats', '-i', path,
+           '-af', loudnorm_filter() + ':print_format=json', '-f', 'null', '-']
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+    except Exception as e:
+        logger.warning("Loudness analysis failed: %s", e)
+        return None
+    # The JSON summary is the last {...} block on stderr
+    match = re.search(r'\{[^{}]*\}\s*$', result.stderr)
+    if not match:
+        return None
+    try:
+        measured = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    # Silent input measures as -inf, which loudnorm cannot use
+    if any('inf' in str(measured.get(k, 'inf')) for k in ('input_i', 'input_tp', 'input_lra', 'input_thresh')):
+        return None
+    return measured
+
+
+def apply_normalization(ydl_opts, mode, source_key):
+    """Configure loudness normalization on the encode.
+
+    Returns True when a two-pass analysis still has to run on the downloaded
+    file (see add_multi_encode); otherwise the filter is already set.
+    Normalized jobs are always encoded by MultiEncodePP: FFmpegExtractAudio
+    copies a source already in the target codec, skipping the filter.
+    """
+    if mode == 'off':
+        return False
+    measured = measured_loudness.get(source_key) if mode == 'two-pass' else None
+    if mode == 'two-pass' and not measured:
+        return True
+    ydl_opts['postprocessor_args'] = {**ydl_opts.get('postprocessor_args', {}),
+                                      EXTRACT_AUDIO_ARGS_KEY: loudnorm_args(measured)}
+    return False
+
+
+class LoudnessAnalysisPP(PostProcessor):
+    """Measures the downloaded source and hands the result to the encode"""
+
+    def __init__(self, downloader, source_key):
+        PostProcessor.__init__(self, downloader)
+        self.source_key = source_key
+
+    def run(self, information):
+        measured = measure_loudness(information['filepath'])
+        if measured:
+            measured_loudness.put(self.source_key, measured)
+        # MultiEncodePP reads postprocessor_args when it runs, after us
+        pp_args = self._downloader.params.setdefault('postprocessor_args', {})
+        pp_args[EXTRACT_AUDIO_ARGS_KEY] = loudnorm_args(measured)
+        return [], information
+
+
+def normalization_filter(params):
+    """The loudnorm filter apply_normalization/LoudnessAnalysisPP put into the encode's arguments, or None"""
+    args = (params.get('postprocessor_args') or {}).get(EXTRACT_AUDIO_ARGS_KEY) or []
+    return args[args.index('-af') + 1] if '-af' in args else None
+
+
+def multi_encode_args(outputs, audio_filter=None):
+    """FFmpeg output arguments decoding the input once and splitting it to one encoder per output.
+
+    outputs is a list of (format spec, path); returns [(path, options)] for real_run_ffmpeg.
+    """
+    labels = ''.join(f'[out{i}]' for i in range(len(outputs)))
+    graph = f"[0:a]{audio_filter + ',' if audio_filter else ''}asplit={len(outputs)}{labels}"
+    path_opts = []
+    for i, (spec, path) in enumerate(outputs):
+        codec, bitrate = split_format(spec)
+        options = ['-filter_complex', graph] if i == 0 else []
+        options += ['-map', f'[out{i}]', '-c:a', OUTPUT_CODECS[codec]['encoder'], '-b:a', f'{bitrate}k']
+        if audio_filter:
+            # loudnorm resamples to 192kHz; bring each output back to a rate its encoder takes
+            options += ['-ar', OUTPUT_CODECS[codec]['sample_rate']]
+        path_opts.append((path, options))
+    return path_opts
+
+
+class MultiEncodePP(FFmpegPostProcessor):
+    """Encodes the downloaded source to several formats in a single FFmpeg run"""
+
+    def __init__(self, downloader, outputs):
+        FFmpegPostProcessor.__init__(self, downloader)
+        self.outputs = outputs  # [(format spec, path)]
+
+    def run(self, information):
+        source = information['filepath']
+        # Read at run time: a two-pass analysis ahead of us may just have set it
+        audio_filter = normalization_filter(self._downloader.params)
+        self.to_screen(f'Encoding {", ".join(spec for spec, _ in self.outputs)} from {source}')
+        self.real_run_ffmpeg([(source, [])], multi_encode_args(self.outputs, audio_filter))
+        information['filepath'] = self.outputs[0][1]
+        return [source], information
+
+
+def add_multi_encode(ydl, source_key, outputs, analyse=False):
+    """Add the multi-format encode, after a two-pass analysis if one is needed, to a YoutubeDL built without postprocessors"""
+    if analyse:
+        ydl.add_post_processor(LoudnessAnalysisPP(ydl, source_key), when='post_process')
+    ydl.add_post_processor(MultiEncodePP(ydl, outputs), when='post_process')
@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe, size-bounded least-recently-used cache with optional expiry"""
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            value, expires = self.entries[key]
+            if expires is not None and time.monotonic() >= expires:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class StaleWhileRevalidateCache:
+    """Size-bounded cache that serves stale values while refreshing them in the background.
+
+    Entries younger than soft_ttl are served as they are. Older entries are
+    still served, and the first request to see one starts a background reload;
+    only entries older than hard_ttl (or missing) make the caller wait for the
+    loader. Concurrent misses for the same key share one load. A failed reload
+    keeps the stale value until it reaches hard_ttl.
+
+    Empty values (e.g. a search that found nothing, which may be transient)
+    are kept for empty_ttl only, 0 not at all, and never replace a value.
+    """
+
+    def __init__(self, max_entries, soft_ttl, hard_ttl, empty_ttl=0, clock=time.monotonic, logger=None):
+        self.max_entries = max_entries
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.empty_ttl = empty_ttl
+        self.clock = clock
+        self.logger = logger
+        self.entries = OrderedDict()  # key -> (value, stored at)
+        self.loading = {}  # key -> Event set when its load finishes
+        self.lock = threading.Lock()
+
+    def _store(self, key, value):
+        with self.lock:
+            if not value:
+                current = self.entries.get(key)
+                if (current is not None and current[0]) or not self.empty_ttl:
+                    return
+            self.entries[key] = (value, self.clock())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _load(self, key, loader, done):
+        try:
+            value = loader()
+            self._store(key, value)
+            return value
+        finally:
+            with self.lock:
+                del self.loading[key]
+            done.set()
+
+    def _refresh(self, key, loader, done):
+        try:
+            self._load(key, loader, done)
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.warning("Background refresh of %r failed, serving the stale value: %s", key, e)
+
+    def get(self, key, loader):
+        """Return the value for key, calling loader() on a miss and refreshing it once stale"""
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                age = self.clock() - entry[1] if entry is not None else None
+                if entry is not None and age < (self.hard_ttl if entry[0] else self.empty_ttl):
+                    self.entries.move_to_end(key)
+                    if age >= self.soft_ttl and key not in self.loading:
+                        done = self.loading[key] = threading.Event()
+                        threading.Thread(target=self._refresh, args=(key, loader, done), daemon=True).start()
+                    return entry[0]
+                if entry is not None:
+                    del self.entries[key]
+                pending = self.loading.get(key)
+                if pending is None:
+                    done = self.loading[key] = threading.Event()
+                    break
+            # Someone else is loading it: wait, then look again (their load may have failed)
+            pending.wait()
+        return self._load(key, loader, done)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
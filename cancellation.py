@@ -0,0 +1,114 @@
+import logging
+import os
+import signal
+import threading
+import time
+
+# How often running jobs are checked for cancellations requested on another node
+POLL_INTERVAL = 1.0  # seconds
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been cancelled"""
+
+    def __init__(self, job_id):
+        super().__init__(f'Job {job_id} was cancelled')
+        self.job_id = job_id
+
+
+class Cancellation:
+    """Cancel flag of one running job; marker identifies its FFmpeg processes by file name"""
+
+    def __init__(self, job_id, marker):
+        self.job_id = job_id
+        self.marker = marker
+        self.event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self, *args):
+        """Raise JobCancelled if the job was cancelled; usable directly as a yt-dlp hook"""
+        if self.event.is_set():
+            raise JobCancelled(self.job_id)
+
+
+def terminate_processes(marker):
+    """SIGTERM this process's children whose command line contains marker; returns how many"""
+    if not os.path.isdir('/proc'):
+        return 0  # no procfs: downloads still stop at their next progress hook
+    marker = marker.encode()
+    terminated = 0
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                # The parent PID follows the state, after the parenthesised command name
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+            if parent != os.getpid():
+                continue
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                if marker not in f.read():
+                    continue
+            os.kill(int(pid), signal.SIGTERM)
+            terminated += 1
+        except (OSError, ValueError, IndexError):
+            continue  # exited meanwhile
+    return terminated
+
+
+class CancellationRegistry:
+    """Running jobs of this process, cancelled directly or through a flag any node can set"""
+
+    def __init__(self, is_requested=None, poll_interval=POLL_INTERVAL):
+        self.is_requested = is_requested  # job ID -> whether a cancel was requested (e.g. in the job store)
+        self.poll_interval = poll_interval
+        self.running = {}
+        self.lock = threading.Lock()
+        self.monitor = None
+
+    def register(self, job_id, marker):
+        cancellation = Cancellation(job_id, marker)
+        with self.lock:
+            self.running[job_id] = cancellation
+            if self.is_requested is not None and self.monitor is None:
+                self.monitor = threading.Thread(target=self._watch, daemon=True)
+                self.monitor.start()
+        # Cancelled while it was still being resolved
+        if self.is_requested is not None and self.is_requested(job_id):
+            self._trigger(cancellation)
+        return cancellation
+
+    def unregister(self, cancellation):
+        with self.lock:
+            if self.running.get(cancellation.job_id) is cancellation:
+                del self.running[cancellation.job_id]
+
+    def cancel(self, job_id):
+        """Stop a job running in this process; False if it does not run here"""
+        with self.lock:
+            cancellation = self.running.get(job_id)
+        if cancellation is None:
+            return False
+        self._trigger(cancellation)
+        return True
+
+    def _trigger(self, cancellation):
+        cancellation.event.set()
+        # Encodes have no progress hook to stop at
+        terminated = terminate_processes(cancellation.marker)
+        logger.info("Cancelling job %s (%d processes terminated)", cancellation.job_id, terminated)
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self.lock:
+                running = list(self.running.values())
+            for cancellation in running:
+                try:
+                    if not cancellation.cancelled and self.is_requested(cancellation.job_id):
+                        self._trigger(cancellation)
+                except Exception as e:
+                    logger.warning("Error checking for cancellation: %s", e)
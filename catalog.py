@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Local index of Beatstars producer catalogs: beat ID -> title, producer, YouTube upload
+
+Filled as beats are resolved, so a beat converted before (or imported in bulk)
+is answered without scraping its page or searching YouTube.
+
+python catalog.py import beats.jsonl        bulk-load {"beat_id", "title", "producer", "youtube_url"} lines
+python catalog.py export                    write the index as JSON lines
+python catalog.py refresh [--producer NAME] [--older-than DAYS]
+                                            resolve indexed beats again, e.g. after uploads moved
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import time
+
+from ranking import GENERIC_PRODUCERS
+
+# Entries older than this are looked up again by `refresh` without --older-than
+MAX_AGE = 30 * 24 * 3600  # seconds
+
+COLUMNS = ('beat_id', 'title', 'producer', 'youtube_url', 'updated')
+
+
+def known_producer(producer):
+    return producer if producer and producer not in GENERIC_PRODUCERS else None
+
+
+class BeatCatalog:
+    """Beat records in a SQLite file, merged so a scrape never loses what an earlier one found"""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS beats (beat_id TEXT PRIMARY KEY, title TEXT, producer TEXT, '
+                       'youtube_url TEXT, updated REAL NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS beats_producer ON beats (producer COLLATE NOCASE)')
+            db.execute('CREATE INDEX IF NOT EXISTS beats_title ON beats (title COLLATE NOCASE)')
+
+    def _connect(self):
+        # A connection per call keeps the catalog usable from any thread
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, beat_id):
+        with self._connect() as db:
+            row = db.execute('SELECT * FROM beats WHERE beat_id = ?', (str(beat_id),)).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def put(self, beat_id, title=None, producer=None, youtube_url=None):
+        """Record what is known about a beat; missing fields and generic producers keep the stored values"""
+        self.put_many([{'beat_id': beat_id, 'title': title, 'producer': producer, 'youtube_url': youtube_url}])
+
+    def put_many(self, beats):
+        rows = [(str(beat['beat_id']), beat.get('title'), known_producer(beat.get('producer')),
+                 beat.get('youtube_url'), time.time()) for beat in beats]
+        with self._connect() as db:
+            db.executemany('INSERT INTO beats VALUES (?, ?, ?, ?, ?) ON CONFLICT (beat_id) DO UPDATE SET '
+                           'title = COALESCE(excluded.title, title), producer = COALESCE(excluded.producer, producer), '
+                           'youtube_url = COALESCE(excluded.youtube_url, youtube_url), updated = excluded.updated', rows)
+        return len(rows)
+
+    def producers_for_title(self, title):
+        """Known producers of beats with this title, most recently seen first"""
+        with self._connect() as db:
+            rows = db.execute('SELECT producer FROM beats WHERE title = ? COLLATE NOCASE AND producer IS NOT NULL '
+                              'GROUP BY producer ORDER BY MAX(updated) DESC', (title,)).fetchall()
+        return [row[0] for row in rows]
+
+    def beats(self, producer=None, older_than=None):
+        """Indexed beats, optionally of one producer and last updated more than older_than seconds ago"""
+        query, params = 'SELECT * FROM beats WHERE 1', []
+        if producer:
+            query += ' AND producer = ? COLLATE NOCASE'
+            params.append(producer)
+        if older_than is not None:
+            query += ' AND updated <= ?'
+            params.append(time.time() - older_than)
+        with self._connect() as db:
+            return [dict(zip(COLUMNS, row)) for row in db.execute(query + ' ORDER BY beat_id', params)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('import', help='bulk-load beats from JSON lines')
+    load.add_argument('file', help="JSON lines file, or - for stdin")
+    commands.add_parser('export', help='write the index as JSON lines')
+    refresh = commands.add_parser('refresh', help='resolve indexed beats again')
+    refresh.add_argument('--producer', help="only this producer's beats")
+    refresh.add_argument('--older-than', type=float, default=MAX_AGE / 86400, help='days since the last update')
+    args = parser.parse_args()
+
+    import app  # opens the catalog the app uses
+    catalog = app.beat_catalog
+    if args.command == 'import':
+        f = sys.stdin if args.file == '-' else open(args.file)
+        with f:
+            print(f"{catalog.put_many(json.loads(line) for line in f if line.strip())} beats imported")
+    elif args.command == 'export':
+        for beat in catalog.beats():
+            print(json.dumps(beat))
+    else:
+        refreshed = failed = 0
+        for beat in catalog.beats(args.producer, args.older_than * 86400):
+            try:
+                app.refresh_catalog_beat(beat['beat_id'])
+                refreshed += 1
+            except Exception as e:
+                failed += 1
+                print(f"{beat['beat_id']}: {e}", file=sys.stderr)
+        print(f"{refreshed} beats refreshed, {failed} failed")
+
+
+if __name__ == '__main__':
+    main()
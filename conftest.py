@@ -0,0 +1,17 @@
+import os
+import shutil
+import tempfile
+
+_work_folder = None
+
+
+def pytest_configure(config):
+    """Point the app at a throwaway work folder and beat catalog before any test module imports it"""
+    global _work_folder
+    _work_folder = tempfile.mkdtemp(prefix='youtubetomp3-test-')
+    os.environ['WORK_FOLDER'] = _work_folder
+    os.environ['BEAT_CATALOG'] = os.path.join(_work_folder, 'beats.db')
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_work_folder, ignore_errors=True)
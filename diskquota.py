@@ -0,0 +1,123 @@
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Bytes that in-progress and finished jobs may hold in the work folder
+DISK_QUOTA = int(os.environ.get('DISK_QUOTA_MB', 2048)) * 1024 * 1024
+# Free space always left on the filesystem for everything else
+MIN_FREE_BYTES = int(os.environ.get('MIN_FREE_MB', 512)) * 1024 * 1024
+# How long a job waits for space to free up before it is rejected
+ADMISSION_WAIT = 20  # seconds
+
+# Size estimates: source audio bitrate when yt-dlp reports no size, MP3 output bitrate
+SOURCE_BITRATE = 160_000  # bits per second
+OUTPUT_BITRATE = 192_000  # bits per second
+UNKNOWN_DURATION = 600  # seconds assumed when the duration is unknown
+ESTIMATE_MARGIN = 1.2
+
+
+class InsufficientStorage(Exception):
+    """Raised when a job's estimated size does not fit in the quota or on the disk"""
+
+    def __init__(self, needed, retry_after=ADMISSION_WAIT):
+        super().__init__(f'Not enough temporary storage for this job ({needed // (1024 * 1024)} MB needed)')
+        self.needed = needed
+        self.retry_after = retry_after
+
+
+def estimate_job_bytes(info, output_bitrate=OUTPUT_BITRATE, include_source=True):
+    """Bytes a conversion will hold at its peak: the downloaded source plus its encoded outputs.
+
+    include_source=False for jobs that never write the source to disk, e.g. streamed long inputs.
+    """
+    info = info or {}
+    duration = info.get('duration') or UNKNOWN_DURATION
+    output = duration * output_bitrate / 8
+    if not include_source:
+        return int(output * ESTIMATE_MARGIN)
+    audio_sizes = [f.get('filesize') or f.get('filesize_approx') for f in info.get('formats') or []
+                   if f.get('vcodec') == 'none']
+    audio_sizes = [size for size in audio_sizes if size]
+    # The largest audio-only stream bounds whichever one gets picked
+    source = max(audio_sizes) if audio_sizes else info.get('filesize') or info.get('filesize_approx')
+    if not source:
+        source = duration * SOURCE_BITRATE / 8
+    return int((source + output) * ESTIMATE_MARGIN)
+
+
+class StorageAccountant:
+    """Tracks bytes reserved by running jobs and held by finished artifacts, and admits jobs that fit"""
+
+    def __init__(self, path, quota=DISK_QUOTA, min_free=MIN_FREE_BYTES, evict=None):
+        self.path = path
+        self.quota = quota
+        self.min_free = min_free
+        self.evict = evict  # callback deleting a finished artifact by name
+        self.reservations = {}
+        self.artifacts = OrderedDict()  # name -> bytes, oldest first
+        self.condition = threading.Condition()
+
+    def used(self):
+        return sum(self.reservations.values()) + sum(self.artifacts.values())
+
+    def _fits(self, needed):
+        free = shutil.disk_usage(self.path).free - sum(self.reservations.values())
+        return self.used() + needed <= self.quota and free - needed >= self.min_free
+
+    def _pick_victims(self, needed):
+        # Finished artifacts are only a cache; the oldest go before work is turned away
+        free = shutil.disk_usage(self.path).free - sum(self.reservations.values())
+        used = self.used()
+        victims, freed = [], 0
+        while self.artifacts and not (used - freed + needed <= self.quota and free + freed - needed >= self.min_free):
+            name, size = self.artifacts.popitem(last=False)
+            victims.append(name)
+            freed += size
+        return victims
+
+    def admit(self, job_id, needed, timeout=ADMISSION_WAIT):
+        """Reserve space for a job, waiting for running jobs to finish if necessary"""
+        if needed > self.quota:
+            raise InsufficientStorage(needed, retry_after=None)
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.condition:
+                victims = self._pick_victims(needed)
+                if not victims:
+                    if self._fits(needed):
+                        self.reservations[job_id] = needed
+                        return
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self.reservations:
+                        raise InsufficientStorage(needed)
+                    self.condition.wait(remaining)
+                    continue
+            # Deleted without the lock, so other jobs' accounting never waits on the disk or the job store
+            if self.evict:
+                for name in victims:
+                    self.evict(name)
+
+    def release(self, job_id):
+        with self.condition:
+            self.reservations.pop(job_id, None)
+            self.condition.notify_all()
+
+    @contextmanager
+    def reserve(self, job_id, needed, timeout=ADMISSION_WAIT):
+        self.admit(job_id, needed, timeout)
+        try:
+            yield
+        finally:
+            self.release(job_id)
+
+    def add_artifact(self, name, size):
+        with self.condition:
+            self.artifacts[name] = size
+
+    def remove_artifact(self, name):
+        with self.condition:
+            self.artifacts.pop(name, None)
+            self.condition.notify_all()
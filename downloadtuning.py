@@ -0,0 +1,88 @@
+import os
+import random
+import threading
+
+KB = 1024
+MB = 1024 * 1024
+
+# Download settings per upstream platform. fragments is the starting number of
+# DASH/HLS fragments fetched concurrently (auto-tuned within 1..max_fragments);
+# chunk_size splits direct HTTP downloads into range requests, which YouTube
+# serves at full speed where one long request gets throttled; buffer_size is
+# the initial read buffer (yt-dlp grows it while the transfer keeps up)
+DOWNLOAD_PROFILES = {
+    'youtube': {'fragments': 4, 'max_fragments': 16, 'chunk_size': 10 * MB, 'buffer_size': 256 * KB},
+    'soundcloud': {'fragments': 8, 'max_fragments': 16, 'chunk_size': None, 'buffer_size': 64 * KB},
+}
+DEFAULT_PROFILE = {'fragments': 4, 'max_fragments': 8, 'chunk_size': None, 'buffer_size': 64 * KB}
+
+# Adjust fragment concurrency from the throughput measured on real downloads
+AUTOTUNE = os.environ.get('DOWNLOAD_AUTOTUNE', '1').lower() not in ('0', 'false', 'no')
+# Share of fragmented downloads that try half or double the current concurrency
+EXPLORE_RATE = 0.2
+# Weight of the newest throughput sample in the running average per setting
+SMOOTHING = 0.3
+# Smaller downloads measure request latency rather than throughput
+MIN_SAMPLE_BYTES = 1 * MB
+# How much faster another setting must be before it becomes the default
+SWITCH_MARGIN = 1.1
+
+
+class DownloadProfile:
+    """yt-dlp download settings for one platform, with fragment concurrency tuned by hill climbing"""
+
+    def __init__(self, platform, fragments=4, max_fragments=16, chunk_size=None, buffer_size=None,
+                 autotune=AUTOTUNE, rng=None):
+        self.platform = platform
+        self.fragments = fragments
+        self.max_fragments = max_fragments
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+        self.autotune = autotune
+        self.rng = rng or random.Random()
+        self.throughput = {}  # fragments -> smoothed bytes per second
+        self.lock = threading.Lock()
+
+    def choose_fragments(self):
+        """Concurrency for the next fragmented download: usually the current best, sometimes a neighbour"""
+        with self.lock:
+            if self.autotune and self.rng.random() < EXPLORE_RATE:
+                neighbours = [n for n in (self.fragments // 2, self.fragments * 2)
+                              if 1 <= n <= self.max_fragments and n != self.fragments]
+                if neighbours:
+                    return self.rng.choice(neighbours)
+            return self.fragments
+
+    def options(self, fragments=None):
+        """yt-dlp options for a download using this profile"""
+        opts = {'concurrent_fragment_downloads': fragments or self.fragments}
+        if self.chunk_size:
+            opts['http_chunk_size'] = self.chunk_size
+        if self.buffer_size:
+            opts['buffersize'] = self.buffer_size
+        return opts
+
+    def record(self, fragments, size, seconds):
+        """Feed back a finished fragmented download; the fastest setting seen becomes the default"""
+        if not self.autotune or size < MIN_SAMPLE_BYTES or seconds <= 0:
+            return
+        rate = size / seconds
+        with self.lock:
+            previous = self.throughput.get(fragments)
+            self.throughput[fragments] = rate if previous is None else previous + SMOOTHING * (rate - previous)
+            current = self.throughput.get(self.fragments)
+            best = max(self.throughput, key=self.throughput.get)
+            if current is not None and self.throughput[best] > current * SWITCH_MARGIN:
+                self.fragments = best
+
+
+_profiles = {platform: DownloadProfile(platform, **settings) for platform, settings in DOWNLOAD_PROFILES.items()}
+_profiles_lock = threading.Lock()
+
+
+def get_profile(platform):
+    """Return the shared download profile for an upstream platform"""
+    with _profiles_lock:
+        if platform not in _profiles:
+            _profiles[platform] = DownloadProfile(platform, **DEFAULT_PROFILE)
+        return _profiles[platform]
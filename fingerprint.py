@@ -0,0 +1,123 @@
+import heapq
+import shutil
+import subprocess
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+try:
+    import chromaprint  # from pyacoustid, needs libchromaprint
+except ImportError:
+    chromaprint = None  # fingerprinting not available, every source is downloaded
+
+# Seconds of audio decoded from the start of a source to fingerprint it, and
+# seconds after which a fetch that has not finished (e.g. a stalled stream) is killed
+FINGERPRINT_SECONDS = 30
+FINGERPRINT_TIMEOUT = 60
+SAMPLE_RATE = 11025
+
+# Chromaprint frames are ~0.124s; allow the same audio to start up to ~10s apart
+MAX_OFFSET = 80
+MIN_OVERLAP = 40
+# Frames two fingerprints must share exactly before they are compared bit by bit,
+# and how many of the indexed fingerprints sharing the most frames are compared
+MIN_SHARED_FRAMES = 5
+MAX_CANDIDATES = 10
+# Fraction of matching bits above which two fingerprints are the same recording
+MATCH_THRESHOLD = 0.85
+
+
+def fingerprint_available():
+    return chromaprint is not None and shutil.which('ffmpeg') is not None
+
+
+def fingerprint_command(url, headers=None, seconds=FINGERPRINT_SECONDS):
+    """FFmpeg decoding the first seconds of a media URL or file to mono PCM on stdout"""
+    command = ['ffmpeg', '-nostdin', '-v', 'error']
+    if headers:
+        command += ['-headers', ''.join(f'{k}: {v}\r\n' for k, v in headers.items())]
+    # -t before -i stops reading the input after the fingerprinted span
+    return command + ['-t', str(seconds), '-i', url, '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 's16le', '-']
+
+
+def fingerprint_url(url, headers=None, seconds=FINGERPRINT_SECONDS, timeout=FINGERPRINT_TIMEOUT):
+    """Raw chromaprint of the first seconds of a media URL or file, or None if it fails or takes over timeout"""
+    fingerprinter = chromaprint.Fingerprinter()
+    fingerprinter.start(SAMPLE_RATE, 1)
+    with subprocess.Popen(fingerprint_command(url, headers, seconds), stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL) as process:
+        watchdog = threading.Timer(timeout, process.kill)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            for chunk in iter(lambda: process.stdout.read(64 * 1024), b''):
+                fingerprinter.feed(chunk)
+        finally:
+            watchdog.cancel()
+    if process.returncode != 0:
+        return None
+    fingerprint, _ = chromaprint.decode_fingerprint(fingerprinter.finish())
+    return fingerprint or None
+
+
+def similarity(a, b, max_offset=MAX_OFFSET):
+    """Best fraction of matching bits between two raw fingerprints over small time offsets"""
+    best = 0.0
+    for offset in range(-max_offset, max_offset + 1):
+        pairs = list(zip(a[offset:], b) if offset >= 0 else zip(a, b[-offset:]))
+        if len(pairs) < MIN_OVERLAP:
+            continue
+        errors = sum(bin((x ^ y) & 0xFFFFFFFF).count('1') for x, y in pairs)
+        best = max(best, 1 - errors / (32.0 * len(pairs)))
+    return best
+
+
+class FingerprintIndex:
+    """Bounded in-memory index of fingerprints, looked up through the frame values they share"""
+
+    def __init__(self, max_entries=2000, threshold=MATCH_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.entries = OrderedDict()  # entry id -> (key, fingerprint, value)
+        self.postings = defaultdict(set)  # frame value -> entry ids
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def add(self, fingerprint, value, key=None):
+        """Index a fingerprint; key separates variants (e.g. normalization) that must not be mixed"""
+        with self.lock:
+            entry_id = self.next_id
+            self.next_id += 1
+            self.entries[entry_id] = (key, fingerprint, value)
+            for frame in set(fingerprint):
+                self.postings[frame].add(entry_id)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def find(self, fingerprint, key=None, accept=None):
+        """Value of the best matching indexed fingerprint with the same key, or None.
+
+        accept filters out matches whose value is no longer usable (e.g. a deleted file).
+        """
+        with self.lock:
+            shared = Counter(entry_id for frame in set(fingerprint) for entry_id in self.postings.get(frame, ()))
+            # Other keys are dropped before the best are taken, so they cannot crowd out this key's match
+            eligible = [(count, entry_id) for entry_id, count in shared.items()
+                        if count >= MIN_SHARED_FRAMES and self.entries[entry_id][0] == key]
+            candidates = [self.entries[entry_id] for _, entry_id in heapq.nlargest(MAX_CANDIDATES, eligible)]
+        best, best_score = None, self.threshold
+        for _, indexed, value in candidates:
+            if accept is not None and not accept(value):
+                continue
+            score = similarity(indexed, fingerprint)
+            if score >= best_score:
+                best, best_score = value, score
+        return best
+
+    def _remove(self, entry_id):
+        _, fingerprint, _ = self.entries.pop(entry_id)
+        for frame in set(fingerprint):
+            ids = self.postings.get(frame)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self.postings[frame]
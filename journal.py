@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: folders cannot be locked, so the first process simply owns it
+
+# Stages after which a job needs no recovery
+FINAL_STAGES = ('done', 'failed')
+
+# Finished jobs after which the journal is rewritten without them
+COMPACT_AFTER = int(os.environ.get('JOURNAL_COMPACT_AFTER', 500))
+
+# A written record survives a crash of the process; fsync each one to also survive power loss
+FSYNC = os.environ.get('JOURNAL_FSYNC', '').lower() in ('1', 'true', 'yes')
+
+
+class JobJournal:
+    """Append-only log of job stages, replayed on startup to resume interrupted jobs"""
+
+    def __init__(self, path, compact_after=COMPACT_AFTER, fsync=FSYNC):
+        self.path = path
+        self.compact_after = compact_after
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.finished = 0  # finished jobs recorded since the last compaction
+
+    def record(self, job_id, stage, **fields):
+        """Note that a job reached a stage; written before the stage's work starts"""
+        line = json.dumps({'id': job_id, 'stage': stage, **fields}) + '\n'
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            if stage in FINAL_STAGES:
+                self.finished += 1
+                if self.finished >= self.compact_after:
+                    self._compact()
+
+    def replay(self):
+        """Latest state of every journaled job, merging the fields of all its records"""
+        jobs = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn write from a crash
+                    jobs.setdefault(entry['id'], {}).update(entry)
+        except FileNotFoundError:
+            pass
+        return jobs
+
+    def pending(self):
+        """Jobs that were interrupted before finishing"""
+        return [job for job in self.replay().values() if job['stage'] not in FINAL_STAGES]
+
+    def compact(self):
+        """Rewrite the journal keeping only unfinished jobs"""
+        with self.lock:
+            return self._compact()
+
+    def _compact(self):
+        jobs = [job for job in self.replay().values() if job['stage'] not in FINAL_STAGES]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for job in jobs:
+                f.write(json.dumps(job) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.finished = 0
+        return jobs
+
+
+def claim_folder(path):
+    """Take exclusive ownership of a work folder, returning the lock handle or None if it is taken"""
+    os.makedirs(path, exist_ok=True)
+    handle = open(os.path.join(path, '.lock'), 'a')
+    if fcntl is None:
+        return handle
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def release_folder(handle):
+    if handle is not None:
+        handle.close()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""Load generator for capacity planning: python loadtest.py [--stages 1,2,4,8,16] [--duration 20]
+
+By default the app runs in-process on a local port with yt-dlp replaced by a
+stub extractor and Spotify/Beatstars replaced by fake sites serving the pages in
+fixtures/, so only this instance's own request handling, job bookkeeping, disk
+and thread usage are measured. Each stage drives /convert followed by
+/download/<filename> from a fixed number of concurrent clients and reports
+throughput, latency percentiles, errors and resource usage. The saturation
+point is the stage after which throughput stops growing.
+
+--target http://host:port drives an already running instance instead (no stubs).
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import string
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows: no peak RSS fallback
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Share of requests per source platform
+DEFAULT_MIX = {'youtube': 0.6, 'soundcloud': 0.15, 'spotify': 0.15, 'beatstars': 0.1}
+# Track lengths in seconds and how often they occur
+DEFAULT_LENGTHS = {150: 0.45, 210: 0.35, 360: 0.15, 3600: 0.05}
+
+
+class TrafficModel:
+    """Generates source URLs with a platform mix, a repeat rate and track lengths"""
+
+    def __init__(self, mix=None, repeat=0.3, lengths=None, popular=50, seed=1):
+        self.mix = mix or DEFAULT_MIX
+        self.repeat = repeat
+        self.lengths = lengths or DEFAULT_LENGTHS
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.popular = [self._new_url() for _ in range(popular)]
+
+    def _token(self, length):
+        return ''.join(self.rng.choice(string.ascii_letters + string.digits) for _ in range(length))
+
+    def _new_url(self):
+        platform = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        if platform == 'youtube':
+            return f'https://www.youtube.com/watch?v={self._token(11)}'
+        if platform == 'soundcloud':
+            return f'https://soundcloud.com/artist-{self._token(6).lower()}/track-{self._token(8).lower()}'
+        if platform == 'spotify':
+            return f'https://open.spotify.com/track/{self._token(22)}'
+        return f'https://www.beatstars.com/beat/plus-jamais-{self.rng.randrange(10 ** 7, 10 ** 8)}'
+
+    def next_url(self):
+        with self.lock:
+            if self.rng.random() < self.repeat:
+                return self.rng.choice(self.popular)
+            return self._new_url()
+
+    def duration(self, url):
+        """Track length for a URL, stable so repeats describe the same track"""
+        pick = int(hashlib.md5(url.encode()).hexdigest(), 16) % 10000 / 10000.0
+        for length, weight in self.lengths.items():
+            pick -= weight
+            if pick < 0:
+                return length
+        return list(self.lengths)[-1]
+
+
+class StubYoutubeDL:
+    """Stands in for yt_dlp.YoutubeDL: no network, download+encode time scales with track length"""
+
+    model = None
+    latency = 0.1  # seconds per extraction or search
+    realtime_factor = 100.0  # seconds of audio processed per second
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_post_processor(self, pp, when='post_process'):
+        pass
+
+    def extract_info(self, url, download=False, process=True):
+        time.sleep(self.latency)
+        if url.startswith('ytsearch'):
+            with open(os.path.join(FIXTURES, 'search', 'plus_jamais.json')) as f:
+                entries = json.load(f)
+            # A distinct upload per query so conversions do not all collapse into one
+            video_id = hashlib.md5(url.encode()).hexdigest()[:11]
+            return {'entries': [{**entries[1], 'id': video_id}] + entries}
+        duration = self.model.duration(url)
+        return {
+            'id': hashlib.md5(url.encode()).hexdigest()[:11],
+            'title': f'Stub track {url.rsplit("/", 1)[-1]}',
+            'uploader': 'Stub Artist',
+            'duration': duration,
+            'webpage_url': url,
+            'formats': [{'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2',
+                         'filesize': duration * 16000, 'url': 'http://stub.invalid/audio.m4a'}],
+        }
+
+    def process_ie_result(self, info, download=True):
+        time.sleep(info['duration'] / self.realtime_factor)
+        if download:
+            path = self.params['outtmpl'].replace('%(ext)s', 'mp3')
+            with open(path, 'wb') as f:
+                f.truncate(info['duration'] * 24000)  # 192 kbps
+            for hook in self.params.get('progress_hooks') or []:
+                hook({'status': 'finished', 'filename': path})
+        return info
+
+
+class FakeResponse:
+    """The parts of requests.Response the scrapers use, streamed or not"""
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeSites:
+    """Answers the scrapers' requests.get calls with the stored Spotify/Beatstars pages"""
+
+    PAGES = {
+        'open.spotify.com/embed/': ('spotify', 'embed_next_data.html'),
+        'open.spotify.com/': ('spotify', 'track_page.html'),
+        'beatstars.com/': ('beatstars', 'beat_og_title.html'),
+    }
+
+    def __init__(self, latency=0.15):
+        self.latency = latency
+        self.pages = {}
+        for prefix, (folder, name) in self.PAGES.items():
+            with open(os.path.join(FIXTURES, folder, name), 'rb') as f:
+                self.pages[prefix] = f.read()
+
+    def get(self, url, **kwargs):
+        time.sleep(self.latency)
+        for prefix, content in self.pages.items():
+            if prefix in url:
+                return FakeResponse(200, content)
+        return FakeResponse(404, b'')
+
+
+def install_stubs(app, model, latency=0.1, realtime_factor=100.0, upstream_limits=False):
+    """Point the app at the stubs; returns a function undoing every change"""
+    import ratelimit
+
+    saved = {name: getattr(app, name) for name in ('yt_dlp', 'requests', 'client_quota', 'info_cache', 'resolution_cache')}
+    saved_limiters = dict(ratelimit._limiters)
+
+    stub = type('StubYoutubeDL', (StubYoutubeDL,), {'model': model, 'latency': latency,
+                                                     'realtime_factor': realtime_factor})
+    app.yt_dlp = types.SimpleNamespace(YoutubeDL=stub)
+    app.requests = FakeSites(latency)
+    # Every simulated client shares 127.0.0.1, so per-client quotas would cap the test
+    app.client_quota = ratelimit.ClientQuota(rate=1e9, burst=1e9)
+    app.info_cache = type(app.info_cache)(app.info_cache.max_entries, app.info_cache.ttl)
+    app.resolution_cache = type(app.resolution_cache)(app.resolution_cache.max_entries, app.resolution_cache.ttl)
+    if not upstream_limits:
+        # Measure this instance, not the politeness limits towards real upstreams
+        for platform in ratelimit._limiters:
+            ratelimit._limiters[platform] = ratelimit.UpstreamLimiter(platform, 1e9, 1e9)
+
+    def restore():
+        for name, value in saved.items():
+            setattr(app, name, value)
+        ratelimit._limiters.update(saved_limiters)
+    return restore
+
+
+def serve(app, threads=True):
+    """Run the Flask app on a free local port; returns (server, base URL)"""
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=threads)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def rss_mb():
+    """Current resident set size of this process, falling back to the peak"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return 0.0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_stage(base_url, model, concurrency, duration, download=True):
+    """Drive convert+download from `concurrency` clients for `duration` seconds"""
+    latencies, download_latencies, errors = [], [], {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            url = model.next_url()
+            start = time.monotonic()
+            try:
+                response = session.post(f'{base_url}/convert', json={'url': url}, timeout=300)
+                data = response.json()
+                if response.status_code != 200:
+                    raise RuntimeError(f'convert {response.status_code}')
+                elapsed = time.monotonic() - start
+                download_elapsed = None
+                if download:
+                    start = time.monotonic()
+                    with session.get(f"{base_url}{data['download_url']}", stream=True, timeout=300) as r:
+                        if r.status_code != 200:
+                            raise RuntimeError(f'download {r.status_code}')
+                        for _ in r.iter_content(256 * 1024):
+                            pass
+                    download_elapsed = time.monotonic() - start
+                with lock:
+                    latencies.append(elapsed)
+                    if download_elapsed is not None:
+                        download_latencies.append(download_elapsed)
+            except Exception as e:
+                with lock:
+                    key = str(e) if isinstance(e, RuntimeError) else type(e).__name__
+                    errors[key] = errors.get(key, 0) + 1
+
+    cpu_start, wall_start = time.process_time(), time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    wall = time.monotonic() - wall_start
+    completed, failed = len(latencies), sum(errors.values())
+    return {
+        'concurrency': concurrency,
+        'completed': completed,
+        'throughput': completed / wall,
+        'error_rate': failed / (completed + failed) if completed + failed else 0.0,
+        'errors': errors,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'download_p95': percentile(download_latencies, 95),
+        'cpu_percent': 100.0 * (time.process_time() - cpu_start) / wall,
+        'rss_mb': rss_mb(),
+        'threads': threading.active_count(),
+    }
+
+
+def saturation(results):
+    """Stage with the highest throughput before it stops growing by at least 5%"""
+    best = None
+    for result in results:
+        if best is not None and result['throughput'] < best['throughput'] * 1.05:
+            break
+        best = result
+    return best
+
+
+def format_report(results):
+    def ms(value):
+        return f'{value * 1000:8.0f}' if value is not None else '       -'
+    lines = [' conc   req/s     p50ms    p95ms    p99ms  dl p95ms  errors   cpu%  rss MB  threads']
+    for r in results:
+        lines.append(f"{r['concurrency']:5d} {r['throughput']:7.2f} {ms(r['p50'])} {ms(r['p95'])} {ms(r['p99'])} "
+                     f"{ms(r['download_p95'])}  {r['error_rate']:6.1%} {r['cpu_percent']:6.0f} {r['rss_mb']:7.0f} {r['threads']:8d}")
+    best = saturation(results)
+    if best:
+        lines.append(f"Saturation: ~{best['throughput']:.2f} conversions/s at {best['concurrency']} concurrent clients")
+    for r in results:
+        if r['errors']:
+            lines.append(f"Errors at {r['concurrency']}: {r['errors']}")
+    return '\n'.join(lines)
+
+
+def parse_weights(text, cast=str):
+    """'youtube=0.6,spotify=0.4' -> {'youtube': 0.6, 'spotify': 0.4}"""
+    weights = {}
+    for part in text.split(','):
+        key, value = part.split('=')
+        weights[cast(key.strip())] = float(value)
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', help='drive a running instance instead of an in-process stubbed one')
+    parser.add_argument('--stages', default='1,2,4,8,16,32', help='concurrent clients per stage')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per stage')
+    parser.add_argument('--mix', type=parse_weights, default=DEFAULT_MIX, help='platform weights, e.g. youtube=0.6,spotify=0.4')
+    parser.add_argument('--lengths', type=lambda t: parse_weights(t, int), default=DEFAULT_LENGTHS,
+                        help='track seconds and weights, e.g. 180=0.9,3600=0.1')
+    parser.add_argument('--repeat', type=float, default=0.3, help='share of requests for already popular URLs')
+    parser.add_argument('--latency', type=float, default=0.1, help='stub upstream latency in seconds')
+    parser.add_argument('--realtime-factor', type=float, default=100.0,
+                        help='stub download+encode speed in seconds of audio per second')
+    parser.add_argument('--upstream-limits', action='store_true', help='keep the per-upstream rate limits')
+    parser.add_argument('--no-download', action='store_true', help='only call /convert')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    model = TrafficModel(args.mix, args.repeat, args.lengths)
+    if args.target:
+        base_url = args.target.rstrip('/')
+    else:
+        # Keep the test's files out of the real work folder
+        os.environ.setdefault('WORK_FOLDER', tempfile.mkdtemp(prefix='loadtest-'))
+        import app
+        install_stubs(app, model, args.latency, args.realtime_factor, args.upstream_limits)
+        _, base_url = serve(app.app)
+
+    results = []
+    print(format_report([]).splitlines()[0], flush=True)
+    for concurrency in (int(c) for c in args.stages.split(',')):
+        results.append(run_stage(base_url, model, concurrency, args.duration, not args.no_download))
+        print(format_report(results[-1:]).splitlines()[1], flush=True)
+
+    print()
+    print(format_report(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
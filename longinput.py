@@ -0,0 +1,145 @@
+"""Streaming conversion for very long sources (multi-hour mixes)
+
+The normal path lets yt-dlp write the whole source to the work folder and then
+re-reads it for the encode and the tag rewrite. For long sources a yt-dlp
+subprocess instead writes the selected stream to stdout, FFmpeg encodes it from
+a pipe of bounded size, and FFmpeg writes the tags itself, so nothing reads or
+rewrites the whole file afterwards. Both processes run under a hard memory
+ceiling; their memory use does not grow with the length of the source.
+"""
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+
+from yt_dlp import YoutubeDL
+
+from audio import multi_encode_args
+
+try:
+    import fcntl
+    import resource
+except ImportError:
+    fcntl = resource = None  # not POSIX: long sources take the normal path
+
+# Sources at least this long are streamed
+LONG_INPUT_SECONDS = int(os.environ.get('LONG_INPUT_SECONDS', 1800))
+# Address space each process of the pipeline may use; exceeding it fails the job, not the box
+MEMORY_CEILING = int(os.environ.get('LONG_INPUT_MEMORY_MB', 1024)) * 1024 * 1024
+# Kernel buffer between the download and the encode (Linux; elsewhere the default 64 KB)
+PIPE_BUFFER = 1024 * 1024
+F_SETPIPE_SZ = 1031
+
+
+class PipelineError(Exception):
+    """A process of the streaming pipeline failed; the message is its last error line"""
+
+
+def available():
+    return resource is not None and hasattr(resource, 'prlimit') and hasattr(os, 'wait4')
+
+
+def wants_long_input(duration, selected_format):
+    """Whether a source should be streamed: long, with a concrete format to stream"""
+    return available() and selected_format is not None and (duration or 0) >= LONG_INPUT_SECONDS
+
+
+def download_command(info_path, format_id, fragments=1, chunk_size=None):
+    """yt-dlp writing one format of an already extracted source to stdout"""
+    command = [sys.executable, '-m', 'yt_dlp', '--load-info-json', info_path, '-f', format_id, '-o', '-',
+               '--quiet', '--no-warnings', '--no-progress', '--concurrent-fragments', str(fragments)]
+    if chunk_size:
+        command += ['--http-chunk-size', str(chunk_size)]
+    return command
+
+
+def encode_command(outputs, audio_filter=None, tags=None):
+    """FFmpeg encoding stdin to every output, tagging them as it writes"""
+    metadata = []
+    for key in ('title', 'artist', 'album'):
+        if tags and tags.get(key):
+            metadata += ['-metadata', f'{key}={tags[key]}']
+    command = ['ffmpeg', '-nostdin', '-y', '-v', 'error', '-i', 'pipe:0']
+    for path, options in multi_encode_args(outputs, audio_filter):
+        id3 = ['-id3v2_version', '3'] if path.endswith('.mp3') else []
+        command += options + metadata + id3 + [path]
+    return command
+
+
+def write_info(info, path):
+    """Store the extracted info for the yt-dlp subprocess, so it does not extract again"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(YoutubeDL.sanitize_info(info), f)
+
+
+def limit_memory(pid, ceiling):
+    """Cap the address space of a started process.
+
+    Applied from outside right after the spawn: a preexec_fn would run between
+    fork and exec, which is not safe in this multi-threaded server.
+    """
+    try:
+        resource.prlimit(pid, resource.RLIMIT_AS, (ceiling, ceiling))
+    except ProcessLookupError:
+        pass  # already gone
+
+
+def _wait(process):
+    """Reap a process; returns its peak resident memory in bytes.
+
+    On Linux the peak also counts the parent's memory at fork time, so compare
+    runs from the same parent rather than reading it as an absolute figure.
+    """
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+
+def _last_line(log):
+    log.seek(0)
+    lines = [line for line in log.read().decode('utf-8', 'replace').splitlines() if line.strip()]
+    return lines[-1] if lines else 'no error output'
+
+
+def run_pipeline(download_cmd, encode_cmd, memory_ceiling=MEMORY_CEILING):
+    """Run download | encode with a bounded pipe between them.
+
+    Returns the peak resident memory of (download, encode) in bytes; raises
+    PipelineError if either fails.
+    """
+    # Error output goes to unlinked temp files: it is only read on failure and never blocks a process
+    with tempfile.TemporaryFile() as download_log, tempfile.TemporaryFile() as encode_log:
+        downloader = subprocess.Popen(download_cmd, stdout=subprocess.PIPE, stderr=download_log,
+                                      stdin=subprocess.DEVNULL)
+        try:
+            limit_memory(downloader.pid, memory_ceiling)
+            if fcntl is not None and sys.platform.startswith('linux'):
+                try:
+                    fcntl.fcntl(downloader.stdout.fileno(), F_SETPIPE_SZ, PIPE_BUFFER)
+                except OSError:
+                    pass  # keep the default size
+            encoder = subprocess.Popen(encode_cmd, stdin=downloader.stdout, stderr=encode_log,
+                                       stdout=subprocess.DEVNULL)
+            limit_memory(encoder.pid, memory_ceiling)
+        except Exception:
+            os.kill(downloader.pid, signal.SIGKILL)
+            _wait(downloader)
+            raise
+        # Only the encoder reads the pipe from here on
+        downloader.stdout.close()
+        encode_peak = _wait(encoder)
+        if encoder.returncode != 0:
+            # Not Popen.kill(): it polls first, which would reap the process before wait4 can
+            os.kill(downloader.pid, signal.SIGKILL)
+        download_peak = _wait(downloader)
+
+        # A failed download also fails the encode (truncated input); report the cause
+        download_failed = downloader.returncode not in (0, -signal.SIGKILL, -signal.SIGPIPE)
+        if download_failed:
+            raise PipelineError(_last_line(download_log))
+        if encoder.returncode != 0:
+            raise PipelineError(_last_line(encode_log))
+    return download_peak, encode_peak
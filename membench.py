@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Memory benchmark for streamed long sources: python membench.py [--durations 600,1800,3600,10800]
+
+Runs the long-input pipeline (longinput.run_pipeline) on generated audio of
+increasing length: an FFmpeg tone generator writing AAC to stdout stands in for
+the yt-dlp download, and the encode is the command the app runs. Peak resident
+memory of both processes should stay flat as the source gets longer; elapsed
+time grows linearly.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from longinput import MEMORY_CEILING, encode_command, run_pipeline
+
+MB = 1024 * 1024
+
+
+def source_command(duration):
+    """Stand-in for the download: duration seconds of stereo AAC on stdout"""
+    return ['ffmpeg', '-nostdin', '-v', 'error', '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={duration}',
+            '-ac', '2', '-c:a', 'aac', '-b:a', '128k', '-f', 'adts', 'pipe:1']
+
+
+def run(duration, formats, normalize, folder):
+    outputs = [(spec, os.path.join(folder, f"bench_{duration}_{spec.replace(':', '-')}.{spec.split(':')[0]}"))
+               for spec in formats]
+    audio_filter = 'loudnorm=I=-16.0:TP=-1.5:LRA=11.0' if normalize else None
+    tags = {'title': f'Benchmark {duration}s', 'artist': 'membench'}
+    start = time.monotonic()
+    download_peak, encode_peak = run_pipeline(source_command(duration), encode_command(outputs, audio_filter, tags))
+    elapsed = time.monotonic() - start
+    size = sum(os.path.getsize(path) for _, path in outputs)
+    for _, path in outputs:
+        os.remove(path)
+    return {'duration': duration, 'seconds': elapsed, 'output_mb': size / MB,
+            'download_peak_mb': download_peak / MB, 'encode_peak_mb': encode_peak / MB}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--durations', default='600,1800,3600,10800', help='source lengths in seconds')
+    parser.add_argument('--formats', default='mp3:192', help='comma separated output formats, e.g. mp3:192,opus:96')
+    parser.add_argument('--normalize', action='store_true', help='apply single-pass loudness normalization')
+    args = parser.parse_args()
+
+    if shutil.which('ffmpeg') is None:
+        sys.exit('membench needs ffmpeg on PATH')
+
+    print(f"memory ceiling per process: {MEMORY_CEILING // MB} MB")
+    print(f"{'source':>10} {'elapsed':>9} {'output':>10} {'download peak':>14} {'encode peak':>12}")
+    with tempfile.TemporaryDirectory(prefix='membench-') as folder:
+        for duration in (int(d) for d in args.durations.split(',')):
+            result = run(duration, args.formats.split(','), args.normalize, folder)
+            print(f"{result['duration']:>9}s {result['seconds']:>8.1f}s {result['output_mb']:>7.1f} MB "
+                  f"{result['download_peak_mb']:>11.1f} MB {result['encode_peak_mb']:>9.1f} MB", flush=True)
+
+
+if __name__ == '__main__':
+    main()
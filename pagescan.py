@@ -0,0 +1,186 @@
+"""Early-exit page fetches for the Spotify and Beatstars scrapers
+
+The fields the scrapers read (<title>, og:title, JSON-LD, the embed's entity
+payload) are usually near the top of pages that are several hundred KB long.
+A fetch with a readiness check feeds the body to an incremental HTML scanner
+as it arrives and stops the transfer once the check says the scraper's parser
+would give the same answer on the rest of the page; MAX_PAGE_BYTES caps the
+transfer when it never does. The scrapers then parse the bytes read as before.
+"""
+import codecs
+import json
+from html.parser import HTMLParser
+
+# Bytes read per chunk, and at most per page
+CHUNK_SIZE = 16 * 1024
+MAX_PAGE_BYTES = 1024 * 1024
+
+# Beatstars titles of generic pages, which the scraper rejects outright
+GENERIC_BEATSTARS_TITLES = ('Buy Beats Online', 'Download Beats')
+
+
+class PageScanner(HTMLParser):
+    """Collects the parts of a page the scrapers read, as far as it has been fed"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.title = None  # text of the first <title>, once it is closed
+        self.head_done = False
+        self.og_titles = []
+        self.data = []  # (type, id, parsed JSON) of closed JSON-LD and payload scripts
+        self._in_title = False
+        self._title_parts = []
+        self._script = None
+
+    def feed_bytes(self, chunk):
+        self.feed(self.decoder.decode(chunk))
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title' and self.title is None:
+            self._in_title = True
+        elif tag == 'meta':
+            attrs = dict(attrs)
+            if attrs.get('property') == 'og:title':
+                self.og_titles.append(attrs.get('content') or '')
+        elif tag == 'script':
+            attrs = dict(attrs)
+            self._script = (attrs.get('type'), attrs.get('id'), [])
+        elif tag == 'body':
+            self.head_done = True
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self._in_title:
+            self._in_title = False
+            self.title = ''.join(self._title_parts).strip()
+        elif tag == 'script' and self._script is not None:
+            script_type, script_id, parts = self._script
+            self._script = None
+            # Parsed once here, not on every readiness check
+            if script_type == 'application/ld+json' or script_id == '__NEXT_DATA__':
+                try:
+                    self.data.append((script_type, script_id, json.loads(''.join(parts))))
+                except ValueError:
+                    pass
+        elif tag == 'head':
+            self.head_done = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+        elif self._script is not None:
+            self._script[2].append(data)
+
+    def json_scripts(self, script_type=None, script_id=None):
+        """Parsed JSON of the closed scripts with a type or ID"""
+        for kind, identifier, value in self.data:
+            if (script_type and kind != script_type) or (script_id and identifier != script_id):
+                continue
+            yield value
+
+
+def next_data_entity(scanner):
+    """The entity of the embed page payload, once its script has been read"""
+    for data in scanner.json_scripts(script_id='__NEXT_DATA__'):
+        try:
+            return data['props']['pageProps']['state']['data']['entity'] or {}
+        except (KeyError, TypeError):
+            return {}
+    return None
+
+
+def spotify_embed_ready(scanner):
+    """parse_spotify_embed: a "Track - Artist" title, or a track entity with its artist"""
+    if scanner.title is not None and ' - ' in scanner.title:
+        return True
+    entity = next_data_entity(scanner)
+    if not entity or entity.get('type') != 'track' or not entity.get('name'):
+        return False
+    artists = entity.get('artists') or [{}]
+    return bool(artists[0].get('name'))
+
+
+def spotify_collection_ready(scanner):
+    """parse_spotify_collection: the whole entity payload"""
+    return next_data_entity(scanner) is not None
+
+
+def spotify_page_ready(scanner):
+    """parse_spotify_page: a title it can split, or every meta tag of the head once it has a title or og:title"""
+    if scanner.title is not None and ('|' in scanner.title or ' - ' in scanner.title):
+        return True
+    return scanner.head_done and (scanner.title is not None or any('|' in og for og in scanner.og_titles))
+
+
+def beatstars_page_ready(scanner):
+    """parse_beatstars_page: a generic title, an og:title it can split, or a MusicRecording after the head"""
+    if scanner.title is None:
+        return False
+    if any(generic in scanner.title for generic in GENERIC_BEATSTARS_TITLES):
+        return True
+    if any('|' in og or ' - ' in og or len(og.split('-')) == 2 for og in scanner.og_titles):
+        return True
+    return scanner.head_done and any(isinstance(data, dict) and data.get('@type') == 'MusicRecording' and data.get('name')
+                                     for data in scanner.json_scripts(script_type='application/ld+json'))
+
+
+class PageResponse:
+    """What the scrapers use of a response: its status and the bytes read"""
+
+    def __init__(self, status_code, content, complete):
+        self.status_code = status_code
+        self.content = content
+        self.complete = complete  # False if the transfer was stopped early
+
+
+class PageReader:
+    """Accumulates a body chunk by chunk until ready(scanner) or max_bytes"""
+
+    def __init__(self, ready, max_bytes=MAX_PAGE_BYTES):
+        self.ready = ready
+        self.max_bytes = max_bytes
+        self.scanner = PageScanner()
+        self.chunks = []
+        self.size = 0
+
+    def add(self, chunk):
+        """Take the next chunk; True once no more are needed"""
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        self.scanner.feed_bytes(chunk)
+        return self.size >= self.max_bytes or self.ready(self.scanner)
+
+    @property
+    def content(self):
+        return b''.join(self.chunks)[:self.max_bytes]
+
+
+def read_page(response, ready, max_bytes=MAX_PAGE_BYTES):
+    """Read a streamed requests response until ready; the connection is closed either way"""
+    reader = PageReader(ready, max_bytes)
+    complete = True
+    try:
+        # The scrapers ignore the body of error responses
+        chunks = response.iter_content(CHUNK_SIZE) if response.status_code == 200 else ()
+        for chunk in chunks:
+            if reader.add(chunk):
+                complete = False
+                break
+    finally:
+        response.close()
+    return PageResponse(response.status_code, reader.content, complete)
+
+
+async def read_page_async(response, ready, max_bytes=MAX_PAGE_BYTES):
+    """read_page for a streamed httpx response"""
+    reader = PageReader(ready, max_bytes)
+    complete = True
+    try:
+        if response.status_code == 200:
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                if reader.add(chunk):
+                    complete = False
+                    break
+    finally:
+        await response.aclose()
+    return PageResponse(response.status_code, reader.content, complete)
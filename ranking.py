@@ -0,0 +1,114 @@
+import logging
+import re
+
+# Keywords marking search results that are not the track/beat itself
+SKIP_KEYWORDS = ['tutorial', 'how to', 'export', 'fl studio', 'logic pro', 'ableton', 'vocal', 'lyrics', 'singing', 'cover', 'remix']
+TUTORIAL_KEYWORDS = ['tutorial', 'how to', 'export', 'fl studio']
+# Keywords marking beat/instrumental uploads and official track uploads
+PREFER_KEYWORDS = ['beat', 'instrumental', 'type beat', 'prod', 'producer', 'free beat', 'demo', 'boombap', 'trap beat']
+OFFICIAL_KEYWORDS = ['official audio', 'official music video', 'official video']
+
+GENERIC_PRODUCERS = ('Beatstars Producer', 'Unknown Producer')
+
+# How far a result's length may be from the track's known length: 10%, at least 10 seconds
+DURATION_TOLERANCE = 0.1
+MIN_DURATION_TOLERANCE = 10  # seconds
+
+logger = logging.getLogger(__name__)
+
+
+class KeywordMatcher:
+    """Any-of-these-substrings test compiled into a single regex alternation"""
+
+    def __init__(self, keywords):
+        # Longest first so overlapping keywords cannot shadow each other
+        keywords = sorted({k.lower() for k in keywords}, key=len, reverse=True)
+        self.pattern = re.compile('|'.join(re.escape(k) for k in keywords))
+
+    def __call__(self, text):
+        return self.pattern.search(text) is not None
+
+
+skip_matcher = KeywordMatcher(SKIP_KEYWORDS)
+tutorial_matcher = KeywordMatcher(TUTORIAL_KEYWORDS)
+prefer_matcher = KeywordMatcher(PREFER_KEYWORDS)
+official_matcher = KeywordMatcher(OFFICIAL_KEYWORDS)
+
+
+class Candidate:
+    """A search result, lowercased once for every matcher"""
+
+    __slots__ = ('entry', 'title', 'text')
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.title = (entry.get('title') or '').lower()
+        # "in title or in description" as a single search; no keyword spans the newline
+        self.text = self.title + '\n' + (entry.get('description') or '').lower()
+
+    @property
+    def url(self):
+        video_id = self.entry.get('id') or self.entry.get('url', '').split('/')[-1].split('?')[0]
+        return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def candidates(entries):
+    return [Candidate(entry) for entry in entries or [] if entry]
+
+
+def duration_matches(candidate, duration):
+    """Whether a result could be a track of this length; unknown lengths always could"""
+    actual = candidate.entry.get('duration')
+    if not duration or not actual:
+        return True
+    return abs(actual - duration) <= max(MIN_DURATION_TOLERANCE, duration * DURATION_TOLERANCE)
+
+
+def pick_track(entries, duration=None):
+    """Prefer an official audio/video upload, otherwise the first result.
+
+    With the track's length known, results of another length (extended
+    versions, live takes, compilations) are passed over while any result fits.
+    """
+    ranked = candidates(entries)
+    ranked = [c for c in ranked if duration_matches(c, duration)] or ranked
+    return next((c for c in ranked if official_matcher(c.title)), ranked[0] if ranked else None)
+
+
+def beat_scores(ranked, beat_name, producer_name):
+    """Score every candidate of a result batch: 0 exact/preferred match, 1 beat name match, None no match"""
+    beat = beat_name.lower()
+    producer = producer_name.lower() if producer_name and producer_name not in GENERIC_PRODUCERS else None
+    scores = []
+    for c in ranked:
+        named = beat in c.title
+        if named and not skip_matcher(c.text) and ((producer and producer in c.text) or prefer_matcher(c.text)):
+            scores.append(0)
+        elif named and not tutorial_matcher(c.text):
+            scores.append(1)
+        else:
+            scores.append(None)
+    return scores
+
+
+def pick_beat(batches, beat_name, producer_name):
+    """Best beat upload from result batches, ordered by query priority.
+
+    Batches may be produced lazily; later queries are only searched when
+    earlier ones have no acceptable result.
+    """
+    for entries in batches:
+        ranked = candidates(entries)
+        scores = beat_scores(ranked, beat_name, producer_name)
+        if logger.isEnabledFor(logging.DEBUG):
+            for c, score in zip(ranked, scores):
+                logger.debug("Candidate %r scored %s", c.entry.get('title', ''), score)
+        scored = [(score, i) for i, score in enumerate(scores) if score is not None]
+        if scored:
+            return ranked[min(scored)[1]]
+    return None
+
+
+def pick_non_tutorial(entries):
+    """First result that is not a production tutorial"""
+    return next((c for c in candidates(entries) if not tutorial_matcher(c.text)), None)
@@ -0,0 +1,230 @@
+import asyncio
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Requests per second and burst size allowed towards each upstream platform
+UPSTREAM_LIMITS = {
+    'youtube': {'rate': 2.0, 'burst': 10},
+    'soundcloud': {'rate': 1.0, 'burst': 5},
+    'spotify': {'rate': 1.0, 'burst': 5},
+    'beatstars': {'rate': 0.5, 'burst': 3},
+}
+
+# Consecutive throttled responses before the circuit opens
+FAILURE_THRESHOLD = 3
+BASE_BACKOFF = 30  # seconds
+MAX_BACKOFF = 600  # seconds
+
+# Conversions a single client may start: refill rate (per second) and burst
+CLIENT_RATE = 5 / 60.0
+CLIENT_BURST = 3
+
+
+class UpstreamThrottled(Exception):
+    """Raised when an upstream is backing off and the request must fail fast"""
+
+    def __init__(self, platform, retry_after):
+        super().__init__(f'{platform} is rate limiting requests, retry in {int(retry_after)}s')
+        self.platform = platform
+        self.retry_after = retry_after
+
+
+def is_throttle_error(error_msg):
+    """Check whether an error message means the upstream is throttling us"""
+    return ('HTTP Error 429' in error_msg or 'Too Many Requests' in error_msg or
+            'HTTP Error 403' in error_msg or 'Forbidden' in error_msg)
+
+
+class TokenBucket:
+    """Thread-safe token bucket"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available, otherwise return seconds until one is"""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, timeout):
+        """Block until a token is available or the timeout would be exceeded"""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Opens after repeated throttling and backs off exponentially with jitter"""
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, base_backoff=BASE_BACKOFF, max_backoff=MAX_BACKOFF):
+        self.threshold = threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Return 0 if a request may go through, otherwise seconds to wait"""
+        return self.admit()[0]
+
+    def admit(self):
+        """(seconds to wait or 0, whether the admitted request is the half-open probe)"""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.open_until:
+                return self.open_until - now, False
+            if self.trips and self.failures >= self.threshold:
+                # Half-open: let a single probe request through
+                if self.probing:
+                    return 1, False
+                self.probing = True
+                return 0, True
+            return 0, False
+
+    def end_probe(self):
+        """Let the next request probe again, whatever became of this probe"""
+        with self.lock:
+            self.probing = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.trips = 0
+            self.probing = False
+
+    def record_throttle(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.threshold:
+                self.trips += 1
+                backoff = min(self.max_backoff, self.base_backoff * 2 ** (self.trips - 1))
+                self.open_until = time.monotonic() + backoff * random.uniform(0.5, 1.5)
+
+
+class UpstreamLimiter:
+    """Token bucket plus circuit breaker for one upstream platform"""
+
+    def __init__(self, platform, rate, burst):
+        self.platform = platform
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker()
+
+    def acquire(self, timeout=10):
+        """Wait for a token; returns whether the request is the circuit's half-open probe"""
+        wait, probe = self.breaker.admit()
+        if wait:
+            raise UpstreamThrottled(self.platform, wait)
+        if not self.bucket.acquire(timeout):
+            if probe:
+                self.breaker.end_probe()
+            raise UpstreamThrottled(self.platform, timeout)
+        return probe
+
+    async def acquire_async(self, timeout=10):
+        """acquire() for the event loop: waits for a token without blocking the thread"""
+        wait, probe = self.breaker.admit()
+        if wait:
+            raise UpstreamThrottled(self.platform, wait)
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                wait = self.bucket.try_acquire()
+                if wait == 0:
+                    return probe
+                if time.monotonic() + wait > deadline:
+                    raise UpstreamThrottled(self.platform, timeout)
+                await asyncio.sleep(wait)
+        except BaseException:
+            if probe:
+                self.breaker.end_probe()
+            raise
+
+    def record(self, throttled):
+        if throttled:
+            self.breaker.record_throttle()
+        else:
+            self.breaker.record_success()
+
+    @contextmanager
+    def guard(self, timeout=10):
+        """Acquire a token and record whether the wrapped upstream call was throttled"""
+        probe = self.acquire(timeout)
+        try:
+            yield
+        except UpstreamThrottled:
+            raise
+        except Exception as e:
+            # Any other failure still means the upstream answered us
+            self.record(is_throttle_error(str(e)))
+            raise
+        else:
+            self.record(False)
+        finally:
+            # A probe that ended without a verdict (e.g. another limiter failed fast) must not block later ones
+            if probe:
+                self.breaker.end_probe()
+
+
+class ClientQuota:
+    """Per-client token buckets so a single client cannot exhaust the workers"""
+
+    def __init__(self, rate=CLIENT_RATE, burst=CLIENT_BURST, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()  # client ID -> bucket, least recently seen first
+        self.lock = threading.Lock()
+
+    def check(self, client_id):
+        """Return 0 if the client may proceed, otherwise seconds until it may"""
+        with self.lock:
+            bucket = self.buckets.get(client_id)
+            if bucket is None:
+                if len(self.buckets) >= self.max_clients:
+                    self._prune()
+                bucket = self.buckets[client_id] = TokenBucket(self.rate, self.burst)
+            else:
+                self.buckets.move_to_end(client_id)
+        return bucket.try_acquire()
+
+    def _prune(self):
+        # Drop buckets that have refilled completely; they carry no state
+        now = time.monotonic()
+        for client_id, bucket in list(self.buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.capacity:
+                del self.buckets[client_id]
+        # Many clients still draining their tokens: forget the least recently seen
+        while len(self.buckets) >= self.max_clients:
+            self.buckets.popitem(last=False)
+
+
+_limiters = {platform: UpstreamLimiter(platform, **limits) for platform, limits in UPSTREAM_LIMITS.items()}
+
+
+def get_limiter(platform):
+    """Return the shared limiter for an upstream platform"""
+    return _limiters[platform]
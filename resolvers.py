@@ -0,0 +1,158 @@
+import re
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = {'si', 'feature', 'pp', 'fbclid', 'gclid', 'igshid', 'ref', 'ref_src', 't', 'nd'}
+
+YOUTUBE_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+class ResolveError(Exception):
+    """Raised when a source URL cannot be mapped to something downloadable"""
+
+
+class Resolver:
+    """A source platform: URL matcher, canonicalizer and optional YouTube mapping"""
+
+    def __init__(self, name, pattern, upstream, canonicalize=None, fetch_metadata=None,
+                 map_to_youtube=None, download_opts=None):
+        self.name = name
+        self.pattern = pattern
+        self.upstream = upstream
+        self._canonicalize = canonicalize or strip_tracking
+        self.fetch_metadata = fetch_metadata
+        self.map_to_youtube = map_to_youtube
+        self.download_opts = download_opts or {}
+
+    def canonicalize(self, url):
+        return self._canonicalize(with_scheme(url))
+
+    def resolve(self, source_url, metadata=None):
+        """Map a canonical source URL to the URL yt-dlp should download.
+
+        Metadata fetched elsewhere (e.g. by the async scrapers) skips the fetch.
+        """
+        if self.fetch_metadata is None:
+            return Resolution(self, source_url, source_url, self, {})
+        if metadata is None:
+            metadata = self.fetch_metadata(source_url)
+        download_url = self.map_to_youtube(metadata)
+        download_resolver = find_resolver(download_url)
+        if download_resolver is None or download_resolver.fetch_metadata is not None:
+            raise ResolveError(f'{self.name} mapped to an unsupported URL: {download_url}')
+        return Resolution(self, source_url, download_resolver.canonicalize(download_url), download_resolver, metadata)
+
+
+class Resolution:
+    """Result of resolving a source URL"""
+
+    def __init__(self, source, source_url, download_url, platform, metadata):
+        self.source = source
+        self.source_url = source_url
+        self.download_url = download_url
+        self.platform = platform
+        self.metadata = metadata
+
+
+_resolvers = []
+_matcher = None
+_lock = threading.Lock()
+
+
+def register(resolver):
+    """Add a resolver; earlier registrations win when patterns overlap"""
+    global _matcher
+    with _lock:
+        _resolvers.append(resolver)
+        # One alternation over every platform so dispatch is a single regex match
+        _matcher = re.compile('|'.join(f'(?P<r{i}>{r.pattern})' for i, r in enumerate(_resolvers)), re.IGNORECASE)
+    return resolver
+
+
+def find_resolver(url):
+    """Return the resolver for a URL, or None if no platform supports it"""
+    if _matcher is None:
+        return None
+    match = _matcher.match(url.strip())
+    if not match:
+        return None
+    return _resolvers[int(match.lastgroup[1:])]
+
+
+def get_resolver(name):
+    """Return the registered resolver with the given name"""
+    for resolver in _resolvers:
+        if resolver.name == name:
+            return resolver
+    raise KeyError(name)
+
+
+def with_scheme(url):
+    url = url.strip()
+    if not re.match(r'^https?://', url, re.IGNORECASE):
+        url = 'https://' + url
+    return url
+
+
+def host_pattern(domain):
+    """URL prefix pattern matching a domain and its subdomains, scheme optional"""
+    return rf'(?:https?://)?(?:[\w-]+\.)*{re.escape(domain)}(?=[/?#:]|$)'
+
+
+def strip_tracking(url):
+    """Drop fragments and tracking query parameters"""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k.lower() not in TRACKING_PARAMS and not k.lower().startswith('utm_')]
+    canonical = f'https://{parts.netloc.lower()}{parts.path or "/"}'
+    if query:
+        canonical += '?' + urlencode(query)
+    return canonical
+
+
+def youtube_video_id(url):
+    """Extract the video ID from watch, youtu.be, shorts, embed and live URLs"""
+    parts = urlsplit(url)
+    segments = [s for s in parts.path.split('/') if s]
+    if parts.netloc.lower().endswith('youtu.be'):
+        candidate = segments[0] if segments else ''
+    elif len(segments) >= 2 and segments[0] in ('shorts', 'embed', 'live', 'v'):
+        candidate = segments[1]
+    else:
+        candidate = dict(parse_qsl(parts.query)).get('v', '')
+    return candidate if YOUTUBE_ID.match(candidate) else None
+
+
+def canonical_youtube(url):
+    video_id = youtube_video_id(url)
+    if video_id:
+        return f'https://www.youtube.com/watch?v={video_id}'
+    return strip_tracking(url)
+
+
+def canonical_youtube_music(url):
+    video_id = youtube_video_id(url)
+    if video_id:
+        return f'https://music.youtube.com/watch?v={video_id}'
+    return strip_tracking(url)
+
+
+def canonical_soundcloud(url):
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    if host in ('www.soundcloud.com', 'm.soundcloud.com'):
+        host = 'soundcloud.com'
+    return f'https://{host}{parts.path.rstrip("/")}'
+
+
+def canonical_spotify(url):
+    # Drops locale prefixes like /intl-fr/ and share parameters
+    match = re.search(r'/(track|album|playlist)/([A-Za-z0-9]+)', urlsplit(url).path)
+    if match:
+        return f'https://open.spotify.com/{match.group(1)}/{match.group(2)}'
+    return strip_tracking(url)
+
+
+def canonical_beatstars(url):
+    return f'https://www.beatstars.com{urlsplit(url).path.rstrip("/")}'
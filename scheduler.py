@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Conversions downloading/encoding at once
+CONVERSION_WORKERS = int(os.environ.get('CONVERSION_WORKERS', 4))
+# Slots only short jobs may take, so a queue of long ones cannot hold up a single track
+FAST_LANE_SLOTS = int(os.environ.get('FAST_LANE_SLOTS', 1))
+# How long a job waits for a slot before it is turned away, and how many jobs
+# admitted beyond the running ones may wait at once (see FairScheduler.admission)
+MAX_QUEUE_WAIT = 300  # seconds
+MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_JOBS', 60))
+# How often a waiting job checks whether it should give up (e.g. was cancelled)
+ABORT_POLL = 0.5  # seconds
+
+# Cost model, in seconds of source audio: every job downloads its source and
+# encodes each output; a two-pass normalization decodes it once more
+DOWNLOAD_WEIGHT = 0.5
+ENCODE_WEIGHT = 1.0
+ANALYSIS_WEIGHT = 0.5
+UNKNOWN_DURATION = 600  # seconds assumed when the duration is unknown
+# Jobs up to this cost use the fast lane: one ~8 minute track to a single format
+FAST_LANE_COST = 480 * (DOWNLOAD_WEIGHT + ENCODE_WEIGHT)
+
+
+class SchedulerBusy(Exception):
+    """Raised when a job waited longer than MAX_QUEUE_WAIT for a conversion slot"""
+
+    def __init__(self, retry_after):
+        super().__init__('All conversion slots are busy')
+        self.retry_after = retry_after
+
+
+def job_cost(duration, outputs=1, two_pass=False):
+    """Estimated work for a conversion, weighting its length by what is done with it"""
+    weight = DOWNLOAD_WEIGHT + ENCODE_WEIGHT * outputs + (ANALYSIS_WEIGHT if two_pass else 0)
+    return (duration or UNKNOWN_DURATION) * weight
+
+
+class Ticket:
+    __slots__ = ('client', 'cost', 'fast', 'finish')
+
+    def __init__(self, client, cost, fast, finish):
+        self.client = client
+        self.cost = cost
+        self.fast = fast
+        self.finish = finish
+
+
+class FairScheduler:
+    """Hands out conversion slots by weighted fair queuing across clients.
+
+    Each client's jobs run in the order it submitted them. Across clients, the
+    next slot goes to the waiting job with the smallest virtual finish time:
+    the client's previous finish time (or the current virtual time, if it has
+    been idle) plus the job's cost. A client queuing many or long jobs
+    therefore gets its share of the slots, not all of them, and short jobs
+    from other clients overtake it. fast_lane_slots are kept free for jobs
+    costing at most fast_lane_cost.
+    """
+
+    def __init__(self, workers=CONVERSION_WORKERS, fast_lane_slots=FAST_LANE_SLOTS, fast_lane_cost=FAST_LANE_COST,
+                 max_wait=MAX_QUEUE_WAIT, max_queued=MAX_QUEUED_JOBS):
+        self.workers = workers
+        self.capacity = workers + max_queued  # jobs admission() lets in at once
+        self.admitted = 0
+        self.fast_lane_slots = min(fast_lane_slots, workers - 1)
+        self.fast_lane_cost = fast_lane_cost
+        self.max_wait = max_wait
+        self.queues = {}  # client -> deque of waiting tickets
+        self.finish_tags = {}  # client -> virtual finish time of its last ticket
+        self.vtime = 0.0
+        self.running = 0
+        self.running_slow = 0
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def admission(self):
+        """Count a job against capacity before it takes a thread; raises SchedulerBusy at once when full.
+
+        A pool of capacity threads for admitted jobs then never queues one
+        where the fair ordering of acquire() cannot see it.
+        """
+        with self.condition:
+            if self.admitted >= self.capacity:
+                raise SchedulerBusy(retry_after=60)
+            self.admitted += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.admitted -= 1
+
+    def waiting(self):
+        with self.condition:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def _can_start(self, ticket):
+        if self.running >= self.workers:
+            return False
+        return ticket.fast or self.running_slow < self.workers - self.fast_lane_slots
+
+    def _next(self):
+        heads = [queue[0] for queue in self.queues.values() if queue and self._can_start(queue[0])]
+        return min(heads, key=lambda ticket: ticket.finish) if heads else None
+
+    def _dequeue(self, ticket):
+        queue = self.queues[ticket.client]
+        queue.remove(ticket)
+        if not queue:
+            del self.queues[ticket.client]
+        # Idle clients whose share is used up start again from the current virtual time
+        for client in [c for c, tag in self.finish_tags.items() if c not in self.queues and tag <= self.vtime]:
+            del self.finish_tags[client]
+
+    def acquire(self, client, cost, abort=None):
+        """Wait for a slot; raises SchedulerBusy after max_wait, or whatever abort() raises while waiting"""
+        deadline = time.monotonic() + self.max_wait
+        with self.condition:
+            finish = max(self.vtime, self.finish_tags.get(client, 0.0)) + cost
+            ticket = Ticket(client, cost, cost <= self.fast_lane_cost, finish)
+            self.finish_tags[client] = finish
+            self.queues.setdefault(client, deque()).append(ticket)
+            while self._next() is not ticket:
+                remaining = deadline - time.monotonic()
+                try:
+                    if abort is not None:
+                        abort()
+                    if remaining <= 0:
+                        raise SchedulerBusy(retry_after=60)
+                except Exception:
+                    self._dequeue(ticket)
+                    self.condition.notify_all()
+                    raise
+                self.condition.wait(min(remaining, ABORT_POLL) if abort is not None else remaining)
+            self._dequeue(ticket)
+            # Virtual time follows the start of the work being served
+            self.vtime = max(self.vtime, ticket.finish - ticket.cost)
+            self.running += 1
+            if not ticket.fast:
+                self.running_slow += 1
+            # Another waiting job may fit in a slot that is still free
+            self.condition.notify_all()
+            return ticket
+
+    def release(self, ticket):
+        with self.condition:
+            self.running -= 1
+            if not ticket.fast:
+                self.running_slow -= 1
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self, client, cost, abort=None):
+        ticket = self.acquire(client, cost, abort)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
@@ -1,6 +1,9 @@
 // YouTube to MP3 Converter - Main JavaScript File
 
 let isConverting = false;
+let currentJobId = null;
+let probeTimer = null;
+let probedUrl = '';
 
 // UI State Management Functions
 function showLoading() {
@@ -22,7 +25,7 @@ function hideLoading() {
 function showResult(data) {
     document.getElementById('video-title').textContent = data.title;
     document.getElementById('download-link').href = data.download_url;
-    document.getElementById('download-link').download = data.title + '.mp3';
+    document.getElementById('download-link').download = data.download_name || data.title + '.mp3';
     document.getElementById('result-section').style.display = 'block';
     document.getElementById('error-section').style.display = 'none';
 }
@@ -38,12 +41,66 @@ function hideResults() {
     document.getElementById('error-section').style.display = 'none';
 }
 
+// URL Preview Functions
+function formatDuration(seconds) {
+    const minutes = Math.floor(seconds / 60);
+    const secs = Math.floor(seconds % 60);
+    return minutes + ':' + String(secs).padStart(2, '0');
+}
+
+function hidePreview() {
+    document.getElementById('preview-section').style.display = 'none';
+}
+
+function showPreview(data) {
+    const thumbnail = document.getElementById('preview-thumbnail');
+    thumbnail.style.display = data.thumbnail ? 'block' : 'none';
+    if (data.thumbnail) thumbnail.src = data.thumbnail;
+    document.getElementById('preview-title').textContent = data.title;
+    const details = [data.artist, data.duration ? formatDuration(data.duration) : null].filter(Boolean);
+    document.getElementById('preview-details').textContent = details.join(' • ');
+    document.getElementById('preview-section').style.display = 'flex';
+}
+
+// Resolve the pasted URL in the background so Convert starts with warm caches
+async function probeUrl(url) {
+    probedUrl = url;
+    try {
+        const response = await fetch('/probe', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ url: url })
+        });
+        const data = await response.json();
+        // Ignore answers for a URL that has since been edited
+        if (url === probedUrl && response.ok && data.success) {
+            showPreview(data);
+        }
+    } catch (error) {
+        // Previews are best-effort; Convert reports real errors
+    }
+}
+
+function scheduleProbe() {
+    clearTimeout(probeTimer);
+    hidePreview();
+    const url = document.getElementById('youtube-url').value.trim();
+    if (!/^(https?:\/\/)?[\w.-]+\.\w+\/\S+/.test(url)) {
+        probedUrl = '';
+        return;
+    }
+    probeTimer = setTimeout(() => probeUrl(url), 400);
+}
+
 // Main Conversion Function
 async function convertVideo() {
     if (isConverting) return;
 
     const url = document.getElementById('youtube-url').value.trim();
-    
+    const normalize = document.getElementById('normalize-volume').checked;
+
     if (!url) {
         showError('Please enter a YouTube URL');
         return;
@@ -52,13 +109,16 @@ async function convertVideo() {
     hideResults();
     showLoading();
 
+    // Named here so the conversion can be cancelled if the page is closed
+    currentJobId = crypto.randomUUID ? crypto.randomUUID() : Date.now().toString(36) + Math.random().toString(36).slice(2);
+
     try {
         const response = await fetch('/convert', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ url: url })
+            body: JSON.stringify({ url: url, normalize: normalize ? 'single' : 'off', job_id: currentJobId })
         });
 
         const data = await response.json();
@@ -71,10 +131,18 @@ async function convertVideo() {
     } catch (error) {
         showError('Network error. Please check your connection and try again.');
     } finally {
+        currentJobId = null;
         hideLoading();
     }
 }
 
+// Stop the server-side work when the page goes away mid-conversion
+window.addEventListener('pagehide', function() {
+    if (isConverting && currentJobId) {
+        fetch(`/jobs/${currentJobId}`, { method: 'DELETE', keepalive: true });
+    }
+});
+
 // GitHub Modal Functions
 function openGitHubModal() {
     document.getElementById('githubModal').style.display = 'flex';
@@ -97,9 +165,10 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
-    // Clear results when URL changes
+    // Clear results and preview the new source when URL changes (typed or pasted)
     document.getElementById('youtube-url').addEventListener('input', function() {
         hideResults();
+        scheduleProbe();
     });
 
     // Close modal with Escape key
@@ -0,0 +1,200 @@
+"""Job and artifact storage shared by every worker process and node
+
+JOB_STORE      sqlite:///path/to/jobs.db (default, one machine) or redis://host:6379/0
+ARTIFACT_STORE /shared/directory (default: artifacts/ in WORK_FOLDER) or s3://bucket/prefix
+               (S3_ENDPOINT_URL points the S3 client at MinIO or another compatible store)
+"""
+import json
+import os
+import shutil
+import sqlite3
+import time
+from urllib.parse import quote, urlsplit
+
+
+class SQLiteJobStore:
+    """JSON records with optional expiry in a SQLite file"""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS records (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)')
+
+    def _connect(self):
+        # A connection per call keeps the store usable from any thread
+        return sqlite3.connect(self.path, timeout=10)
+
+    def put(self, key, record, ttl=None):
+        expires = time.time() + ttl if ttl is not None else None
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?)', (key, json.dumps(record), expires))
+
+    def add(self, key, record, ttl=None):
+        """put() unless the key holds a record that has not expired; returns whether it was stored"""
+        expires = time.time() + ttl if ttl is not None else None
+        with self._connect() as db:
+            cursor = db.execute('INSERT INTO records VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+                                'value = excluded.value, expires = excluded.expires '
+                                'WHERE records.expires IS NOT NULL AND records.expires <= ?',
+                                (key, json.dumps(record), expires, time.time()))
+        return cursor.rowcount == 1
+
+    def get(self, key):
+        with self._connect() as db:
+            row = db.execute('SELECT value, expires FROM records WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and time.time() >= row[1]:
+            self.delete(key)
+            return None
+        return json.loads(row[0])
+
+    def delete(self, key):
+        with self._connect() as db:
+            db.execute('DELETE FROM records WHERE key = ?', (key,))
+
+    def purge_expired(self):
+        with self._connect() as db:
+            db.execute('DELETE FROM records WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+
+
+class RedisJobStore:
+    """JSON records in Redis (or a compatible server such as Valkey or KeyDB)"""
+
+    def __init__(self, url, prefix='ytmp3:', client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def put(self, key, record, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(record), ex=int(ttl) + 1 if ttl is not None else None)
+
+    def add(self, key, record, ttl=None):
+        return bool(self.client.set(self.prefix + key, json.dumps(record), ex=int(ttl) + 1 if ttl is not None else None,
+                                    nx=True))
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def purge_expired(self):
+        pass  # Redis expires keys itself
+
+
+class LocalArtifactStore:
+    """Finished files in a directory; share it (NFS, a volume) between nodes to scale out"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name):
+        if not name or os.path.basename(name) != name:
+            raise ValueError(f'Invalid artifact name: {name!r}')
+        return os.path.join(self.root, name)
+
+    def put(self, path, name, content_type='audio/mpeg'):
+        """Move a finished file from the worker's temp folder into the store; returns its size"""
+        target = self._path(name)
+        size = os.path.getsize(path)
+        if os.path.abspath(path) != os.path.abspath(target):
+            shutil.move(path, target)
+        return size
+
+    def fetch(self, name, path):
+        """Copy stored content to a local path, e.g. to re-tag it under another name"""
+        shutil.copyfile(self._path(name), path)
+
+    def exists(self, name):
+        try:
+            return os.path.isfile(self._path(name))
+        except ValueError:
+            return False
+
+    def local_path(self, name):
+        """Path to serve the artifact from, or None if it is not on this machine"""
+        return self._path(name) if self.exists(name) else None
+
+    def url(self, name, download_name):
+        return None  # served directly from local_path
+
+    def delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except (OSError, ValueError):
+            pass
+
+
+class S3ArtifactStore:
+    """Finished files in an S3-compatible bucket, downloaded through presigned URLs"""
+
+    URL_EXPIRY = 3600  # seconds
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+
+    def _key(self, name):
+        if not name or os.path.basename(name) != name:
+            raise ValueError(f'Invalid artifact name: {name!r}')
+        return self.prefix + name
+
+    def put(self, path, name, content_type='audio/mpeg'):
+        size = os.path.getsize(path)
+        self.client.upload_file(path, self.bucket, self._key(name), ExtraArgs={'ContentType': content_type})
+        os.remove(path)
+        return size
+
+    def fetch(self, name, path):
+        self.client.download_file(self.bucket, self._key(name), path)
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+            return True
+        except Exception:
+            return False
+
+    def local_path(self, name):
+        return None
+
+    def url(self, name, download_name):
+        """Presigned GET that makes the browser save the file under download_name"""
+        return self.client.generate_presigned_url('get_object', ExpiresIn=self.URL_EXPIRY, Params={
+            'Bucket': self.bucket,
+            'Key': self._key(name),
+            'ResponseContentDisposition': f"attachment; filename*=UTF-8''{quote(download_name)}",
+        })
+
+    def delete(self, name):
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+        except Exception:
+            pass
+
+
+def open_job_store(spec):
+    """Job store for a JOB_STORE setting"""
+    if spec.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisJobStore(spec)
+    if spec.startswith('sqlite:///'):
+        return SQLiteJobStore(spec[len('sqlite:///'):])
+    raise ValueError(f'Unsupported JOB_STORE: {spec}')
+
+
+def open_artifact_store(spec):
+    """Artifact store for an ARTIFACT_STORE setting"""
+    if spec.startswith('s3://'):
+        parts = urlsplit(spec)
+        return S3ArtifactStore(parts.netloc, parts.path, endpoint_url=os.environ.get('S3_ENDPOINT_URL'))
+    return LocalArtifactStore(spec)
@@ -0,0 +1,177 @@
+import base64
+import io
+import logging
+import re
+
+import requests
+from mutagen.flac import Picture
+from mutagen.id3 import APIC, ID3, TALB, TIT2, TPE1, WOAS, ID3NoHeaderError
+from mutagen.mp4 import MP4, MP4Cover
+from mutagen.oggopus import OggOpus
+
+from cache import LRUCache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None  # Pillow not available, embed the smallest suitable thumbnail as-is
+
+# Cover art is downscaled to fit in this many pixels per side
+COVER_SIZE = 500
+MIN_THUMBNAIL_WIDTH = 300
+# Thumbnails larger than this are not embedded; the download stops once it is exceeded
+MAX_THUMBNAIL_BYTES = 2 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Cover art (mime, bytes) by thumbnail URL
+thumbnail_cache = LRUCache(256)
+
+logger = logging.getLogger(__name__)
+
+
+def track_tags(info, metadata, source_url):
+    """Build ID3 fields from the yt-dlp info and the resolver's scraped metadata"""
+    info = info or {}
+    metadata = metadata or {}
+    # Spotify/Beatstars metadata describes the track better than the YouTube upload does
+    title = metadata.get('title') or info.get('track') or info.get('title') or 'Unknown'
+    artist = (metadata.get('artist') or info.get('artist') or info.get('creator')
+              or info.get('uploader') or info.get('channel'))
+    if artist in ('Beatstars Producer', 'Unknown Producer'):
+        artist = info.get('uploader') or None
+    return {
+        'title': title,
+        'artist': artist,
+        'album': metadata.get('album') or info.get('album'),
+        'source_url': source_url,
+    }
+
+
+def pick_thumbnail(info):
+    """Choose the smallest JPEG/PNG thumbnail that is still large enough for cover art"""
+    info = info or {}
+    candidates = [t for t in info.get('thumbnails') or [] if t.get('url') and t.get('width')]
+    candidates = [t for t in candidates if re.search(r'\.(jpe?g|png)(\?|$)', t['url'])] or candidates
+    large_enough = sorted((t for t in candidates if t['width'] >= MIN_THUMBNAIL_WIDTH), key=lambda t: t['width'])
+    if large_enough:
+        return large_enough[0]['url']
+    # Unprocessed extractor info may only list thumbnails without sizes
+    thumbnails = [t for t in info.get('thumbnails') or [] if t.get('url')]
+    return info.get('thumbnail') or (thumbnails[-1]['url'] if thumbnails else None)
+
+
+def fetch_cover(thumbnail_url, get=None):
+    """Download and downscale cover art, returning (mime, bytes) or None.
+
+    get replaces requests.get, e.g. to go through a platform's rate limiter.
+    """
+    if not thumbnail_url:
+        return None
+    cover = thumbnail_cache.get(thumbnail_url)
+    if cover:
+        return cover
+    try:
+        with (get or requests.get)(thumbnail_url, timeout=10, stream=True) as response:
+            if response.status_code != 200:
+                return None
+            data = bytearray()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                data += chunk
+                if len(data) > MAX_THUMBNAIL_BYTES:
+                    return None
+        data = bytes(data)
+    except Exception as e:
+        logger.warning("Error fetching thumbnail: %s", e)
+        return None
+
+    if Image is not None:
+        try:
+            image = Image.open(io.BytesIO(data)).convert('RGB')
+            image.thumbnail((COVER_SIZE, COVER_SIZE))
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=85)
+            cover = ('image/jpeg', output.getvalue())
+        except Exception as e:
+            logger.warning("Error downscaling thumbnail: %s", e)
+    if not cover:
+        if data.startswith(b'\x89PNG'):
+            cover = ('image/png', data)
+        elif data.startswith(b'\xff\xd8'):
+            cover = ('image/jpeg', data)
+        else:
+            return None  # e.g. WebP, which most players cannot show
+
+    thumbnail_cache.put(thumbnail_url, cover)
+    return cover
+
+
+def write_tags(path, tags, cover=None):
+    """Write tags and optional cover art to an MP3, Opus or M4A file"""
+    if path.endswith('.opus'):
+        return write_opus_tags(path, tags, cover)
+    if path.endswith('.m4a'):
+        return write_mp4_tags(path, tags, cover)
+    return write_id3_tags(path, tags, cover)
+
+
+def write_id3_tags(mp3_path, tags, cover=None):
+    """Write ID3v2 tags and optional cover art to an MP3 file"""
+    try:
+        id3 = ID3(mp3_path)
+    except ID3NoHeaderError:
+        id3 = ID3()
+    id3.add(TIT2(encoding=3, text=tags['title']))
+    if tags.get('artist'):
+        id3.add(TPE1(encoding=3, text=tags['artist']))
+    if tags.get('album'):
+        id3.add(TALB(encoding=3, text=tags['album']))
+    if tags.get('source_url'):
+        id3.add(WOAS(url=tags['source_url']))
+    if cover:
+        mime, data = cover
+        id3.delall('APIC')
+        id3.add(APIC(encoding=3, mime=mime, type=3, desc='Cover', data=data))
+    id3.save(mp3_path, v2_version=3)
+
+
+def write_opus_tags(path, tags, cover=None):
+    """Write Vorbis comments and optional cover art to an Ogg Opus file"""
+    audio = OggOpus(path)
+    audio['title'] = tags['title']
+    for key in ('artist', 'album'):
+        if tags.get(key):
+            audio[key] = tags[key]
+    if tags.get('source_url'):
+        audio['website'] = tags['source_url']
+    if cover:
+        picture = Picture()
+        picture.type = 3
+        picture.mime, picture.data = cover
+        picture.desc = 'Cover'
+        audio['metadata_block_picture'] = base64.b64encode(picture.write()).decode('ascii')
+    audio.save()
+
+
+def write_mp4_tags(path, tags, cover=None):
+    """Write iTunes-style tags and optional cover art to an M4A file"""
+    audio = MP4(path)
+    if audio.tags is None:
+        audio.add_tags()
+    audio.tags['\xa9nam'] = tags['title']
+    if tags.get('artist'):
+        audio.tags['\xa9ART'] = tags['artist']
+    if tags.get('album'):
+        audio.tags['\xa9alb'] = tags['album']
+    if cover:
+        mime, data = cover
+        image_format = MP4Cover.FORMAT_PNG if mime == 'image/png' else MP4Cover.FORMAT_JPEG
+        audio.tags['covr'] = [MP4Cover(data, imageformat=image_format)]
+    audio.save()
+
+
+def download_name(tags, extension='mp3'):
+    """Filesystem-safe 'Artist - Title.<extension>' name for the browser download"""
+    name = f"{tags['artist']} - {tags['title']}" if tags.get('artist') else tags['title']
+    name = re.sub(r'[\\/:*?"<>|\x00-\x1f]+', '', name)
+    name = re.sub(r'\s+', ' ', name).strip(' .')[:150] or 'audio'
+    return f'{name}.{extension}'
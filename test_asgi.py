@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import asyncio
+import os
+
+import httpx
+
+import app
+from asgi import application, cancel_on_disconnect
+from loadtest import TrafficModel, install_stubs
+
+
+def request(method, path, **kwargs):
+    async def send():
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(send())
+
+
+def test_convert_rejects_unsupported_url():
+    response = request('POST', '/convert', json={'url': 'https://example.com/video'})
+    assert response.status_code == 400
+    assert 'valid YouTube' in response.json()['error']
+
+
+def test_convert_runs_to_success_with_stubbed_extractor():
+    restore = install_stubs(app, TrafficModel(lengths={60: 1.0}), latency=0.0, realtime_factor=1000.0)
+    try:
+        response = request('POST', '/convert', json={'url': 'https://www.youtube.com/watch?v=asgiConvert'})
+        assert response.status_code == 200, response.text
+        result = response.json()
+        assert result['success'] and result['filename'].endswith('.mp3')
+        assert request('GET', f"/jobs/{result['job_id']}").json()['status'] == 'done'
+        assert request('GET', result['download_url']).status_code == 200
+
+        # The finished conversion is remembered for the next request of the same URL
+        again = request('POST', '/convert', json={'url': 'https://www.youtube.com/watch?v=asgiConvert'})
+        assert again.json()['filename'] == result['filename']
+    finally:
+        restore()
+
+
+def test_download_streams_file_with_tag_name():
+    filename = 'audio_test_asgi.mp3'
+    path = os.path.join(app.ARTIFACT_FOLDER, filename)
+    with open(path, 'wb') as f:
+        f.write(b'\xff' * 600000)
+    app.job_store.put('artifact:' + filename, {'download_name': 'Beyoncé - Halo.mp3'})
+    try:
+        response = request('GET', f'/download/{filename}')
+        assert response.status_code == 200
+        assert len(response.content) == 600000
+        assert "filename*=UTF-8''Beyonc%C3%A9%20-%20Halo.mp3" in response.headers['content-disposition']
+    finally:
+        os.remove(path)
+        app.job_store.delete('artifact:' + filename)
+
+
+def test_download_missing_file_and_traversal():
+    assert request('GET', '/download/missing.mp3').status_code == 404
+    assert request('GET', '/download/../app.py').status_code == 404
+
+
+def test_download_serves_only_converted_files():
+    # Files the app keeps next to the artifacts are never served, even if a store holds them
+    internal = os.path.join(app.ARTIFACT_FOLDER, 'jobs.db')
+    with open(internal, 'wb') as f:
+        f.write(b'SQLite format 3')
+    try:
+        for name in ('jobs.db', 'journal.jsonl', 'beats.db', '.lock', 'audio_1.mp3.part', 'audio_1.info.json'):
+            assert request('GET', f'/download/{name}').status_code == 404
+            assert app.app.test_client().get(f'/download/{name}').status_code == 404
+    finally:
+        os.remove(internal)
+    assert os.path.dirname(app.job_store.path) != app.ARTIFACT_FOLDER
+
+
+def test_other_routes_are_served_by_flask():
+    response = request('GET', '/')
+    assert response.status_code == 200
+    assert b'convert-btn' in response.content
+
+
+def test_disconnect_cancels_only_the_clients_own_job():
+    async def disconnect():
+        return {'type': 'http.disconnect'}
+
+    app.claim_job('job-disconnect-1', '10.0.0.70')
+    asyncio.run(cancel_on_disconnect(disconnect, 'job-disconnect-1', '10.0.0.71'))
+    assert app.job_store.get('cancel:job-disconnect-1') is None
+    asyncio.run(cancel_on_disconnect(disconnect, 'job-disconnect-1', '10.0.0.70'))
+    assert app.job_store.get('cancel:job-disconnect-1') is True
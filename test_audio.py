@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import os
+
+import app
+from audio import (EXTRACT_AUDIO_ARGS_KEY, MultiEncodePP, apply_normalization, loudnorm_filter, measured_loudness,
+                   mime_type, multi_encode_args, normalization_filter, parse_formats_option, parse_normalize_option,
+                   select_source_format)
+from loadtest import TrafficModel, install_stubs
+
+MEASURED = {
+    'input_i': '-23.54', 'input_tp': '-7.96', 'input_lra': '0.00',
+    'input_thresh': '-34.17', 'target_offset': '0.58',
+}
+
+
+def test_parse_normalize_option():
+    assert parse_normalize_option(None) == 'off'
+    assert parse_normalize_option(True) == 'single'
+    assert parse_normalize_option('two-pass') == 'two-pass'
+    assert parse_normalize_option('loud') is None
+
+
+def test_single_pass_filter_goes_into_the_encode():
+    opts = {}
+    assert apply_normalization(opts, 'single', 'https://www.youtube.com/watch?v=a') is False
+    assert opts['postprocessor_args'][EXTRACT_AUDIO_ARGS_KEY][:2] == ['-af', loudnorm_filter()]
+
+
+def test_two_pass_reuses_cached_measurement():
+    source = 'https://www.youtube.com/watch?v=cached'
+    opts = {}
+    assert apply_normalization(opts, 'two-pass', source) is True
+    assert 'postprocessor_args' not in opts
+
+    measured_loudness.put(source, MEASURED)
+    assert apply_normalization(opts, 'two-pass', source) is False
+    af = opts['postprocessor_args'][EXTRACT_AUDIO_ARGS_KEY][1]
+    assert 'measured_I=-23.54' in af and 'linear=true' in af
+
+
+def test_off_leaves_options_untouched():
+    opts = {}
+    assert apply_normalization(opts, 'off', 'https://www.youtube.com/watch?v=a') is False
+    assert opts == {}
+
+
+def test_parse_formats_option():
+    assert parse_formats_option(None) == ['mp3:192']
+    assert parse_formats_option('mp3, opus:96') == ['mp3:192', 'opus:96']
+    assert parse_formats_option(['aac', 'aac:192']) == ['aac:192']
+    assert parse_formats_option('flac') is None
+    assert parse_formats_option('opus:8') is None
+    assert parse_formats_option(['mp3:128', 'mp3:192', 'mp3:256', 'mp3:320', 'opus']) is None
+
+
+def test_multi_encode_decodes_once_and_splits_per_encoder():
+    outputs = [('mp3:192', 'a.mp3'), ('opus:96', 'a.opus')]
+    (mp3, mp3_opts), (opus, opus_opts) = multi_encode_args(outputs)
+    assert (mp3, opus) == ('a.mp3', 'a.opus')
+    assert mp3_opts[:2] == ['-filter_complex', '[0:a]asplit=2[out0][out1]']
+    assert opus_opts == ['-map', '[out1]', '-c:a', 'libopus', '-b:a', '96k']
+    assert mime_type('a.opus') == 'audio/ogg'
+
+
+def test_multi_encode_normalizes_before_the_split():
+    opts = {}
+    apply_normalization(opts, 'single', 'https://www.youtube.com/watch?v=a')
+    audio_filter = normalization_filter(opts)
+    assert audio_filter == loudnorm_filter()
+    (_, mp3_opts), (_, opus_opts) = multi_encode_args([('mp3:192', 'a.mp3'), ('opus:96', 'a.opus')], audio_filter)
+    assert mp3_opts[1] == f'[0:a]{audio_filter},asplit=2[out0][out1]'
+    assert mp3_opts[-2:] == ['-ar', '44100'] and opus_opts[-2:] == ['-ar', '48000']
+
+
+YOUTUBE_FORMATS = [
+    {'format_id': '18', 'vcodec': 'avc1', 'acodec': 'mp4a.40.2', 'tbr': 500, 'protocol': 'https'},
+    {'format_id': '139', 'vcodec': 'none', 'acodec': 'mp4a.40.5', 'abr': 48, 'protocol': 'https'},
+    {'format_id': '140', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 129, 'protocol': 'https'},
+    {'format_id': '140-dash', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 129, 'protocol': 'http_dash_segments'},
+    {'format_id': '251', 'vcodec': 'none', 'acodec': 'opus', 'abr': 135, 'protocol': 'http_dash_segments'},
+    {'format_id': '774', 'vcodec': 'none', 'acodec': 'opus', 'abr': 256, 'protocol': 'https'},
+]
+
+
+def test_source_format_is_the_smallest_audio_only_stream_that_is_good_enough():
+    info = {'duration': 200, 'formats': YOUTUBE_FORMATS}
+    assert select_source_format(info, 128) == '140'
+    assert select_source_format(info, 192) == '774'
+    assert select_source_format(info, 320) == '774'  # nothing reaches it: the best there is
+
+
+def test_source_format_prefers_direct_http_and_avoids_muxed_video():
+    dash_only = [f for f in YOUTUBE_FORMATS if f['format_id'] in ('18', '140-dash', '251')]
+    assert select_source_format({'formats': dash_only}, 128) == '140-dash'
+    assert select_source_format({'formats': dash_only + [dict(YOUTUBE_FORMATS[2])]}, 128) == '140'
+    assert select_source_format({'formats': YOUTUBE_FORMATS[:1]}, 128) == '18'
+    assert select_source_format({'url': 'https://example.com/a.mp3'}, 128) is None
+
+
+class EncodingStub:
+    """Mixed into the load-test stub extractor: runs MultiEncodePP by writing its outputs instead of calling FFmpeg"""
+
+    encodes = []  # (outputs, audio filter) of every multi-format encode
+
+    def __init__(self, params=None):
+        super().__init__(params)
+        self.post_processors = []
+
+    def add_post_processor(self, pp, when='post_process'):
+        self.post_processors.append(pp)
+
+    def process_ie_result(self, info, download=True):
+        info = super().process_ie_result(info, download)
+        for pp in self.post_processors:
+            if isinstance(pp, MultiEncodePP):
+                self.encodes.append((pp.outputs, normalization_filter(self.params)))
+                for _, path in pp.outputs:
+                    with open(path, 'wb') as f:
+                        f.write(b'\xff' * 1000)
+        return info
+
+
+def convert_with_encoding_stub(data, formats=None):
+    """Run one conversion through the stubs; formats replaces the stub's source format list"""
+    restore = install_stubs(app, TrafficModel(lengths={60: 1.0}), latency=0.0, realtime_factor=1000.0)
+    stub = type('EncodingYoutubeDL', (EncodingStub, app.yt_dlp.YoutubeDL), {})
+    if formats:
+        extract_info = stub.extract_info
+        stub.extract_info = lambda self, url, **kwargs: {**extract_info(self, url, **kwargs), 'formats': formats}
+    app.yt_dlp.YoutubeDL = stub
+    EncodingStub.encodes.clear()
+    try:
+        return app.run_conversion(data, '10.0.0.40')
+    finally:
+        restore()
+
+
+def test_multi_format_job_publishes_every_output():
+    result = convert_with_encoding_stub({'url': 'https://www.youtube.com/watch?v=multiFormat', 'formats': ['mp3', 'opus:96']})
+    assert [output['format'] for output in result['outputs']] == ['mp3:192', 'opus:96']
+    mp3, opus = result['outputs']
+    assert mp3['filename'].endswith('_mp3-192.mp3') and opus['filename'].endswith('_opus-96.opus')
+    assert opus['download_name'].endswith('.opus')
+    for output in result['outputs']:
+        assert os.path.exists(app.artifact_store.local_path(output['filename']))
+    (outputs, audio_filter), = EncodingStub.encodes
+    assert [spec for spec, _ in outputs] == ['mp3:192', 'opus:96'] and audio_filter is None
+
+
+def test_normalized_mp3_source_is_encoded_through_the_filter():
+    # yt-dlp's audio extraction would copy this stream untouched, without loudnorm
+    soundcloud_mp3 = [{'format_id': 'http_mp3_128', 'ext': 'mp3', 'vcodec': 'none', 'acodec': 'mp3', 'abr': 128,
+                       'protocol': 'http', 'url': 'http://stub.invalid/stream.mp3'}]
+    result = convert_with_encoding_stub({'url': 'https://soundcloud.com/artist/normalized', 'normalize': 'single'},
+                                        soundcloud_mp3)
+    assert result['filename'].endswith('.mp3')
+    (outputs, audio_filter), = EncodingStub.encodes
+    assert [spec for spec, _ in outputs] == ['mp3:192'] and audio_filter == loudnorm_filter()
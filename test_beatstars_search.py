@@ -1,87 +1,97 @@
 #!/usr/bin/env python3
 
-import yt_dlp
-
-def search_youtube_beat(beat_name, producer_name):
-    """Search for beat on YouTube and return the best match URL"""
-    if not beat_name:
-        return None
-
-    try:
-        # Beat-specific search queries (different from music tracks)
-        search_queries = [
-            f"{beat_name} beat instrumental",
-            f"{beat_name} type beat",
-            f"{producer_name} {beat_name} beat" if producer_name else f"{beat_name} beat",
-            f"{beat_name} prod",
-            f"{beat_name} beat free",
-            f"{beat_name} instrumental beat"
-        ]
-
-        for search_query in search_queries:
-            print(f"Trying search query: {search_query}")
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': True,
-                'default_search': 'ytsearch5',  # Get top 5 results for beats
-            }
-
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                try:
-                    search_results = ydl.extract_info(f"ytsearch5:{search_query}", download=False)
-
-                    if search_results and 'entries' in search_results and search_results['entries']:
-                        print(f"Found {len(search_results['entries'])} results")
-
-                        # Look for beat/instrumental content (avoid tutorials and vocal tracks)
-                        for entry in search_results['entries']:
-                            title = entry.get('title', '').lower()
-                            description = entry.get('description', '').lower() if entry.get('description') else ''
-
-                            print(f"Checking: {entry.get('title', '')}")
-
-                            # Skip tutorial videos, vocal tracks, and non-beat content
-                            skip_keywords = ['tutorial', 'how to', 'export', 'fl studio', 'logic pro', 'ableton', 'vocal', 'lyrics', 'singing', 'rap', 'hip hop']
-                            if any(keyword in title or keyword in description for keyword in skip_keywords):
-                                print(f"  Skipping (contains skip keywords): {title}")
-                                continue
-
-                            # Prefer beat/instrumental content
-                            prefer_keywords = ['beat', 'instrumental', 'type beat', 'prod', 'producer', 'free beat', 'demo']
-                            if any(keyword in title or keyword in description for keyword in prefer_keywords):
-                                video_id = entry.get('id') or entry.get('url', '').split('/')[-1].split('?')[0]
-                                print(f"  Found preferred beat match: {entry.get('title', '')}")
-                                return f"https://www.youtube.com/watch?v={video_id}"
-
-                        # If no preferred match found, return the first non-tutorial result
-                        for entry in search_results['entries']:
-                            title = entry.get('title', '').lower()
-                            description = entry.get('description', '').lower() if entry.get('description') else ''
-
-                            # Skip tutorials
-                            if not any(keyword in title or keyword in description for keyword in ['tutorial', 'how to', 'export', 'fl studio']):
-                                video_id = entry.get('id') or entry.get('url', '').split('/')[-1].split('?')[0]
-                                print(f"  Using fallback beat match: {entry.get('title', '')}")
-                                return f"https://www.youtube.com/watch?v={video_id}"
-
-                except Exception as e:
-                    print(f"Error with search query '{search_query}': {e}")
-                    continue
-
-    except Exception as e:
-        print(f"Error searching YouTube for beat: {e}")
-
-    return None
-
-# Test the improved search
-beat_name = "Plus Jamais"
-producer_name = "Beatstars Producer"
-
-print(f"Searching for beat: '{beat_name}' by '{producer_name}'")
-result = search_youtube_beat(beat_name, producer_name)
-
-if result:
-    print(f"\n✅ Found YouTube URL: {result}")
-else:
-    print("\n❌ No suitable beat found")
+import json
+import os
+
+import pytest
+
+import app
+from catalog import BeatCatalog
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'search')
+
+
+@pytest.fixture(autouse=True)
+def catalog(monkeypatch, tmp_path):
+    """An empty beat catalog per test"""
+    catalog = BeatCatalog(str(tmp_path / 'beats.db'))
+    monkeypatch.setattr(app, 'beat_catalog', catalog)
+    return catalog
+
+
+def recorded_search(monkeypatch, results):
+    """Answer youtube_search from recorded results per query; unknown queries find nothing"""
+    searched = []
+    def fake_search(query, count):
+        searched.append(query)
+        name = results.get(query)
+        if not name:
+            return []
+        with open(os.path.join(FIXTURES, name)) as f:
+            return json.load(f)
+    monkeypatch.setattr(app, 'youtube_search', fake_search)
+    return searched
+
+
+def test_beat_search_prefers_the_producer_upload(monkeypatch):
+    searched = recorded_search(monkeypatch, {'Plus Jamais Layton': 'plus_jamais_layton.json'})
+    assert app.search_youtube_beat('Plus Jamais', 'Layton') == 'https://www.youtube.com/watch?v=Y7wWyy8By_U'
+    assert searched == ['Plus Jamais Layton']
+
+
+def test_beat_search_skips_tutorials_and_vocal_tracks(monkeypatch):
+    recorded_search(monkeypatch, {
+        'Plus Jamais beat instrumental': 'plus_jamais_tutorials_only.json',
+        'Plus Jamais type beat': 'plus_jamais.json',
+    })
+    assert app.search_youtube_beat('Plus Jamais', 'Beatstars Producer') == 'https://www.youtube.com/watch?v=Y7wWyy8By_U'
+
+
+def test_generic_producer_uses_direct_searches_first(monkeypatch):
+    searched = recorded_search(monkeypatch, {
+        'Plus Jamais layton': 'plus_jamais_tutorials_only.json',
+        'Plus Jamais instrumental': 'plus_jamais.json',
+    })
+    metadata = app.beatstars_metadata('Plus Jamais', 'Beatstars Producer')
+    assert app.map_beatstars_to_youtube(metadata) == 'https://www.youtube.com/watch?v=Y7wWyy8By_U'
+    assert searched == ['Plus Jamais layton', 'Plus Jamais instrumental']
+
+
+def test_resolved_beats_are_answered_from_the_catalog(monkeypatch, catalog):
+    searched = recorded_search(monkeypatch, {'Plus Jamais Layton': 'plus_jamais_layton.json'})
+    fetched = []
+    monkeypatch.setattr(app, 'extract_beatstars_info', lambda url: fetched.append(url) or ('Plus Jamais', 'Layton'))
+    url = 'https://www.beatstars.com/beat/plus-jamais-21847271'
+    resolver = app.get_resolver('beatstars')
+    assert resolver.resolve(url).download_url == 'https://www.youtube.com/watch?v=Y7wWyy8By_U'
+    assert catalog.get('21847271')['youtube_url'] == 'https://www.youtube.com/watch?v=Y7wWyy8By_U'
+
+    # Another link to the same beat: no scrape, no search
+    resolution = resolver.resolve('https://www.beatstars.com/beat/21847271')
+    assert resolution.download_url == 'https://www.youtube.com/watch?v=Y7wWyy8By_U'
+    assert resolution.metadata['artist'] == 'Layton'
+    assert fetched == [url] and searched == ['Plus Jamais Layton']
+
+
+def test_generic_producer_tries_producers_known_for_the_title(monkeypatch, catalog):
+    catalog.put('11111111', 'Plus Jamais', 'Layton', 'https://www.youtube.com/watch?v=Y7wWyy8By_U')
+    searched = recorded_search(monkeypatch, {'Plus Jamais Layton': 'plus_jamais_layton.json'})
+    metadata = app.beatstars_metadata('Plus Jamais', 'Beatstars Producer', '22222222')
+    assert app.map_beatstars_to_youtube(metadata) == 'https://www.youtube.com/watch?v=Y7wWyy8By_U'
+    assert searched == ['Plus Jamais Layton']
+    # A generic producer never replaces a known one
+    catalog.put('11111111', 'Plus Jamais', 'Beatstars Producer')
+    assert catalog.get('11111111')['producer'] == 'Layton'
+    assert catalog.get('22222222')['producer'] is None
+
+
+def test_direct_search_guesses_are_not_recorded(monkeypatch, catalog):
+    searched = recorded_search(monkeypatch, {'Plus Jamais layton': 'plus_jamais.json'})
+    monkeypatch.setattr(app, 'extract_beatstars_info', lambda url: ('Plus Jamais', 'Beatstars Producer'))
+    resolver = app.get_resolver('beatstars')
+    for _ in range(2):
+        assert resolver.resolve('https://www.beatstars.com/beat/33333333').download_url == \
+            'https://www.youtube.com/watch?v=Y7wWyy8By_U'
+    # The guess is searched again next time instead of being served from the catalog
+    assert catalog.get('33333333')['youtube_url'] is None
+    assert searched == ['Plus Jamais layton'] * 2
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+
+import app
+from cache import StaleWhileRevalidateCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_stale_entries_are_served_while_refreshing_in_the_background():
+    clock = Clock()
+    cache = StaleWhileRevalidateCache(10, soft_ttl=60, hard_ttl=600, clock=clock)
+    assert cache.get('q', lambda: 'first') == 'first'
+    clock.now = 30
+    assert cache.get('q', lambda: 'unused') == 'first'
+
+    clock.now = 120
+    release = threading.Event()
+    calls = []
+    def slow_refresh():
+        calls.append(1)
+        release.wait(5)
+        return 'second'
+    # Stale: answered at once, one refresh for any number of requests
+    assert cache.get('q', slow_refresh) == 'first'
+    assert cache.get('q', slow_refresh) == 'first'
+    release.set()
+    wait_for(lambda: cache.get('q', lambda: 'unused') == 'second')
+    assert calls == [1]
+
+
+def test_expired_entries_block_and_failed_refreshes_keep_the_stale_value():
+    clock = Clock()
+    cache = StaleWhileRevalidateCache(10, soft_ttl=60, hard_ttl=600, clock=clock)
+    cache.get('q', lambda: 'first')
+    clock.now = 120
+    def failing():
+        raise RuntimeError('HTTP Error 429')
+    assert cache.get('q', failing) == 'first'
+    wait_for(lambda: not cache.loading)
+    assert cache.entries['q'] == ('first', 0.0)
+
+    clock.now = 1000
+    assert cache.get('q', lambda: 'fresh') == 'fresh'
+
+
+def test_empty_results_are_kept_briefly_and_never_replace_a_value():
+    clock = Clock()
+    cache = StaleWhileRevalidateCache(10, soft_ttl=60, hard_ttl=600, empty_ttl=5, clock=clock)
+    assert cache.get('q', lambda: []) == []
+    clock.now = 3
+    assert cache.get('q', lambda: ['unused']) == []
+    clock.now = 6
+    assert cache.get('q', lambda: ['found']) == ['found']
+
+    # A refresh that finds nothing keeps the stale answer
+    clock.now = 120
+    assert cache.get('q', lambda: []) == ['found']
+    wait_for(lambda: not cache.loading)
+    assert cache.entries['q'] == (['found'], 6)
+
+    uncached = StaleWhileRevalidateCache(10, soft_ttl=60, hard_ttl=600)
+    uncached.get('q', lambda: [])
+    assert len(uncached) == 0
+
+
+def test_concurrent_misses_share_one_load_and_size_is_bounded():
+    cache = StaleWhileRevalidateCache(2, soft_ttl=60, hard_ttl=600)
+    calls = []
+    def load():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'value'
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('q', load))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['value'] * 5 and calls == [1]
+
+    cache.get('a', lambda: 1)
+    cache.get('b', lambda: 2)
+    assert len(cache) == 2
+    assert cache.get('q', lambda: 'reloaded') == 'reloaded'
+
+
+def test_youtube_search_is_cached_by_normalized_query(monkeypatch):
+    searched = []
+    def fake_fetch(query, count):
+        searched.append((query, count))
+        return [{'url': 'https://www.youtube.com/watch?v=abc'}]
+    monkeypatch.setattr(app, 'fetch_youtube_search', fake_fetch)
+    monkeypatch.setattr(app, 'search_cache', StaleWhileRevalidateCache(10, 60, 600))
+    app.youtube_search('Plus Jamais  Layton', 8)
+    app.youtube_search('plus jamais layton', 8)
+    app.youtube_search('plus jamais layton', 3)
+    assert searched == [('Plus Jamais  Layton', 8), ('plus jamais layton', 3)]
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import subprocess
+import sys
+import time
+
+import pytest
+
+import app
+from cancellation import CancellationRegistry, JobCancelled
+from scheduler import FairScheduler
+
+
+def test_cancel_stops_hooks_and_kills_the_jobs_processes():
+    registry = CancellationRegistry()
+    cancellation = registry.register('job-cancel-1', 'audio_cancel_1')
+    encoder = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)', 'audio_cancel_1.mp3'])
+    bystander = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)', 'audio_other.mp3'])
+    try:
+        cancellation.check({'status': 'downloading'})
+        assert registry.cancel('job-cancel-1')
+        assert encoder.wait(timeout=5) != 0
+        assert bystander.poll() is None
+        with pytest.raises(JobCancelled):
+            cancellation.check({'status': 'downloading'})
+    finally:
+        encoder.kill()
+        bystander.kill()
+    registry.unregister(cancellation)
+    assert not registry.cancel('job-cancel-1')
+
+
+def test_cancel_requested_on_another_node_is_picked_up():
+    flags = set()
+    registry = CancellationRegistry(is_requested=flags.__contains__, poll_interval=0.01)
+    flags.add('job-cancel-early')
+    assert registry.register('job-cancel-early', 'audio_early').cancelled
+    running = registry.register('job-cancel-2', 'audio_cancel_2')
+    flags.add('job-cancel-2')
+    deadline = time.monotonic() + 5
+    while not running.cancelled and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert running.cancelled
+
+
+def test_cancelled_job_leaves_the_queue():
+    scheduler = FairScheduler(workers=1, fast_lane_slots=0)
+    blocker = scheduler.acquire('other', 100)
+    cancellation = CancellationRegistry().register('job-cancel-3', 'audio_cancel_3')
+    cancellation.event.set()
+    with pytest.raises(JobCancelled):
+        scheduler.acquire('client', 100, abort=cancellation.check)
+    assert scheduler.waiting() == 0
+    scheduler.release(blocker)
+
+
+def test_delete_job_endpoint():
+    client = app.app.test_client()
+    job = {'id': 'job-cancel-api', 'source_url': 'https://youtu.be/x'}
+    app.claim_job(job['id'], '127.0.0.1')
+    app.update_job(job, 'downloading')
+    other = client.delete('/jobs/job-cancel-api', environ_base={'REMOTE_ADDR': '10.0.0.66'})
+    assert other.status_code == 403
+    assert client.delete('/jobs/job-cancel-api').status_code == 202
+    app.fail_job(job, app.conversion_error(JobCancelled(job['id'])))
+    assert client.get('/jobs/job-cancel-api').json['status'] == 'cancelled'
+    assert client.delete('/jobs/job-cancel-api').status_code == 409
+    assert client.delete('/jobs/missing-job').status_code == 404
+
+
+def test_a_job_id_in_use_cannot_be_taken_over():
+    client = app.app.test_client()
+    app.claim_job('job-taken-0001', '10.0.0.67')
+    response = client.post('/convert', json={'url': 'https://youtu.be/dQw4w9WgXcQ', 'job_id': 'job-taken-0001'})
+    assert response.status_code == 409
+    assert not app.cancel_own_job('job-taken-0001', '127.0.0.1')
+    assert app.job_store.get('cancel:job-taken-0001') is None
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import threading
+
+import pytest
+
+from diskquota import InsufficientStorage, StorageAccountant, estimate_job_bytes
+
+MB = 1024 * 1024
+
+
+def test_estimate_uses_audio_format_sizes_and_duration():
+    info = {'duration': 200, 'formats': [
+        {'format_id': '140', 'vcodec': 'none', 'filesize': 3 * MB},
+        {'format_id': '251', 'vcodec': 'none', 'filesize_approx': 4 * MB},
+        {'format_id': '18', 'vcodec': 'avc1', 'filesize': 20 * MB},
+    ]}
+    assert estimate_job_bytes(info) == int((4 * MB + 200 * 24000) * 1.2)
+    assert estimate_job_bytes({'duration': 100}) == int((100 * 20000 + 100 * 24000) * 1.2)
+
+
+def test_finished_artifacts_are_evicted_before_rejecting(tmp_path):
+    evicted = []
+    accountant = StorageAccountant(str(tmp_path), quota=100 * MB, min_free=0, evict=evicted.append)
+    accountant.add_artifact('audio_old.mp3', 40 * MB)
+    accountant.add_artifact('audio_new.mp3', 40 * MB)
+    accountant.admit('a', 30 * MB)
+    assert evicted == ['audio_old.mp3']
+    assert accountant.used() == 70 * MB
+
+
+def test_jobs_wait_for_running_jobs_then_are_rejected(tmp_path):
+    accountant = StorageAccountant(str(tmp_path), quota=100 * MB, min_free=0)
+    accountant.admit('a', 80 * MB)
+    threading.Timer(0.05, accountant.release, ['a']).start()
+    accountant.admit('b', 50 * MB, timeout=5)
+
+    with pytest.raises(InsufficientStorage) as e:
+        accountant.admit('c', 60 * MB, timeout=0.05)
+    assert e.value.retry_after
+    with pytest.raises(InsufficientStorage) as e:
+        accountant.admit('d', 200 * MB)
+    assert e.value.retry_after is None
+
+
+def test_streamed_sources_reserve_only_their_outputs():
+    info = {'duration': 100, 'formats': [{'format_id': '251', 'vcodec': 'none', 'filesize': 4 * MB}]}
+    assert estimate_job_bytes(info, include_source=False) == int(100 * 24000 * 1.2)
+
+
+def test_artifacts_are_evicted_without_holding_the_lock(tmp_path):
+    blocked = []
+    def evict(name):
+        # Another job's accounting goes ahead while the file is deleted
+        other = threading.Thread(target=accountant.remove_artifact, args=['audio_other.mp3'])
+        other.start()
+        other.join(1)
+        blocked.append(other.is_alive())
+    accountant = StorageAccountant(str(tmp_path), quota=100 * MB, min_free=0, evict=evict)
+    accountant.add_artifact('audio_old.mp3', 60 * MB)
+    accountant.admit('a', 50 * MB)
+    assert blocked == [False]
+    assert accountant.used() == 50 * MB
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+import random
+
+from downloadtuning import MB, DownloadProfile, get_profile
+
+
+def test_profile_options():
+    profile = DownloadProfile('youtube', fragments=4, chunk_size=10 * MB, buffer_size=1024)
+    assert profile.options() == {'concurrent_fragment_downloads': 4, 'http_chunk_size': 10 * MB, 'buffersize': 1024}
+    assert get_profile('youtube').chunk_size and get_profile('newsite').fragments >= 1
+
+
+def test_concurrency_climbs_towards_the_fastest_setting():
+    # Simulated link: throughput grows with concurrency up to 8 fragments, then falls off
+    link = {1: 2 * MB, 2: 4 * MB, 4: 7 * MB, 8: 10 * MB, 16: 9 * MB}
+    profile = DownloadProfile('youtube', fragments=2, max_fragments=16, autotune=True, rng=random.Random(3))
+    for _ in range(300):
+        fragments = profile.choose_fragments()
+        profile.record(fragments, 20 * MB, 20 * MB / link[fragments])
+    assert profile.fragments == 8
+
+
+def test_small_downloads_and_disabled_tuning_are_ignored():
+    profile = DownloadProfile('youtube', fragments=4, autotune=True)
+    profile.record(4, 100 * 1024, 0.01)
+    assert profile.throughput == {}
+    fixed = DownloadProfile('youtube', fragments=4, autotune=False)
+    assert all(fixed.choose_fragments() == 4 for _ in range(50))
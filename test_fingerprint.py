@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import random
+import sys
+import time
+
+import fingerprint
+from fingerprint import FingerprintIndex, similarity
+
+
+def recording(seed, frames=240):
+    rng = random.Random(seed)
+    return [rng.getrandbits(32) for _ in range(frames)]
+
+
+def reencoded(fingerprint, flipped_bits=2, seed=0):
+    """The same recording after a lossy re-encode: a few bits differ per frame"""
+    rng = random.Random(seed)
+    noisy = []
+    for i, frame in enumerate(fingerprint):
+        if i % 2:
+            for _ in range(flipped_bits):
+                frame ^= 1 << rng.randrange(32)
+        noisy.append(frame)
+    return noisy
+
+
+def test_similarity_tolerates_offsets_and_reencodes():
+    original = recording(1)
+    assert similarity(original, original) == 1.0
+    # Re-upload starting two seconds later, re-encoded
+    assert similarity(original, reencoded(original[16:])) > 0.95
+    assert similarity(original, recording(2)) < 0.6
+
+
+def test_index_finds_matches_with_the_same_key_only():
+    index = FingerprintIndex(max_entries=2)
+    original = recording(5)
+    index.add(original, {'filename': 'audio_a.mp3'}, key='off')
+    index.add(recording(6), {'filename': 'audio_b.mp3'}, key='off')
+
+    assert index.find(reencoded(original), key='off') == {'filename': 'audio_a.mp3'}
+    assert index.find(reencoded(original), key='single') is None
+    assert index.find(original, key='off', accept=lambda entry: False) is None
+
+    # Oldest entries are evicted beyond max_entries
+    index.add(recording(7), {'filename': 'audio_c.mp3'}, key='off')
+    assert index.find(original, key='off') is None
+
+
+def test_other_keys_do_not_crowd_out_a_match():
+    index = FingerprintIndex()
+    original = recording(8)
+    index.add(reencoded(original, seed=1), {'filename': 'audio_single.mp3'}, key='single')
+    # The same recording converted with other options shares more frames with the query
+    for i in range(12):
+        index.add(original, {'filename': f'audio_off_{i}.mp3'}, key='off')
+    assert index.find(original, key='single') == {'filename': 'audio_single.mp3'}
+
+
+def test_source_fingerprint_waits_for_a_slot_and_a_token(monkeypatch):
+    import app
+    from ratelimit import UpstreamLimiter
+
+    class Selecting:
+        def __init__(self, params):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def process_ie_result(self, info, download=True):
+            return {'url': 'https://rr1.googlevideo.com/audio'}
+
+    fetched = []
+    monkeypatch.setattr(app.yt_dlp, 'YoutubeDL', Selecting)
+    monkeypatch.setattr(app, 'fingerprint_url', lambda url, headers=None: fetched.append(url) or [1, 2, 3])
+    monkeypatch.setattr(app, 'FINGERPRINT_WAIT', 0.01)
+    limiter = UpstreamLimiter('youtube', rate=0.001, burst=1)
+
+    assert app.source_fingerprint({}, {}, limiter) == [1, 2, 3]
+    # The platform has no token left: the fetch is skipped instead of bypassing the limiter
+    assert app.source_fingerprint({}, {}, limiter) is None
+    assert len(fetched) == 1
+
+    for _ in range(app.FINGERPRINT_FETCHES):
+        app.fingerprint_slots.acquire()
+    try:
+        assert app.source_fingerprint({}, {}, UpstreamLimiter('youtube', rate=100, burst=100)) is None
+    finally:
+        for _ in range(app.FINGERPRINT_FETCHES):
+            app.fingerprint_slots.release()
+    assert len(fetched) == 1
+
+
+def test_stalled_fetch_is_killed_at_the_deadline(monkeypatch):
+    class Fingerprinter:
+        def start(self, sample_rate, channels):
+            pass
+
+        def feed(self, chunk):
+            pass
+
+    # A source that sends a little audio and then stalls
+    stalled = [sys.executable, '-c', 'import sys, time; sys.stdout.write("x"); sys.stdout.flush(); time.sleep(30)']
+    monkeypatch.setattr(fingerprint, 'chromaprint', type('chromaprint', (), {'Fingerprinter': Fingerprinter}))
+    monkeypatch.setattr(fingerprint, 'fingerprint_command', lambda url, headers, seconds: stalled)
+    start = time.monotonic()
+    assert fingerprint.fingerprint_url('https://rr1.googlevideo.com/audio', timeout=0.5) is None
+    assert time.monotonic() - start < 10
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import json
+import os
+
+import app
+from journal import JobJournal, claim_folder
+
+
+def test_replay_merges_stages_and_skips_torn_lines(tmp_path):
+    journal = JobJournal(str(tmp_path / 'journal.jsonl'))
+    journal.record('a', 'downloading', timestamp='1_a')
+    journal.record('a', 'encoding')
+    journal.record('b', 'downloading', timestamp='1_b')
+    journal.record('b', 'done')
+    with open(journal.path, 'a') as f:
+        f.write('{"id": "c", "sta')
+
+    pending = journal.compact()
+    assert pending == [{'id': 'a', 'stage': 'encoding', 'timestamp': '1_a'}]
+    assert list(journal.replay()) == ['a']
+
+
+def test_journal_compacts_itself_after_finished_jobs(tmp_path):
+    journal = JobJournal(str(tmp_path / 'journal.jsonl'), compact_after=3)
+    journal.record('running', 'downloading', timestamp='1_r')
+    for job_id in ('a', 'b'):
+        journal.record(job_id, 'downloading')
+        journal.record(job_id, 'done')
+    journal.record('c', 'failed')
+    with open(journal.path) as f:
+        assert [json.loads(line)['id'] for line in f] == ['running']
+    journal.record('d', 'done')
+    assert list(journal.replay()) == ['running', 'd']
+
+
+def test_second_process_shares_the_job_store_and_finished_files():
+    assert app.ARTIFACT_FOLDER == os.path.join(app.WORK_FOLDER, 'artifacts')
+    assert os.path.dirname(app.job_store.path) == app.WORK_FOLDER
+
+
+def test_work_folder_has_a_single_owner(tmp_path):
+    first = claim_folder(str(tmp_path))
+    assert first is not None
+    assert claim_folder(str(tmp_path)) is None
+    first.close()
+
+
+def test_recovery_resumes_interrupted_jobs_and_drops_orphans(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'TEMP_FOLDER', str(tmp_path))
+    monkeypatch.setattr(app, 'journal', JobJournal(str(tmp_path / 'journal.jsonl')))
+    app.journal.record('job-resume-1', 'downloading', source_url='https://www.youtube.com/watch?v=Y7wWyy8By_U',
+                       normalize='off', resolver='youtube', platform='youtube',
+                       download_url='https://www.youtube.com/watch?v=Y7wWyy8By_U', metadata={}, timestamp='1_keep')
+    (tmp_path / 'audio_1_keep.m4a.part').write_bytes(b'partial')
+    (tmp_path / 'audio_1_orphan.webm').write_bytes(b'orphan')
+
+    resumed = []
+    def fake_download_and_convert(job, resolution):
+        resumed.append((job['timestamp'], resolution.platform.name, os.listdir(tmp_path)))
+        return app.conversion_response('audio_1_keep.mp3', 'Plus Jamais', 'Plus Jamais.mp3')
+    monkeypatch.setattr(app, 'download_and_convert', fake_download_and_convert)
+
+    app.recover_jobs()
+    timestamp, platform, files = resumed[0]
+    assert (timestamp, platform) == ('1_keep', 'youtube')
+    assert 'audio_1_keep.m4a.part' in files and 'audio_1_orphan.webm' not in files
+    assert app.journal.pending() == []
+    assert app.job_store.get('job:job-resume-1')['status'] == 'done'
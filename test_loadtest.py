@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+import app
+from loadtest import TrafficModel, install_stubs, run_stage, saturation, serve
+
+
+def test_traffic_model_mix_and_repeats():
+    model = TrafficModel(mix={'spotify': 1.0}, repeat=0.5, popular=5)
+    urls = [model.next_url() for _ in range(200)]
+    assert all(url.startswith('https://open.spotify.com/track/') for url in urls)
+    assert sum(url in model.popular for url in urls) > 50
+    assert model.duration(urls[0]) == model.duration(urls[0])
+
+
+def test_stage_against_stubbed_app():
+    model = TrafficModel(repeat=0.5, lengths={60: 1.0}, popular=3)
+    restore = install_stubs(app, model, latency=0.01, realtime_factor=1000.0)
+    server, base_url = serve(app.app)
+    try:
+        result = run_stage(base_url, model, concurrency=4, duration=1.0)
+    finally:
+        server.shutdown()
+        restore()
+    assert result['completed'] > 0
+    assert result['error_rate'] == 0.0, result['errors']
+    assert result['p95'] >= result['p50'] > 0
+
+
+def test_saturation_is_where_throughput_stops_growing():
+    results = [{'concurrency': c, 'throughput': t} for c, t in ((1, 2.0), (2, 3.9), (4, 4.0), (8, 3.5))]
+    assert saturation(results)['concurrency'] == 2
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+
+from logconfig import ContextFilter, DroppingQueueHandler, JSONFormatter, job_context
+
+
+def record(level=logging.INFO, msg='Converted %s', args=('Halo',), **extra):
+    rec = logging.LogRecord('app', level, __file__, 1, msg, args, None)
+    rec.__dict__.update(extra)
+    return rec
+
+
+def test_records_carry_the_job_id_as_structured_fields():
+    context_filter = ContextFilter()
+    with job_context('job-1234'):
+        rec = record(platform='youtube')
+        assert context_filter.filter(rec)
+    entry = json.loads(JSONFormatter().format(rec))
+    assert entry['job_id'] == 'job-1234'
+    assert entry['message'] == 'Converted Halo'
+    assert entry['platform'] == 'youtube'
+
+    rec = record()
+    context_filter.filter(rec)
+    assert rec.job_id == '-'
+
+
+def test_debug_records_are_sampled():
+    context_filter = ContextFilter(debug_sample_rate=0)
+    assert not context_filter.filter(record(logging.DEBUG))
+    assert context_filter.filter(record(logging.WARNING))
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    handler.handle(record())
+    handler.handle(record())
+    assert handler.dropped == 1
+
+
+def test_importing_the_app_leaves_logging_to_the_entry_point(tmp_path):
+    code = 'import logging, app; assert not logging.getLogger().handlers; import asgi; assert logging.getLogger().handlers'
+    env = {**os.environ, 'WORK_FOLDER': str(tmp_path), 'BEAT_CATALOG': str(tmp_path / 'beats.db')}
+    subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), env=env, check=True)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import subprocess
+import sys
+
+import pytest
+
+import longinput
+from longinput import PipelineError, encode_command, run_pipeline, wants_long_input
+
+MB = 1024 * 1024
+
+# Writes 64 MB to stdout in 1 MB blocks
+PRODUCER = "import sys\nfor _ in range(64): sys.stdout.buffer.write(b'x' * 1048576)"
+# Counts what it reads in 64 KB blocks and writes the total to argv[1]
+CONSUMER = ("import sys\ntotal = 0\nwhile True:\n    block = sys.stdin.buffer.read(65536)\n"
+            "    if not block: break\n    total += len(block)\nopen(sys.argv[1], 'w').write(str(total))")
+
+
+def test_only_long_sources_with_a_selected_format_are_streamed():
+    fmt = {'format_id': '251'}
+    assert wants_long_input(longinput.LONG_INPUT_SECONDS, fmt)
+    assert not wants_long_input(longinput.LONG_INPUT_SECONDS - 1, fmt)
+    assert not wants_long_input(None, fmt)
+    assert not wants_long_input(4 * 3600, None)
+
+
+def test_encode_command_reads_stdin_and_tags_every_output():
+    command = encode_command([('mp3:192', '/tmp/a.mp3'), ('opus:96', '/tmp/a.opus')], 'loudnorm=I=-16.0',
+                             {'title': 'Mix', 'artist': 'DJ', 'album': None})
+    assert command[command.index('-i') + 1] == 'pipe:0'
+    assert command.count('title=Mix') == 2 and command.count('artist=DJ') == 2
+    assert not any(arg.startswith('album=') for arg in command)
+    graph = command[command.index('-filter_complex') + 1]
+    assert graph.startswith('[0:a]loudnorm=I=-16.0,asplit=2')
+    # ID3 tags stay readable by older players; the Opus file gets Vorbis comments
+    assert command.index('-id3v2_version') < command.index('/tmp/a.mp3') < command.index('/tmp/a.opus')
+    assert command.count('-id3v2_version') == 1
+
+
+def test_pipeline_streams_without_buffering_the_whole_source(tmp_path):
+    result = tmp_path / 'count'
+    # Peaks include this process's memory at fork time, so compare against an empty run
+    idle_download, idle_encode = run_pipeline([sys.executable, '-c', 'pass'], [sys.executable, '-c', 'pass'])
+    download_peak, encode_peak = run_pipeline([sys.executable, '-c', PRODUCER],
+                                              [sys.executable, '-c', CONSUMER, str(result)])
+    assert int(result.read_text()) == 64 * MB
+    # Neither side holds the 64 MB passing through the pipe
+    assert download_peak - idle_download < 16 * MB
+    assert encode_peak - idle_encode < 16 * MB
+
+
+def test_pipeline_reports_the_failing_download(tmp_path):
+    failing = "import sys\nsys.stdout.write('partial')\nsys.exit('ERROR: HTTP Error 403: Forbidden')"
+    with pytest.raises(PipelineError, match='HTTP Error 403'):
+        run_pipeline([sys.executable, '-c', failing], [sys.executable, '-c', CONSUMER, str(tmp_path / 'count')])
+
+
+def test_pipeline_stops_the_download_when_the_encode_fails():
+    endless = "import sys\nwhile True: sys.stdout.buffer.write(b'x' * 65536)"
+    with pytest.raises(PipelineError, match='Invalid data'):
+        run_pipeline([sys.executable, '-c', endless], [sys.executable, '-c', "import sys; sys.exit('Invalid data found')"])
+
+
+def test_memory_ceiling_fails_the_process_not_the_host():
+    hog = "b = bytearray(512 * 1048576)"
+    with pytest.raises(PipelineError, match='MemoryError'):
+        run_pipeline([sys.executable, '-c', 'pass'], [sys.executable, '-c', hog], memory_ceiling=256 * MB)
+
+
+def test_processes_start_without_preexec_fn(monkeypatch):
+    # The server is multi-threaded: code between fork and exec could deadlock the child
+    started = []
+    popen = subprocess.Popen
+
+    def recording_popen(*args, **kwargs):
+        started.append(kwargs)
+        return popen(*args, **kwargs)
+    monkeypatch.setattr(subprocess, 'Popen', recording_popen)
+    run_pipeline([sys.executable, '-c', 'pass'], [sys.executable, '-c', 'pass'])
+    assert len(started) == 2 and not any('preexec_fn' in kwargs for kwargs in started)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import asyncio
+import os
+
+import httpx
+import pytest
+
+import app
+import asgi
+from pagescan import (PageReader, beatstars_page_ready, read_page, spotify_collection_ready, spotify_embed_ready,
+                      spotify_page_ready)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Page body after the head, as on real pages (player markup, inline bundles)
+FILLER = b'<div class="row"><span>' + b'x' * 200 + b'</span></div>\n'
+
+
+def read_fixture(folder, name, padding=0):
+    with open(os.path.join(FIXTURES, folder, name), 'rb') as f:
+        content = f.read()
+    return content.replace(b'<body>', b'<body>' + FILLER * padding, 1)
+
+
+def read_early(content, ready, chunk_size=512):
+    reader = PageReader(ready)
+    for start in range(0, len(content), chunk_size):
+        if reader.add(content[start:start + chunk_size]):
+            break
+    return reader.content
+
+
+@pytest.mark.parametrize('parser, ready, folder, name, stops_early', [
+    (app.parse_beatstars_page, beatstars_page_ready, 'beatstars', 'beat_og_title.html', True),
+    (app.parse_beatstars_page, beatstars_page_ready, 'beatstars', 'beat_json_ld.html', True),
+    (app.parse_beatstars_page, beatstars_page_ready, 'beatstars', 'generic_page.html', True),
+    (app.parse_beatstars_page, beatstars_page_ready, 'beatstars', 'beat_elements.html', False),
+    (app.parse_beatstars_page, beatstars_page_ready, 'beatstars', 'beat_title_only.html', False),
+    (app.parse_spotify_page, spotify_page_ready, 'spotify', 'track_page.html', True),
+    (app.parse_spotify_page, spotify_page_ready, 'spotify', 'track_page_og.html', True),
+    (app.parse_spotify_embed, spotify_embed_ready, 'spotify', 'embed_next_data.html', False),
+    (app.parse_spotify_embed, spotify_embed_ready, 'spotify', 'embed_title.html', None),
+    (app.parse_spotify_embed, spotify_embed_ready, 'spotify', 'embed_unavailable.html', False),
+    (app.parse_spotify_collection, spotify_collection_ready, 'spotify', 'embed_album.html', False),
+])
+def test_early_exit_gives_the_full_page_answer(parser, ready, folder, name, stops_early):
+    content = read_fixture(folder, name, padding=400)
+    partial = read_early(content, ready)
+    assert parser(partial) == parser(content)
+    if stops_early is not None:
+        assert (len(partial) < len(content) // 4) == stops_early
+
+
+class StreamedResponse:
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+        self.read = 0
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            self.read += chunk_size
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+def test_read_page_stops_the_transfer_and_caps_it():
+    content = read_fixture('beatstars', 'beat_og_title.html', padding=2000)
+    response = StreamedResponse(content)
+    page = read_page(response, beatstars_page_ready)
+    assert response.closed and not page.complete
+    assert response.read < len(content) // 10
+    assert app.parse_beatstars_page(page.content) == ('Plus Jamais', 'Layton')
+
+    endless = StreamedResponse(b'<html><body>' + FILLER * 50000)
+    page = read_page(endless, beatstars_page_ready, max_bytes=64 * 1024)
+    assert len(page.content) == 64 * 1024 and endless.closed
+
+    missing = StreamedResponse(b'Not found', status_code=404)
+    page = read_page(missing, beatstars_page_ready)
+    assert page.status_code == 404 and page.content == b'' and missing.read == 0
+
+
+def test_async_fetch_stops_reading_the_body(monkeypatch):
+    content = read_fixture('beatstars', 'beat_og_title.html', padding=2000)
+    sent = []
+
+    class Body(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            for start in range(0, len(content), 4096):
+                sent.append(start)
+                yield content[start:start + 4096]
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, stream=Body())))
+    monkeypatch.setattr(asgi, 'http_client', client)
+    page = asyncio.run(asgi.limited_get('beatstars', 'https://www.beatstars.com/beat/plus-jamais-21847271', {},
+                                        beatstars_page_ready))
+    assert app.parse_beatstars_page(page.content) == ('Plus Jamais', 'Layton')
+    assert len(sent) * 4096 < len(content) // 10
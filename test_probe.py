@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+
+import app
+
+
+def test_probe_answers_from_warm_caches():
+    url = 'https://www.youtube.com/watch?v=Y7wWyy8By_U'
+    app.info_cache.put(url, {'title': 'Plus Jamais', 'uploader': 'Layton', 'duration': 154,
+                             'thumbnails': [{'url': 'https://i.ytimg.com/vi/Y7wWyy8By_U/hqdefault.jpg', 'width': 480}]})
+    response = app.app.test_client().post('/probe', json={'url': 'https://youtu.be/Y7wWyy8By_U?si=share'})
+    assert response.status_code == 200
+    assert response.json['title'] == 'Plus Jamais'
+    assert response.json['duration'] == 154
+    assert response.json['thumbnail'].endswith('hqdefault.jpg')
+    assert response.json['converted'] is False
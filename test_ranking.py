@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+import time
+
+from ranking import KeywordMatcher, pick_beat, pick_non_tutorial, pick_track
+
+
+def entry(video_id, title, description=None):
+    return {'id': video_id, 'title': title, 'description': description}
+
+
+def test_keyword_matcher_matches_any_keyword():
+    matcher = KeywordMatcher(['beat', 'type beat', 'fl studio'])
+    assert matcher('plus jamais type beat')
+    assert matcher('made in fl studio 21')
+    assert not matcher('plus jamais (official audio)')
+
+
+def test_pick_track_prefers_official_upload():
+    entries = [entry('aaaaaaaaaaa', 'Halo (Live)'), entry('bbbbbbbbbbb', 'Beyoncé - Halo (Official Video)')]
+    assert pick_track(entries).url == 'https://www.youtube.com/watch?v=bbbbbbbbbbb'
+    assert pick_track(entries[:1]).url.endswith('aaaaaaaaaaa')
+    assert pick_track([]) is None
+
+
+def test_pick_beat_skips_tutorials_and_prefers_producer():
+    batch = [
+        entry('tutorial000', 'How to make Plus Jamais in FL Studio'),
+        entry('remix000000', 'Plus Jamais remix'),
+        entry('layton00000', 'Plus Jamais', 'Layton - 2024'),
+    ]
+    assert pick_beat([batch], 'Plus Jamais', 'Layton').entry['id'] == 'layton00000'
+    # Without a producer, a plain name match still beats nothing
+    assert pick_beat([batch], 'Plus Jamais', 'Beatstars Producer').entry['id'] == 'remix000000'
+
+
+def test_pick_beat_stops_at_first_batch_with_a_match():
+    searched = []
+    def batches():
+        for query in ('first', 'second', 'third'):
+            searched.append(query)
+            yield [] if query == 'first' else [entry(query.ljust(11, '0'), f'Plus Jamais type beat {query}')]
+    assert pick_beat(batches(), 'Plus Jamais', None).entry['title'].endswith('second')
+    assert searched == ['first', 'second']
+
+
+def test_pick_non_tutorial():
+    entries = [entry('tutorial000', 'Beat tutorial'), entry('beat0000000', 'Plus Jamais beat')]
+    assert pick_non_tutorial(entries).entry['id'] == 'beat0000000'
+
+
+def test_ranking_many_results_stays_cheap():
+    batch = [entry(f'{i:011d}', f'Random upload {i}', 'vlog ' * 200) for i in range(5000)]
+    start = time.perf_counter()
+    assert pick_beat([batch], 'Plus Jamais', 'Layton') is None
+    assert time.perf_counter() - start < 1.0
+
+
+def test_pick_track_passes_over_results_of_another_length():
+    entries = [{'id': 'aaaaaaaaaaa', 'title': 'Djadja (Official Audio) [1 hour loop]', 'duration': 3600},
+               {'id': 'bbbbbbbbbbb', 'title': 'Djadja', 'duration': 172}]
+    assert pick_track(entries, duration=170.9).url.endswith('bbbbbbbbbbb')
+    assert pick_track(entries).url.endswith('aaaaaaaaaaa')
+    # Nothing fits: the usual pick
+    assert pick_track(entries[:1], duration=170.9).url.endswith('aaaaaaaaaaa')
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import pytest
+
+from ratelimit import CircuitBreaker, ClientQuota, TokenBucket, UpstreamLimiter, UpstreamThrottled
+
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() > 0
+    assert not bucket.acquire(timeout=0.1)
+
+
+def test_circuit_opens_after_repeated_throttling():
+    breaker = CircuitBreaker(threshold=2, base_backoff=60, max_backoff=60)
+    breaker.record_throttle()
+    assert breaker.allow() == 0
+    breaker.record_throttle()
+    # Backoff is 60s with +/-50% jitter
+    assert 30 <= breaker.allow() <= 90
+
+
+def test_circuit_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(threshold=1, base_backoff=0, max_backoff=0)
+    breaker.record_throttle()
+    assert breaker.allow() == 0
+    assert breaker.allow() > 0
+    breaker.record_success()
+    assert breaker.allow() == 0
+    assert breaker.allow() == 0
+
+
+def test_half_open_probe_is_released_when_it_fails_fast():
+    limiter = UpstreamLimiter('youtube', rate=100, burst=100)
+    limiter.breaker = CircuitBreaker(threshold=1, base_backoff=0, max_backoff=0)
+    limiter.breaker.record_throttle()
+    with pytest.raises(UpstreamThrottled):
+        with limiter.guard():
+            raise UpstreamThrottled('soundcloud', 30)
+    assert not limiter.breaker.probing
+    with limiter.guard():
+        pass
+    assert limiter.breaker.trips == 0
+
+
+def test_connection_errors_count_against_the_upstream(monkeypatch):
+    import requests
+
+    import app
+    limiter = UpstreamLimiter('spotify', rate=100, burst=100)
+    monkeypatch.setattr(app, 'get_limiter', lambda platform: limiter)
+
+    def unreachable(url, **kwargs):
+        raise requests.ConnectionError('Connection refused')
+    monkeypatch.setattr(app.requests, 'get', unreachable)
+    for _ in range(3):
+        with pytest.raises(requests.ConnectionError):
+            app.limited_get('spotify', 'https://open.spotify.com/track/x')
+    with pytest.raises(UpstreamThrottled):
+        app.limited_get('spotify', 'https://open.spotify.com/track/x')
+
+
+def test_limiter_guard_fails_fast_after_429s():
+    limiter = UpstreamLimiter('youtube', rate=100, burst=100)
+    for _ in range(3):
+        with pytest.raises(Exception):
+            with limiter.guard():
+                raise Exception('HTTP Error 429: Too Many Requests')
+    with pytest.raises(UpstreamThrottled):
+        with limiter.guard():
+            pass
+
+
+def test_limiter_guard_ignores_other_errors():
+    limiter = UpstreamLimiter('youtube', rate=100, burst=100)
+    for _ in range(5):
+        with pytest.raises(Exception):
+            with limiter.guard():
+                raise Exception('Video unavailable')
+    with limiter.guard():
+        pass
+
+
+def test_client_quota_is_per_client():
+    quota = ClientQuota(rate=0.01, burst=2)
+    assert quota.check('1.2.3.4') == 0
+    assert quota.check('1.2.3.4') == 0
+    assert quota.check('1.2.3.4') > 0
+    assert quota.check('5.6.7.8') == 0
+
+
+def test_client_quota_forgets_the_least_recently_seen_draining_clients():
+    quota = ClientQuota(rate=0.01, burst=2, max_clients=3)
+    for client in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+        quota.check(client)
+    quota.check('10.0.0.1')
+    # Every bucket is still draining, so only the cap keeps the map bounded
+    for client in ('10.0.0.4', '10.0.0.5'):
+        quota.check(client)
+    assert list(quota.buckets) == ['10.0.0.1', '10.0.0.4', '10.0.0.5']
+    assert quota.check('10.0.0.1') > 0
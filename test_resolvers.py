@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+import pytest
+
+import app  # registers the platform resolvers
+from resolvers import find_resolver
+
+
+@pytest.mark.parametrize('url, name, canonical', [
+    ('https://youtu.be/dQw4w9WgXcQ?si=abc123', 'youtube', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'),
+    ('https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PL123&index=2&t=42', 'youtube', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'),
+    ('youtube.com/shorts/dQw4w9WgXcQ', 'youtube', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'),
+    ('https://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ', 'youtube', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'),
+    ('https://music.youtube.com/watch?v=dQw4w9WgXcQ&si=xyz', 'youtube_music', 'https://music.youtube.com/watch?v=dQw4w9WgXcQ'),
+    ('https://m.soundcloud.com/artist/track/?utm_source=clipboard', 'soundcloud', 'https://soundcloud.com/artist/track'),
+    ('https://open.spotify.com/intl-fr/track/4S84adgZ72y8M4ebSZkn1S?si=123', 'spotify', 'https://open.spotify.com/track/4S84adgZ72y8M4ebSZkn1S'),
+    ('https://beatstars.com/beat/plus-jamais-21847271?ref=share', 'beatstars', 'https://www.beatstars.com/beat/plus-jamais-21847271'),
+])
+def test_resolver_dispatch_and_canonical_url(url, name, canonical):
+    resolver = find_resolver(url)
+    assert resolver.name == name
+    assert resolver.canonicalize(url) == canonical
+
+
+@pytest.mark.parametrize('url', [
+    'https://example.com/watch?v=dQw4w9WgXcQ',
+    'https://notyoutube.com.evil.org/watch',
+    'not a url',
+])
+def test_unsupported_urls_have_no_resolver(url):
+    assert find_resolver(url) is None
+
+
+def test_direct_sources_resolve_without_network():
+    resolver = find_resolver('https://youtu.be/dQw4w9WgXcQ')
+    resolution = resolver.resolve(resolver.canonicalize('https://youtu.be/dQw4w9WgXcQ'))
+    assert resolution.download_url == 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+    assert resolution.platform is resolver
+
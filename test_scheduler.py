@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+
+import pytest
+
+from scheduler import FairScheduler, SchedulerBusy, job_cost
+
+SHORT = job_cost(200)
+LONG = job_cost(3600)
+
+
+def queue_jobs(scheduler, jobs, order):
+    """Start one thread per (client, cost), each waiting in the queue before the next is added"""
+    threads = []
+    for client, cost in jobs:
+        def run(client=client, cost=cost):
+            with scheduler.slot(client, cost):
+                order.append(client)
+        waiting = scheduler.waiting()
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        while scheduler.waiting() == waiting:
+            time.sleep(0.001)
+    return threads
+
+
+def test_heavy_client_does_not_starve_others():
+    scheduler = FairScheduler(workers=1, fast_lane_slots=0)
+    order = []
+    blocker = scheduler.acquire('warmup', SHORT)
+    threads = queue_jobs(scheduler, [('mixes', LONG)] * 4 + [('single', SHORT), ('other', SHORT)], order)
+    scheduler.release(blocker)
+    for thread in threads:
+        thread.join()
+    # The short tracks submitted last still run before most of the hour-long mixes
+    assert order.index('single') <= 1 and order.index('other') <= 2
+    assert order.count('mixes') == 4
+
+
+def test_fast_lane_keeps_a_slot_for_short_jobs():
+    scheduler = FairScheduler(workers=2, fast_lane_slots=1, max_wait=0.05)
+    running = scheduler.acquire('mixes', LONG)
+    with pytest.raises(SchedulerBusy):
+        scheduler.acquire('mixes', LONG)
+    short = scheduler.acquire('single', SHORT)
+    scheduler.release(short)
+    scheduler.release(running)
+    assert scheduler.waiting() == 0 and scheduler.running == 0
+
+
+def test_cost_grows_with_length_and_work():
+    assert job_cost(3600) > job_cost(200)
+    assert job_cost(200, outputs=3, two_pass=True) > job_cost(200)
+    assert job_cost(None) == job_cost(600)
+
+
+def test_admission_turns_jobs_away_beyond_capacity():
+    scheduler = FairScheduler(workers=2, max_queued=1)
+    assert scheduler.capacity == 3
+    with scheduler.admission(), scheduler.admission(), scheduler.admission():
+        with pytest.raises(SchedulerBusy):
+            with scheduler.admission():
+                pass
+    with scheduler.admission():
+        assert scheduler.admitted == 1
+    assert scheduler.admitted == 0
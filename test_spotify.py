@@ -1,86 +1,185 @@
 #!/usr/bin/env python3
 
-import requests
-from bs4 import BeautifulSoup
-import re
-import json
-
-def extract_spotify_info(spotify_url):
-    try:
-        url_match = re.search(r'/track/([a-zA-Z0-9]+)', spotify_url)
-        if url_match:
-            track_id = url_match.group(1)
-            print(f'Extracted Spotify track ID: {track_id}')
-
-            embed_url = f'https://open.spotify.com/embed/track/{track_id}'
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Referer': 'https://open.spotify.com/'
-            }
-
-            response = requests.get(embed_url, headers=headers, timeout=15)
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-
-                scripts = soup.find_all('script')
-                for script in scripts:
-                    if script.string and ('entity' in script.string):
-                        print(f'Found script with entity data, length: {len(script.string)}')
-                        try:
-                            json_start = script.string.find('{')
-                            json_end = script.string.rfind('}') + 1
-
-                            if json_start != -1 and json_end > json_start:
-                                json_str = script.string[json_start:json_end]
-                                data = json.loads(json_str)
-
-                                if 'props' in data and 'pageProps' in data['props']:
-                                    state = data['props']['pageProps'].get('state', {})
-                                    entity_data = state.get('data', {}).get('entity', {})
-
-                                    if entity_data.get('type') == 'track':
-                                        track_name = entity_data.get('name')
-                                        artists = entity_data.get('artists', [])
-                                        if artists and len(artists) > 0:
-                                            artist_name = artists[0].get('name')
-
-                                            if track_name and artist_name:
-                                                return track_name, artist_name
-
-                        except json.JSONDecodeError:
-                            name_match = re.search(r'"name"\s*:\s*"([^"]+)"', script.string)
-                            if name_match:
-                                track_name = name_match.group(1)
-                                print(f'Found track name via regex: {track_name}')
-
-                                artist_match = re.search(r'"artists"\s*:\s*\[\s*\{[^}]*"name"\s*:\s*"([^"]+)"', script.string)
-                                if artist_match:
-                                    artist_name = artist_match.group(1)
-                                    print(f'Found artist name via regex: {artist_name}')
-                                    return track_name, artist_name
-                        except Exception as e:
-                            print(f'Error parsing script: {e}')
-                            continue
-
-        return None, None
-
-    except Exception as e:
-        print(f'Error: {e}')
-        return None, None
-
-# Test with Spotify URL
-url = 'https://open.spotify.com/intl-fr/track/4S84adgZ72y8M4ebSZkn1S'
-track_name, artist_name = extract_spotify_info(url)
-print(f'\nSpotify Result: Track="{track_name}", Artist="{artist_name}"')
-
-# Test with Beatstars URLs
-beatstars_urls = [
-    'https://www.beatstars.com/beat/plus-jamais-21847271',
-    'https://www.beatstars.com/beat/21847271'
-]
-
-for url in beatstars_urls:
-    beat_name, producer_name = extract_beatstars_info(url)
-    print(f'\nBeatstars Result for {url}: Beat="{beat_name}", Producer="{producer_name}"')
+import os
+import threading
+import time
+import uuid
+
+import pytest
+
+import app
+from cache import StaleWhileRevalidateCache
+from resolvers import Resolution
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'spotify')
+
+# Per-page parse budget; generous so only real slowdowns fail
+PARSE_BUDGET_MS = 50
+
+
+def parse_fixture(parser, name, record_property):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        content = f.read()
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        result = parser(content)
+        timings.append((time.perf_counter() - start) * 1000)
+    record_property('parse_ms', round(min(timings), 3))
+    assert min(timings) < PARSE_BUDGET_MS
+    return result
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('embed_next_data.html', ('Djadja', 'Aya Nakamura')),
+    ('embed_title.html', ('Pookie', 'Aya Nakamura')),
+    ('embed_truncated_json.html', ('Copines', 'Aya Nakamura')),
+    ('embed_unavailable.html', None),
+])
+def test_parse_spotify_embed(name, expected, record_property):
+    assert parse_fixture(app.parse_spotify_embed, name, record_property) == expected
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('track_page.html', ('Djadja', 'Aya Nakamura')),
+    ('track_page_og.html', ('Djadja', 'Aya Nakamura')),
+])
+def test_parse_spotify_page(name, expected, record_property):
+    assert parse_fixture(app.parse_spotify_page, name, record_property) == expected
+
+
+class Page:
+    def __init__(self, name, status_code=200):
+        self.status_code = status_code
+        with open(os.path.join(FIXTURES, name), 'rb') as f:
+            self.content = f.read()
+
+
+def test_extract_falls_back_from_embed_to_track_page(monkeypatch):
+    fetched = []
+    def fake_get(platform, url, **kwargs):
+        fetched.append(url)
+        return Page('embed_unavailable.html') if '/embed/' in url else Page('track_page.html')
+    monkeypatch.setattr(app, 'limited_get', fake_get)
+
+    url = 'https://open.spotify.com/track/4S84adgZ72y8M4ebSZkn1S'
+    assert app.extract_spotify_info(url) == ('Djadja', 'Aya Nakamura')
+    assert fetched == ['https://open.spotify.com/embed/track/4S84adgZ72y8M4ebSZkn1S', url]
+
+
+def test_parse_spotify_collection_lists_every_playable_track(record_property):
+    name, tracks = parse_fixture(app.parse_spotify_collection, 'embed_album.html', record_property)
+    assert name == 'NAKAMURA'
+    assert [t['title'] for t in tracks] == ['Djadja', 'Copines', 'Pookie']
+    assert tracks[0] == {'title': 'Djadja', 'artist': 'Aya Nakamura', 'duration': 170.92,
+                         'url': 'https://open.spotify.com/track/4S84adgZ72y8M4ebSZkn1S'}
+    assert tracks[2]['artist'] == 'Aya Nakamura, Capo Plaza'
+    assert parse_fixture(app.parse_spotify_collection, 'embed_next_data.html', record_property) is None
+
+
+def test_playlist_converts_every_track_from_one_page_fetch(monkeypatch):
+    fetched, searched, converted = [], [], []
+    def fake_get(platform, url, **kwargs):
+        fetched.append(url)
+        return Page('embed_album.html')
+    def fake_search(query, count):
+        searched.append(query)
+        # An extended version first; the track's length picks the right upload
+        return [{'id': 'extendedmix', 'title': query + ' (extended)', 'duration': 400},
+                {'id': 'Y7wWyy8By_U', 'title': query, 'duration': 165}]
+    def fake_convert(job, resolution):
+        converted.append((resolution.metadata['title'], resolution.download_url))
+        return app.outputs_response(resolution.metadata['title'], [
+            {'format': 'mp3:192', 'filename': f"audio_{job['id']}.mp3", 'download_name': 'track.mp3'}])
+    monkeypatch.setattr(app, 'limited_get', fake_get)
+    monkeypatch.setattr(app, 'fetch_youtube_search', fake_search)
+    monkeypatch.setattr(app, 'download_and_convert', fake_convert)
+    monkeypatch.setattr(app, 'search_cache', StaleWhileRevalidateCache(10, 60, 600))
+
+    client = app.app.test_client()
+    response = client.post('/playlist', json={'url': 'https://open.spotify.com/intl-fr/album/2F9pGbNfdCdfL3G2jLbQkW?si=x'},
+                           environ_base={'REMOTE_ADDR': '10.0.0.48'})
+    assert response.status_code == 202
+    playlist = response.json
+    assert fetched == ['https://open.spotify.com/embed/album/2F9pGbNfdCdfL3G2jLbQkW']
+    assert [t['title'] for t in playlist['tracks']] == ['Djadja', 'Copines', 'Pookie']
+
+    deadline = time.monotonic() + 5
+    while client.get(f"/jobs/{playlist['id']}").json['status'] != 'done':
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    tracks = client.get(f"/jobs/{playlist['id']}").json['tracks']
+    assert [t['status'] for t in tracks] == ['done'] * 3
+    assert sorted(title for title, _ in converted) == ['Copines', 'Djadja', 'Pookie']
+    assert all(url == 'https://www.youtube.com/watch?v=Y7wWyy8By_U' for _, url in converted)
+    # One search per track: the first query finds an upload of the right length
+    assert len(searched) == 3
+    assert client.get(f"/jobs/{tracks[0]['job_id']}").json['status'] == 'done'
+
+
+def test_convert_points_collections_to_the_playlist_route():
+    response = app.app.test_client().post('/convert', json={'url': 'https://open.spotify.com/playlist/37i9dQZF1DXcBWIGoYBM5M'})
+    assert response.status_code == 400
+    assert '/playlist' in response.json['error']
+
+
+def test_playlist_tracks_queue_per_client_and_take_a_quota_token_each(monkeypatch):
+    release, lock = threading.Event(), threading.Lock()
+    running, peak, charged, finished = {}, {}, [], []
+    class RecordingQuota:
+        def check(self, client_id):
+            charged.append(client_id)
+            return 0
+    def fake_resolve(job, metadata=None):
+        return Resolution(job['resolver'], job['source_url'], job['source_url'], job['resolver'], metadata)
+    def fake_convert(job, resolution):
+        client_id = job['client_id']
+        with lock:
+            running[client_id] = running.get(client_id, 0) + 1
+            peak[client_id] = max(peak.get(client_id, 0), running[client_id])
+        if client_id == '10.0.0.1':
+            release.wait(5)
+        with lock:
+            running[client_id] -= 1
+            finished.append(client_id)
+        return app.outputs_response(job['source_url'], [])
+    monkeypatch.setattr(app, 'client_quota', RecordingQuota())
+    monkeypatch.setattr(app, 'resolve_job', fake_resolve)
+    monkeypatch.setattr(app, 'download_and_convert', fake_convert)
+
+    def queue(client_id, count):
+        playlist = {'id': uuid.uuid4().hex, 'status': 'running', 'tracks': []}
+        entries = []
+        for i in range(count):
+            job = app.new_job(uuid.uuid4().hex, app.get_resolver('spotify'),
+                              f'https://open.spotify.com/track/{client_id}-{i}', 'off')
+            job['client_id'] = client_id
+            playlist['tracks'].append({'job_id': job['id'], 'status': 'queued'})
+            entries.append((playlist, job, {'title': str(i), 'artist': 'a', 'duration': 100}, i == 0))
+        app.queue_playlist_tracks(client_id, entries)
+        return playlist
+
+    # A long playlist blocked in conversion does not hold up another client's short one
+    long_playlist = queue('10.0.0.1', 10)
+    deadline = time.monotonic() + 5
+    while peak.get('10.0.0.1') != app.PLAYLIST_CLIENT_WORKERS:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    short_playlist = queue('10.0.0.2', 2)
+    while short_playlist['status'] != 'done':
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert finished.count('10.0.0.1') == 0
+
+    release.set()
+    while long_playlist['status'] != 'done':
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert peak['10.0.0.1'] == app.PLAYLIST_CLIENT_WORKERS
+    # The first track of each playlist was paid for when the playlist was posted
+    assert charged.count('10.0.0.1') == 9 and charged.count('10.0.0.2') == 1
+    # Workers exit with their queue
+    while '10.0.0.1' in app.playlist_workers:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert '10.0.0.1' not in app.playlist_queues
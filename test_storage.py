@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import os
+
+from mutagen.id3 import ID3
+
+import app
+from storage import LocalArtifactStore, S3ArtifactStore, SQLiteJobStore
+
+
+class FakeS3:
+    """In-memory stand-in for the boto3 S3 client calls the store makes"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_file(self, path, bucket, key, ExtraArgs=None):
+        with open(path, 'rb') as f:
+            self.objects[(bucket, key)] = f.read()
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise KeyError(Key)
+        return {}
+
+    def download_file(self, bucket, key, path):
+        with open(path, 'wb') as f:
+            f.write(self.objects[(bucket, key)])
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def generate_presigned_url(self, method, ExpiresIn, Params):
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}"
+
+
+def test_sqlite_job_store_expiry(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / 'jobs.db'))
+    store.put('job:a', {'status': 'done'})
+    store.put('job:b', {'status': 'done'}, ttl=-1)
+    assert store.get('job:a') == {'status': 'done'}
+    assert store.get('job:b') is None
+    store.delete('job:a')
+    assert store.get('job:a') is None
+
+
+def test_sqlite_job_store_add_keeps_live_records(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / 'jobs.db'))
+    assert store.add('owner:a', '10.0.0.1', ttl=60)
+    assert not store.add('owner:a', '10.0.0.2', ttl=60)
+    assert store.get('owner:a') == '10.0.0.1'
+    store.put('owner:b', '10.0.0.1', ttl=-1)
+    assert store.add('owner:b', '10.0.0.2')
+    assert store.get('owner:b') == '10.0.0.2'
+
+
+def test_local_artifact_store_moves_files_in(tmp_path):
+    store = LocalArtifactStore(str(tmp_path / 'shared'))
+    work = tmp_path / 'audio_1.mp3'
+    work.write_bytes(b'mp3')
+    store.put(str(work), 'audio_1.mp3')
+    assert not work.exists()
+    assert open(store.local_path('audio_1.mp3'), 'rb').read() == b'mp3'
+    assert not store.exists('../audio_1.mp3')
+    store.delete('audio_1.mp3')
+    assert store.local_path('audio_1.mp3') is None
+
+
+def test_local_artifact_store_fetches_copies(tmp_path):
+    store = LocalArtifactStore(str(tmp_path / 'shared'))
+    (tmp_path / 'audio_a.mp3').write_bytes(b'mp3')
+    assert store.put(str(tmp_path / 'audio_a.mp3'), 'audio_a.mp3') == 3
+    store.fetch('audio_a.mp3', str(tmp_path / 'copy.mp3'))
+    assert (tmp_path / 'copy.mp3').read_bytes() == b'mp3'
+    assert os.stat(tmp_path / 'copy.mp3').st_ino != os.stat(store.local_path('audio_a.mp3')).st_ino
+
+
+def test_s3_artifact_store_with_stand_in(tmp_path):
+    client = FakeS3()
+    store = S3ArtifactStore('bucket', '/mp3/', client=client)
+    work = tmp_path / 'audio_2.mp3'
+    work.write_bytes(b'mp3')
+    store.put(str(work), 'audio_2.mp3')
+    assert client.objects[('bucket', 'mp3/audio_2.mp3')] == b'mp3'
+    assert store.exists('audio_2.mp3') and store.local_path('audio_2.mp3') is None
+    assert store.url('audio_2.mp3', 'A - B.mp3') == 'https://s3.test/bucket/mp3/audio_2.mp3'
+    store.fetch('audio_2.mp3', str(tmp_path / 'copy.mp3'))
+    assert (tmp_path / 'copy.mp3').read_bytes() == b'mp3'
+
+
+def test_any_node_serves_status_and_downloads(monkeypatch):
+    client = FakeS3()
+    monkeypatch.setattr(app, 'artifact_store', S3ArtifactStore('bucket', client=client))
+    client.objects[('bucket', 'audio_remote.mp3')] = b'mp3'
+    app.remember_result(('https://youtu.be/x', 'off'), 'audio_remote.mp3', 'Halo', 'Beyoncé - Halo.mp3')
+    app.update_job({'id': 'job-remote-1', 'source_url': 'https://youtu.be/x'}, 'done', filename='audio_remote.mp3')
+
+    test_client = app.app.test_client()
+    assert test_client.get('/jobs/job-remote-1').json['status'] == 'done'
+    assert test_client.get('/jobs/missing-job').status_code == 404
+    response = test_client.get('/download/audio_remote.mp3')
+    assert response.status_code == 302
+    assert response.headers['Location'] == 'https://s3.test/bucket/audio_remote.mp3'
+    assert app.cached_result(('https://youtu.be/x', 'off'))['title'] == 'Halo'
+
+
+def test_each_output_format_is_cached_separately(monkeypatch):
+    client = FakeS3()
+    monkeypatch.setattr(app, 'artifact_store', S3ArtifactStore('bucket', client=client))
+    resolver = app.find_resolver('https://youtu.be/y')
+    both = app.new_job('job-formats-1', resolver, 'https://youtu.be/y', 'off', ['mp3:192', 'opus:128'])
+    opus_only = app.new_job('job-formats-2', resolver, 'https://youtu.be/y', 'off', ['opus:128'])
+
+    client.objects[('bucket', 'audio_y_opus-128.opus')] = b'opus'
+    app.remember_result(app.output_cache_key(both, 'opus:128'), 'audio_y_opus-128.opus', 'Y', 'Y.opus')
+    assert app.cached_response(both) is None
+    assert app.cached_response(opus_only)['outputs'][0]['download_url'] == '/download/audio_y_opus-128.opus'
+
+    client.objects[('bucket', 'audio_y_mp3-192.mp3')] = b'mp3'
+    app.remember_result(app.output_cache_key(both, 'mp3:192'), 'audio_y_mp3-192.mp3', 'Y', 'Y.mp3')
+    response = app.cached_response(both)
+    assert response['filename'] == 'audio_y_mp3-192.mp3'
+    assert [output['format'] for output in response['outputs']] == ['mp3:192', 'opus:128']
+
+
+def test_same_media_under_another_url_is_retagged_not_converted(monkeypatch, tmp_path):
+    store = LocalArtifactStore(str(tmp_path / 'shared'))
+    monkeypatch.setattr(app, 'artifact_store', store)
+    download_url = 'https://www.youtube.com/watch?v=bnVUHWCynig'
+    youtube = app.new_job('job-link-1', app.find_resolver(download_url), download_url, 'off')
+    youtube_resolution = app.Resolution(youtube['resolver'], download_url, download_url, youtube['resolver'], None)
+    (tmp_path / 'audio_1.mp3').write_bytes(b'mp3')
+    app.write_tags(str(tmp_path / 'audio_1.mp3'), app.track_tags({'title': 'Halo (Official Video)'}, None, download_url))
+    store.put(str(tmp_path / 'audio_1.mp3'), 'audio_1.mp3')
+    app.remember_result(app.download_cache_key(youtube, youtube_resolution, 'mp3:192'), 'audio_1.mp3', 'Halo',
+                        'Halo (Official Video).mp3')
+
+    spotify_url = 'https://open.spotify.com/track/4JehYebiI9JE8sR8MisGVb'
+    spotify = app.new_job('job-link-2', app.find_resolver(spotify_url), spotify_url, 'off')
+    resolution = app.Resolution(spotify['resolver'], spotify_url, download_url, youtube['resolver'],
+                                {'title': 'Halo', 'artist': 'Beyoncé'})
+    response = app.copy_converted_outputs(spotify, resolution, {'title': 'Halo'}, 'link_2')
+    assert response['download_name'] == 'Beyoncé - Halo.mp3'
+    assert response['filename'] != 'audio_1.mp3'
+    assert app.cached_response(spotify)['filename'] == response['filename']
+    # A copy of its own with this request's tags; the first conversion keeps its own
+    tags = ID3(store.local_path(response['filename']))
+    assert (str(tags['TIT2']), str(tags['TPE1']), tags['WOAS'].url) == ('Halo', 'Beyoncé', spotify_url)
+    assert str(ID3(store.local_path('audio_1.mp3'))['TIT2']) == 'Halo (Official Video)'
+    assert not os.path.exists(app.output_path('link_2', 'mp3:192'))
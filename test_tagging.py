@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+from mutagen.id3 import ID3
+
+import tagging
+from tagging import MAX_THUMBNAIL_BYTES, download_name, fetch_cover, pick_thumbnail, track_tags, write_tags
+
+
+def test_scraped_metadata_wins_over_upload_info():
+    info = {'title': 'Plus Jamais (Official Audio) [HD]', 'uploader': 'SomeChannel'}
+    tags = track_tags(info, {'title': 'Plus Jamais', 'artist': 'Layton'}, 'https://www.beatstars.com/beat/plus-jamais-21847271')
+    assert tags['title'] == 'Plus Jamais'
+    assert tags['artist'] == 'Layton'
+
+
+def test_generic_producer_falls_back_to_uploader():
+    tags = track_tags({'uploader': 'Layton Beats'}, {'title': 'Plus Jamais', 'artist': 'Beatstars Producer'}, None)
+    assert tags['artist'] == 'Layton Beats'
+
+
+def test_pick_thumbnail_prefers_smallest_large_enough_jpeg():
+    info = {'thumbnails': [
+        {'url': 'https://i.ytimg.com/vi/x/default.jpg', 'width': 120},
+        {'url': 'https://i.ytimg.com/vi_webp/x/hqdefault.webp', 'width': 480},
+        {'url': 'https://i.ytimg.com/vi/x/hqdefault.jpg', 'width': 480},
+        {'url': 'https://i.ytimg.com/vi/x/maxresdefault.jpg', 'width': 1280},
+    ]}
+    assert pick_thumbnail(info) == 'https://i.ytimg.com/vi/x/hqdefault.jpg'
+
+
+def test_download_name_is_filesystem_safe():
+    assert download_name({'title': 'What?/Why: "Now"', 'artist': 'AC/DC'}) == 'ACDC - WhatWhy Now.mp3'
+    assert download_name({'title': '...', 'artist': None}) == 'audio.mp3'
+
+
+def test_write_tags_round_trip(tmp_path):
+    mp3_path = str(tmp_path / 'audio.mp3')
+    open(mp3_path, 'wb').close()
+    write_tags(mp3_path, {'title': 'Plus Jamais', 'artist': 'Layton', 'album': None,
+                          'source_url': 'https://youtu.be/Y7wWyy8By_U'},
+               cover=('image/jpeg', b'\xff\xd8\xff\xe0fake'))
+    id3 = ID3(mp3_path)
+    assert id3['TIT2'].text == ['Plus Jamais']
+    assert id3['TPE1'].text == ['Layton']
+    assert id3['WOAS'].url == 'https://youtu.be/Y7wWyy8By_U'
+    assert id3.getall('APIC')[0].data.startswith(b'\xff\xd8')
+
+
+class StreamedThumbnail:
+    def __init__(self, content):
+        self.status_code = 200
+        self.content = content
+        self.read = 0
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            self.read += chunk_size
+            yield self.content[start:start + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+
+def test_fetch_cover_stops_reading_oversized_thumbnails(monkeypatch):
+    responses = {'https://i.ytimg.com/big.jpg': StreamedThumbnail(b'\xff\xd8' + b'\0' * (10 * MAX_THUMBNAIL_BYTES)),
+                 'https://i.ytimg.com/small.png': StreamedThumbnail(b'\x89PNG' + b'\0' * 1000)}
+    monkeypatch.setattr(tagging, 'Image', None)
+    monkeypatch.setattr(tagging.requests, 'get', lambda url, **kwargs: responses[url])
+
+    assert fetch_cover('https://i.ytimg.com/big.jpg') is None
+    big = responses['https://i.ytimg.com/big.jpg']
+    assert big.closed and big.read <= MAX_THUMBNAIL_BYTES + tagging.CHUNK_SIZE
+    assert fetch_cover('https://i.ytimg.com/small.png') == ('image/png', b'\x89PNG' + b'\0' * 1000)
+
+
+def test_job_cover_is_fetched_through_the_platform_limiter(monkeypatch):
+    import app
+
+    class RecordingLimiter:
+        def __init__(self):
+            self.calls = []
+
+        def acquire(self):
+            self.calls.append('acquire')
+
+        def record(self, throttled):
+            self.calls.append(('record', throttled))
+
+    limiter = RecordingLimiter()
+    monkeypatch.setattr(app, 'get_limiter', lambda platform: platform == 'youtube' and limiter)
+    monkeypatch.setattr(tagging, 'Image', None)
+    monkeypatch.setattr(tagging.requests, 'get', lambda url, **kwargs: StreamedThumbnail(b'\xff\xd8cover'))
+    youtube = app.get_resolver('youtube')
+    resolution = app.Resolution(youtube, 'https://youtu.be/x', 'https://youtu.be/x', youtube, None)
+    info = {'thumbnails': [{'url': 'https://i.ytimg.com/vi/limited/hqdefault.jpg', 'width': 480}]}
+    assert app.fetch_job_cover(info, resolution) == ('image/jpeg', b'\xff\xd8cover')
+    assert limiter.calls == ['acquire', ('record', False)]